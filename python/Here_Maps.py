@@ -1,148 +1,149 @@
 # Importing modules
+import argparse
 import json
-import requests
-import flexpolyline as fp
-import polyline as poly
 import os
-from dotenv import load_dotenv
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
+import cpu_pool
+import http_client
+import json_codec
+from instrumentation import annotate, stage
+from loc_times import LocTimes, dumps_payload
+from rate_limiter import HERE_GEOCODE, HERE_ROUTING, TOLLGURU
+from geocode_cache import geocode_cache, normalize_address
+from here_route import parse_routes
+from route_cache import route_cache, route_cache_key
+from route_helpers import (
+    PAYMENT_METHODS,
+    TOLLGURU_TYPE_TO_CATEGORY,
+    cost_matrix_row,
+    get_transport_mode,
+    group_vehicle_types,
+    iso_to_epoch,
+    rank_routes,
+    route_loc_times,
+    route_polyline,
+    toll_cost,
+)
+from single_flight import geocode_flight, payload_key, route_flight, tollguru_flight
+from simplify import POLYLINE_SIMPLIFY_TOLERANCE, simplify_route
+from toll_cache import EXPIRED, STALE, absolute_bucket, toll_cache, toll_cache_key
+
+def load_env_file(env_path):
+    """Loads a .env file if there is one; python-dotenv is only imported when a file has to be read"""
+    if env_path.exists():
+        from dotenv import load_dotenv
+
+        load_dotenv(dotenv_path=env_path)
 
 # Load environment variables from root .env file
 # This allows sharing the same .env across javascript, python, and other folders
-env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(dotenv_path=env_path)
+load_env_file(Path(__file__).parent.parent / '.env')
 
 HERE_API_KEY = os.environ.get("HERE_API_KEY")  # API key for Here Maps
-HERE_API_URL = "https://router.hereapi.com/v8/routes"
-HERE_GEOCODE_API_URL = "https://geocode.search.hereapi.com/v1/geocode"
+HERE_API_URL = os.environ.get("HERE_API_URL", "https://router.hereapi.com/v8/routes")
+HERE_GEOCODE_API_URL = os.environ.get("HERE_GEOCODE_API_URL", "https://geocode.search.hereapi.com/v1/geocode")
 
 TOLLGURU_API_KEY = os.environ.get("TOLLGURU_API_KEY")  # API key for Tollguru
-TOLLGURU_API_URL = "https://apis.tollguru.com/toll/v2"
+TOLLGURU_API_URL = os.environ.get("TOLLGURU_API_URL", "https://apis.tollguru.com/toll/v2")
 POLYLINE_ENDPOINT = "complete-polyline-from-mapping-service"
 
-# Vehicle type mapping: Maps TollGuru vehicle types to HERE Maps transport modes
-TOLLGURU_TYPE_TO_CATEGORY = {
-    # Car / SUV / Pickup / EV / similar
-    "2AxlesAuto": "car",
-    "3AxlesAuto": "car",
-    "4AxlesAuto": "car",
-    "2AxlesDualTire": "car",
-    "3AxlesDualTire": "car",
-    "4AxlesDualTire": "car",
-    "2AxlesEV": "car",
-    "3AxlesEV": "car",
-    "4AxlesEV": "car",
-    # Rideshare/Taxi/Carpool
-    "2AxlesTNC": "car",
-    "2AxlesTNCPool": "car",
-    "2AxlesTaxi": "car",
-    "2AxlesTaxiPool": "car",
-    "Carpool2": "car",
-    "Carpool3": "car",
-    # Truck
-    "2AxlesTruck": "truck",
-    "3AxlesTruck": "truck",
-    "4AxlesTruck": "truck",
-    "5AxlesTruck": "truck",
-    "6AxlesTruck": "truck",
-    "7AxlesTruck": "truck",
-    "8AxlesTruck": "truck",
-    "9AxlesTruck": "truck",
-    # Bus
-    "2AxlesBus": "bus",
-    "3AxlesBus": "bus",
-    # RV
-    "2AxlesRv": "car",
-    "3AxlesRv": "car",
-    "4AxlesRv": "car",
-}
+# Number of alternative routes requested from HERE (0-6), every alternative is rated with TollGuru
+HERE_ROUTE_ALTERNATIVES = int(os.environ.get("HERE_ROUTE_ALTERNATIVES", 0))
+# Concurrent HERE and TollGuru requests of get_toll_matrix (one lane, many vehicle types)
+VEHICLE_FANOUT_WORKERS = int(os.environ.get("VEHICLE_FANOUT_WORKERS", 8))
 
-# From and To locations
-source = "Philadelphia, PA"
-destination = "New York, NY"
+# Default From and To locations, override them on the command line
+DEFAULT_SOURCE = "Philadelphia, PA"
+DEFAULT_DESTINATION = "New York, NY"
 
 # Vehicle type configuration
 # For vehicle types refer https://tollguru.com/toll-api-docs#vehicle-types-supported-by-tollguru
-vehicle_type = "2AxlesAuto"  # You can change this dynamically
+DEFAULT_VEHICLE_TYPE = "2AxlesAuto"
 
 # Explore https://tollguru.com/toll-api-docs to get best of all the parameter that tollguru has to offer
 # Refer https://github.com/mapup/tollguru-api-parameter-examples/tree/main/request-bodies/02-Complete-Polyline-To-Toll for more examples
+# The vehicle type is added per request by get_rates_from_tollguru
 request_parameters = {
-    "vehicle": {
-        "type": vehicle_type,
-    },
     # Note: departure_time removed - we now use locTimes generated from HERE Maps response
 }
 
-def get_transport_mode(vehicle_type):
-    """Gets the HERE Maps transport mode from TollGuru vehicle type"""
-    if not vehicle_type:
-        print("Warning: No vehicle type provided, defaulting to 'car'")
-        return "car"
-
-    transport_mode = TOLLGURU_TYPE_TO_CATEGORY.get(vehicle_type)
-
-    if not transport_mode:
-        print(f"Warning: Unknown vehicle type '{vehicle_type}', defaulting to 'car'")
-        return "car"
-
-    return transport_mode
-
-def iso_to_epoch(iso_timestamp):
-    """Converts ISO timestamp string to Unix epoch timestamp (seconds)"""
-    from datetime import datetime
-    return int(datetime.fromisoformat(iso_timestamp.replace('Z', '+00:00')).timestamp())
+# Background refreshes of stale toll cache entries that are still running
+_refresh_threads = set()
 
-def generate_loc_times(actions, departure_epoch):
+def get_geocodes_from_here_maps(address):
+    """Fetching geocodes form Here maps"""
+    with stage("geocode"):
+        # Serve repeated addresses from the local geocode cache
+        if geocode_cache is not None:
+            cached = geocode_cache.get(address)
+            if cached is not None:
+                annotate(cache_hit=True)
+                return cached
+
+        params = {"q": address, "apiKey": HERE_API_KEY}
+        # Concurrent lookups of the same address share one request
+        response_from_here = geocode_flight.do(
+            normalize_address(address),
+            lambda: json_codec.loads(http_client.get(HERE_GEOCODE_API_URL, params=params, endpoint=HERE_GEOCODE).content),
+        )
+
+        # Debug: Print the response to see what we're getting
+        if "items" not in response_from_here:
+            print(f"Geocoding API Error for '{address}':")
+            print(f"Response: {response_from_here}")
+            raise Exception(f"Geocoding failed for address: {address}")
+
+        if len(response_from_here["items"]) == 0:
+            raise Exception(f"No geocoding results found for address: {address}")
+
+        latitude, longitude = response_from_here["items"][0]["position"].values()
+        if geocode_cache is not None:
+            geocode_cache.set(address, latitude, longitude)
+        return (latitude, longitude)
+
+def get_geocodes_for_addresses(addresses, max_workers=8, executor=None):
     """
-    Generates locTimes array from HERE Maps actions
+    Geocodes a set of addresses with parallel requests, each distinct normalized address once
 
-    Args:
-        actions: Array of actions from HERE Maps response
-        departure_epoch: Departure time in Unix epoch seconds
+    Addresses already in the geocode cache are not requested again. The requests run on `executor`
+    when one is given, otherwise on a pool of `max_workers` threads.
 
     Returns:
-        locTimes array in format [[offset, timestamp], ...]
+        ({normalized address: (latitude, longitude)}, {normalized address: error message})
     """
-    loc_times = []
-    cumulative_time = departure_epoch
-
-    # Generate locTimes for each action
-    for action in actions:
-        # Add current action's offset and cumulative timestamp
-        loc_times.append([action['offset'], cumulative_time])
-        # Add duration to cumulative time for next action
-        cumulative_time += action['duration']
-
-    return loc_times
+    unique = {}
+    for address in addresses:
+        unique.setdefault(normalize_address(address), address)
 
-def get_geocodes_from_here_maps(address):
-    """Fetching geocodes form Here maps"""
-    params = {"q": address, "apiKey": HERE_API_KEY}
-    response_from_here = requests.get(HERE_GEOCODE_API_URL, params=params).json()
-
-    # Debug: Print the response to see what we're getting
-    if "items" not in response_from_here:
-        print(f"Geocoding API Error for '{address}':")
-        print(f"Response: {response_from_here}")
-        raise Exception(f"Geocoding failed for address: {address}")
-
-    if len(response_from_here["items"]) == 0:
-        raise Exception(f"No geocoding results found for address: {address}")
-
-    latitude, longitude = response_from_here["items"][0]["position"].values()
-    return (latitude, longitude)
-
-def get_polyline_from_here_maps(
-    source_latitude, source_longitude, destination_latitude, destination_longitude, vehicle_type="2AxlesAuto"
+    def geocode(address):
+        try:
+            return get_geocodes_from_here_maps(address), None
+        except Exception as e:
+            return None, str(e)
+
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return get_geocodes_for_addresses(unique.values(), executor=executor)
+
+    resolved, errors = {}, {}
+    for key, (position, error) in zip(unique, executor.map(geocode, unique.values())):
+        if error is None:
+            resolved[key] = position
+        else:
+            errors[key] = error
+    return resolved, errors
+
+def fetch_route_from_here_maps(
+    route_key, source_latitude, source_longitude, destination_latitude, destination_longitude, transport_mode,
+    alternatives=0,
 ):
-    """Fetching Polyline and Actions from Here Maps"""
-    # Get transport mode from vehicle type
-    transport_mode = get_transport_mode(vehicle_type)
-
+    """Requests routes from Here Maps and stores them in the route cache, returns them as HereRoute objects"""
     # Query Here Maps with Key and Source-Destination coordinates
     # Note: We request both polyline and actions
-    url = "{a}?transportMode={b}&origin={c},{d}&destination={e},{f}&apiKey={g}&return=polyline,actions".format(
+    url = "{a}?transportMode={b}&origin={c},{d}&destination={e},{f}&apiKey={g}&return=polyline,actions,summary".format(
         a=HERE_API_URL,
         b=transport_mode,
         c=source_latitude,
@@ -151,39 +152,168 @@ def get_polyline_from_here_maps(
         f=destination_longitude,
         g=HERE_API_KEY,
     )
-    # converting the response to json
-    response = requests.get(url).json()
-    # Extracting polyline
-    flex_polyline_here = response["routes"][0]["sections"][0][
-        "polyline"
-    ]  # heremaps provide a flexpolyline
-    polyline_from_heremaps = poly.encode(
-        fp.decode(flex_polyline_here)
-    )  # we converted that to encoded(google) polyline
-
-    # Return both polyline and full response for accessing actions and departure time
-    return polyline_from_heremaps, response
+    if alternatives:
+        url += f"&alternatives={alternatives}"
+    def fetch():
+        # converting the response to json, only the fields used below are decoded (see json_codec.loads_route)
+        response = json_codec.loads_route(http_client.get(url, endpoint=HERE_ROUTING).content)
+        if not response.get("routes"):
+            print(f"Routing API Error: {response}")
+            raise Exception("No route found between source and destination")
+        # The decoded JSON is dropped here, only the HereRoute objects are kept
+        return parse_routes(response)
+
+    # Concurrent requests for the same route share one request
+    routes = route_flight.do(route_key, fetch)
+    if route_cache is not None:
+        route_cache.set(route_key, routes)
+    return routes
+
+def get_routes_from_here_maps(
+    source_latitude, source_longitude, destination_latitude, destination_longitude,
+    vehicle_type=DEFAULT_VEHICLE_TYPE, alternatives=HERE_ROUTE_ALTERNATIVES,
+):
+    """
+    Fetches the route and up to `alternatives` alternative routes from Here Maps
+
+    All sections of a route (via points, ferries, ...) are joined into one encoded(google) polyline with
+    locTimes offset to match.
+
+    Returns:
+        (list of route dicts with polyline, loc_times, duration in seconds, length in meters and section
+        count, list of HereRoute objects)
+    """
+    # Get transport mode from vehicle type
+    transport_mode = get_transport_mode(vehicle_type)
+
+    with stage("route", transport_mode=transport_mode, alternatives=alternatives):
+        # Serve repeated origin/destination/mode combinations from the route cache
+        route_key = route_cache_key(
+            source_latitude, source_longitude, destination_latitude, destination_longitude, transport_mode, alternatives
+        )
+        cached = route_cache.get(route_key) if route_cache is not None else None
+        if cached is not None:
+            annotate(cache_hit=True)
+            here_routes = cached["routes"]
+        else:
+            here_routes = fetch_route_from_here_maps(
+                route_key, source_latitude, source_longitude, destination_latitude, destination_longitude, transport_mode,
+                alternatives,
+            )
+
+    routes = []
+    for route in here_routes:
+        if cpu_pool.should_offload(sum(len(section.polyline) for section in route.sections)):
+            # Long routes are transcoded and timed in a worker process, see cpu_pool.py
+            with stage("transcode", sections=len(route.sections), offloaded=True):
+                polyline, section_starts, loc_times = cpu_pool.prepare_route(route)
+        else:
+            with stage("transcode", sections=len(route.sections)):
+                # heremaps provide a flexpolyline per section, we convert them to one encoded(google) polyline
+                polyline, section_starts = route_polyline(route)
+            with stage("loc_times"):
+                loc_times = route_loc_times(route, section_starts)
+        routes.append(
+            {
+                "polyline": polyline,
+                "loc_times": loc_times,
+                "duration": route.duration,
+                "length": route.length,
+                "sections": len(route.sections),
+            }
+        )
+    return routes, here_routes
+
+def get_polyline_from_here_maps(
+    source_latitude, source_longitude, destination_latitude, destination_longitude, vehicle_type=DEFAULT_VEHICLE_TYPE
+):
+    """Fetching Polyline and Actions from Here Maps"""
+    routes, here_routes = get_routes_from_here_maps(
+        source_latitude, source_longitude, destination_latitude, destination_longitude, vehicle_type, alternatives=0
+    )
+    # Return the polyline and the HereRoute for accessing actions (offsets, durations) and departure time
+    return routes[0]["polyline"], here_routes[0]
 
 # Calling Tollguru API
-def get_rates_from_tollguru(polyline, loc_times=None):
+def get_rates_from_tollguru(polyline, loc_times=None, vehicle_type=DEFAULT_VEHICLE_TYPE, absolute_departure=False):
+    """
+    Returns the TollGuru costs of a polyline, served from the toll cache when possible
+
+    A stale cache entry is returned at once and refreshed in the background, and an expired entry is
+    still returned if TollGuru fails (see toll_cache.py). With `absolute_departure` the cache entry is
+    keyed by the absolute departure bucket rather than the time of week (see toll_cache_key).
+    """
+    with stage("tollguru", vehicle_type=vehicle_type):
+        if toll_cache is None:
+            return fetch_rates_from_tollguru(polyline, loc_times, vehicle_type)
+
+        departure_epoch = LocTimes.coerce(loc_times).departure if loc_times else None
+        key = toll_cache_key(polyline, vehicle_type, request_parameters, departure_epoch, absolute=absolute_departure)
+        cached = toll_cache.get(key)
+        if cached is not None and cached[1] != EXPIRED:
+            annotate(cache_hit=True, stale=cached[1] == STALE)
+            if cached[1] == STALE and toll_cache.start_refresh(key):
+                thread = threading.Thread(
+                    target=refresh_rates_from_tollguru, args=(key, polyline, loc_times, vehicle_type), daemon=True
+                )
+                _refresh_threads.add(thread)
+                thread.start()
+            return cached[0]
+
+        try:
+            costs = fetch_rates_from_tollguru(polyline, loc_times, vehicle_type)
+        except Exception as e:
+            if cached is None:
+                raise
+            print(f"Warning: TollGuru failed ({e}), using cached costs")
+            annotate(cache_hit=True, stale=True)
+            toll_cache.record_error_fallback()
+            return cached[0]
+        toll_cache.set(key, costs)
+        return costs
+
+def refresh_rates_from_tollguru(key, polyline, loc_times, vehicle_type):
+    """Re-rates a stale toll cache entry, runs on a background thread"""
+    try:
+        with stage("tollguru_refresh", vehicle_type=vehicle_type):
+            toll_cache.set(key, fetch_rates_from_tollguru(polyline, loc_times, vehicle_type))
+    except Exception as e:
+        print(f"Warning: Background TollGuru refresh failed, keeping the stale costs: {e}")
+    finally:
+        toll_cache.finish_refresh(key)
+        _refresh_threads.discard(threading.current_thread())
+
+def wait_for_refreshes(timeout=None):
+    """Waits for the background toll cache refreshes, so a batch run does not exit in the middle of them"""
+    for thread in list(_refresh_threads):
+        thread.join(timeout)
+
+def fetch_rates_from_tollguru(polyline, loc_times=None, vehicle_type=DEFAULT_VEHICLE_TYPE):
+    """Requests the costs of a polyline from TollGuru, raises on errors"""
     # Tollguru resquest parameters
     headers = {"Content-type": "application/json", "x-api-key": TOLLGURU_API_KEY}
     params = {
         **request_parameters,
         "source": "here",
         "polyline": polyline,  #  this is polyline that we fetched from the mapping service
+        "vehicle": {
+            "type": vehicle_type,
+        },
     }
 
-    # Add locTimes if provided
-    if loc_times is not None:
-        params["locTimes"] = loc_times
+    # locTimes (if provided) are serialized straight from their arrays into the body
+    body = dumps_payload(params, loc_times)
 
     # Requesting Tollguru with parameters
     url = f"{TOLLGURU_API_URL}/{POLYLINE_ENDPOINT}"
-    response = requests.post(
+    # Concurrent requests with an identical payload share one request
+    response = tollguru_flight.do(
+        payload_key(body),
+        http_client.post,
         url,
-        json=params,
+        data=body,
         headers=headers,
+        endpoint=TOLLGURU,
     )
 
     # Check HTTP status code
@@ -194,7 +324,7 @@ def get_rates_from_tollguru(polyline, loc_times=None):
 
         # Try to parse JSON response
         try:
-            response_data = response.json()
+            response_data = json_codec.loads(response.content)
             if 'code' in response_data:
                 print(f"   Error Code: {response_data['code']}")
             if 'value' in response_data:
@@ -209,7 +339,7 @@ def get_rates_from_tollguru(polyline, loc_times=None):
         # Log the payload that was sent
         print(f"\nPayload sent to TollGuru:")
         print(f"   URL: {url}")
-        print(f"   Vehicle Type: {params.get('vehicle', {}).get('type', 'N/A')}")
+        print(f"   Vehicle Type: {vehicle_type}")
         print(f"   Polyline Length: {len(polyline)} chars")
         print(f"   Number of locTimes: {len(loc_times) if loc_times else 0}")
 
@@ -220,90 +350,333 @@ def get_rates_from_tollguru(polyline, loc_times=None):
             # Redact sensitive fields
             if 'polyline' in request_body_copy:
                 request_body_copy['polyline'] = "REDACTED"
-            if 'locTimes' in request_body_copy:
+            if loc_times:
                 # Keep count but redact content
-                request_body_copy['locTimes'] = f"Array of {len(request_body_copy['locTimes'])} items (REDACTED)"
+                request_body_copy['locTimes'] = f"Array of {len(loc_times)} items (REDACTED)"
             print(f"   {json.dumps(request_body_copy, indent=2)}")
         except Exception:
             print("   (Could not safely print request body)")
 
         # Raise exception with error details
         try:
-            response_data = response.json()
+            response_data = json_codec.loads(response.content)
             error_msg = response_data.get('value', response_data.get('message', response_data.get('code', 'Unknown error')))
         except:
             error_msg = f"HTTP {response.status_code}: {response.text}"
         raise Exception(error_msg)
 
     # Parse JSON response and return costs
-    response_tollguru = response.json()
+    response_tollguru = json_codec.loads(response.content)
     return response_tollguru["route"]["costs"]
 
+def rate_routes(routes, vehicle_type=DEFAULT_VEHICLE_TYPE):
+    """
+    Rates every route from get_routes_from_here_maps with TollGuru concurrently
+
+    Returns:
+        The route dicts with the TollGuru "costs" (or an "error" message) added, ranked by toll cost and
+        then by duration
+    """
+    def rate(route):
+        try:
+            return {**route, "costs": get_rates_from_tollguru(route["polyline"], route["loc_times"], vehicle_type)}
+        except Exception as e:
+            return {**route, "error": str(e)}
+
+    if len(routes) == 1:
+        return [rate(routes[0])]
+    with ThreadPoolExecutor(max_workers=len(routes)) as executor:
+        return rank_routes(list(executor.map(rate, routes)))
 
-"""Program Starts"""
-print("=" * 60)
-print(f"Calculating tolls for route: {source} → {destination}")
-print(f"Vehicle Type: {vehicle_type}")
-print("=" * 60)
+def get_toll_matrix(source, destination, vehicle_types=None, max_workers=VEHICLE_FANOUT_WORKERS):
+    """
+    Rates one lane for many vehicle types in a single pass
 
-try:
-    # Step 1 : Provide source and destination and get geocodes from heremaps
-    print("\n[1/5] Geocoding source address...")
-    source_latitude, source_longitude = get_geocodes_from_here_maps(source)
-    print(f"  ✓ Source coordinates: {source_latitude}, {source_longitude}")
+    The addresses are geocoded once and the lane is routed once per HERE transport mode (car, truck,
+    bus), then every vehicle type is rated concurrently against the polyline and locTimes of its mode.
+
+    Args:
+        vehicle_types: TollGuru vehicle types, every type in TOLLGURU_TYPE_TO_CATEGORY by default
+        max_workers: Maximum number of concurrent HERE and TollGuru requests
 
-    print("\n[2/5] Geocoding destination address...")
+    Returns:
+        dict with "matrix" ({vehicle type: {payment method: cost}}), "costs" (full TollGuru costs per
+        vehicle type), "errors" ({vehicle type: message}) and "routes" ({transport mode: route dict})
+    """
+    vehicle_types = list(dict.fromkeys(vehicle_types or TOLLGURU_TYPE_TO_CATEGORY))
+    groups = group_vehicle_types(vehicle_types)
+    source_latitude, source_longitude = get_geocodes_from_here_maps(source)
     destination_latitude, destination_longitude = get_geocodes_from_here_maps(destination)
-    print(f"  ✓ Destination coordinates: {destination_latitude}, {destination_longitude}")
 
-    # Step 2 : Get polyline and route data for given source-destination route
-    print("\n[3/5] Fetching route from HERE Maps...")
-    polyline_from_heremaps, route_response = get_polyline_from_here_maps(
-        source_latitude, source_longitude, destination_latitude, destination_longitude, vehicle_type
+    def route_mode(mode_vehicle_types):
+        routes, _ = get_routes_from_here_maps(
+            source_latitude, source_longitude, destination_latitude, destination_longitude, mode_vehicle_types[0], 0
+        )
+        route = routes[0]
+        if POLYLINE_SIMPLIFY_TOLERANCE > 0:
+            route["polyline"], route["loc_times"], _ = simplify_route(route["polyline"], route["loc_times"])
+        return route
+
+    result = {"matrix": {}, "costs": {}, "errors": {}, "routes": {}}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        route_futures = {mode: executor.submit(route_mode, types) for mode, types in groups.items()}
+        rate_futures = {}
+        # Vehicle types of a mode are rated as soon as its route is ready
+        for mode, future in route_futures.items():
+            try:
+                route = result["routes"][mode] = future.result()
+            except Exception as e:
+                for vehicle_type in groups[mode]:
+                    result["errors"][vehicle_type] = f"Routing failed: {e}"
+                continue
+            for vehicle_type in groups[mode]:
+                rate_futures[vehicle_type] = executor.submit(
+                    get_rates_from_tollguru, route["polyline"], route["loc_times"], vehicle_type
+                )
+
+        for vehicle_type in vehicle_types:
+            if vehicle_type not in rate_futures:
+                continue
+            try:
+                costs = rate_futures[vehicle_type].result()
+            except Exception as e:
+                result["errors"][vehicle_type] = str(e)
+                continue
+            result["costs"][vehicle_type] = costs
+            result["matrix"][vehicle_type] = cost_matrix_row(costs)
+    return result
+
+def print_toll_matrix(result):
+    """Prints the vehicle type x payment method matrix of get_toll_matrix"""
+    print(f"{'Vehicle type':<16}" + "".join(f"{method:>14}" for method in PAYMENT_METHODS))
+    for vehicle_type, row in result["matrix"].items():
+        cells = "".join(f"{'-' if row[method] is None else f'${row[method]}':>14}" for method in PAYMENT_METHODS)
+        print(f"{vehicle_type:<16}{cells}")
+    for vehicle_type, error in result["errors"].items():
+        print(f"{vehicle_type:<16}  ❌ {error}")
+
+def departure_range(start, end, step):
+    """Departure epochs from start to end (both epoch seconds, end included) every step seconds"""
+    return list(range(int(start), int(end) + 1, max(int(step), 1)))
+
+def sweep_buckets(departures):
+    """
+    Groups departure epochs by absolute toll cache bucket, {bucket: [departures]} in departure order
+
+    Departures within one TOLL_CACHE_TIME_BUCKET share a rating. The same time of day in another day or
+    week is a different bucket, so a tariff that changes on a date is not hidden behind an earlier rating.
+    """
+    buckets = {}
+    for departure in sorted(set(int(departure) for departure in departures)):
+        buckets.setdefault(absolute_bucket(departure), []).append(departure)
+    return buckets
+
+def sweep_result(buckets, costs, errors, route):
+    """Builds the get_departure_sweep result from the costs or error message of every bucket"""
+    result = {"curve": [], "errors": {}, "cheapest": None, "route": route}
+    for bucket, departures in buckets.items():
+        for departure in departures:
+            if bucket in costs:
+                result["curve"].append((departure, costs[bucket]))
+            else:
+                result["errors"][departure] = errors[bucket]
+    result["curve"].sort(key=lambda point: point[0])
+    if result["curve"]:
+        result["cheapest"] = min(result["curve"], key=lambda point: toll_cost(point[1]))[0]
+    return result
+
+def get_departure_sweep(
+    source, destination, departures, vehicle_type=DEFAULT_VEHICLE_TYPE, max_workers=VEHICLE_FANOUT_WORKERS
+):
+    """
+    Rates one lane for many departure times from a single route fetch
+
+    The lane is geocoded and routed once. Its locTimes (the HERE action durations) are shifted to start
+    at every departure and rated concurrently. Departures within the same TOLL_CACHE_TIME_BUCKET share
+    one TollGuru request. The ratings are cached by their absolute departure bucket, so a sweep is never
+    served the costs of the same time of week in another week. HERE travel times are those of the
+    route's own departure, they do not change with the departure.
+
+    Args:
+        departures: Departure times in epoch seconds, e.g. from departure_range
+        max_workers: Maximum number of concurrent TollGuru requests
+
+    Returns:
+        dict with "curve" ([(departure epoch, TollGuru costs)] by departure), "errors" ({departure:
+        message}), "cheapest" (departure with the lowest toll cost, None if nothing was rated) and "route"
+    """
+    source_latitude, source_longitude = get_geocodes_from_here_maps(source)
+    destination_latitude, destination_longitude = get_geocodes_from_here_maps(destination)
+    routes, _ = get_routes_from_here_maps(
+        source_latitude, source_longitude, destination_latitude, destination_longitude, vehicle_type, 0
     )
-    print(f"  ✓ Route polyline generated")
-
-    # Step 3 : Extract actions and departure time from HERE Maps response
-    print("\n[4/5] Extracting route timing information...")
-    first_section = route_response["routes"][0]["sections"][0]
-    actions = first_section["actions"]
-    departure_time = first_section["departure"]["time"]
-
-    # Step 4 : Convert departure time to Unix epoch and generate locTimes
-    departure_epoch = iso_to_epoch(departure_time)
-    loc_times = generate_loc_times(actions, departure_epoch)
-    print(f"  ✓ Generated {len(loc_times)} locTimes entries from {len(actions)} actions")
-
-    # Step 5 : Get rates from tollguru with locTimes
-    print("\n[5/5] Calculating toll rates...")
-    rates_from_tollguru = get_rates_from_tollguru(polyline_from_heremaps, loc_times)
-
-    # Print the rates of all the available modes of payment
-    print("\n" + "=" * 60)
-    print("RESULTS")
-    print("=" * 60)
-    if rates_from_tollguru == {}:
-        print("The route doesn't have tolls")
-    else:
-        print(f"The rates are:")
-        try:
-            tag = rates_from_tollguru.get("tag")
-            if tag is not None:
-                print(f"  Tag: ${tag}")
-        except:
-            pass
-        try:
-            cash = rates_from_tollguru.get("cash")
-            if cash is not None:
-                print(f"  Cash: ${cash}")
-        except:
-            pass
-        print(f"\nFull details: {rates_from_tollguru}")
-    print("=" * 60)
+    route = routes[0]
+    if POLYLINE_SIMPLIFY_TOLERANCE > 0:
+        route["polyline"], route["loc_times"], _ = simplify_route(route["polyline"], route["loc_times"])
+    if not len(route["loc_times"]):
+        raise Exception("The route has no locTimes, TollGuru can only rate it for the current time")
+    template = route["loc_times"].shifted(-route["loc_times"].departure)
+
+    def rate(departure):
+        return get_rates_from_tollguru(
+            route["polyline"], template.shifted(departure), vehicle_type, absolute_departure=True
+        )
+
+    buckets = sweep_buckets(departures)
+
+    costs, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {bucket: executor.submit(rate, bucket_departures[0]) for bucket, bucket_departures in buckets.items()}
+        for bucket, future in futures.items():
+            try:
+                costs[bucket] = future.result()
+            except Exception as e:
+                errors[bucket] = str(e)
+    return sweep_result(buckets, costs, errors, route)
+
+def print_departure_sweep(result):
+    """Prints the cost-vs-departure-time curve of get_departure_sweep"""
+    print(f"{'Departure (UTC)':<20}" + "".join(f"{method:>14}" for method in PAYMENT_METHODS))
+    for departure, costs in result["curve"]:
+        row = cost_matrix_row(costs)
+        cells = "".join(f"{'-' if row[method] is None else f'${row[method]}':>14}" for method in PAYMENT_METHODS)
+        marker = "  ← cheapest" if departure == result["cheapest"] else ""
+        print(f"{datetime.fromtimestamp(departure, timezone.utc):%Y-%m-%d %H:%M}    {cells}{marker}")
+    for departure, error in result["errors"].items():
+        print(f"{datetime.fromtimestamp(departure, timezone.utc):%Y-%m-%d %H:%M}      ❌ {error}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Calculate tolls for a route using HERE Maps and TollGuru")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help=f"Origin address (default: {DEFAULT_SOURCE})")
+    parser.add_argument(
+        "--destination", default=DEFAULT_DESTINATION, help=f"Destination address (default: {DEFAULT_DESTINATION})"
+    )
+    parser.add_argument(
+        "--vehicle-type", default=DEFAULT_VEHICLE_TYPE, help=f"TollGuru vehicle type (default: {DEFAULT_VEHICLE_TYPE})"
+    )
+    parser.add_argument(
+        "--alternatives", type=int, default=HERE_ROUTE_ALTERNATIVES,
+        help=f"Alternative routes to request and rate, 0-6 (default: {HERE_ROUTE_ALTERNATIVES})",
+    )
+    parser.add_argument(
+        "--vehicle-types",
+        help="Comma-separated vehicle types (or 'all') to rate on the same route, prints a cost matrix",
+    )
+    parser.add_argument(
+        "--sweep", nargs=3, metavar=("START", "END", "STEP"),
+        help="Rate the route for departures from START to END (ISO 8601 times) every STEP minutes",
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Calculates and prints the tolls for one route, returns the TollGuru costs (the get_toll_matrix result with --vehicle-types)"""
+    args = parse_args(argv)
+    source, destination, vehicle_type = args.source, args.destination, args.vehicle_type
+
+    if args.vehicle_types:
+        vehicle_types = None if args.vehicle_types == "all" else args.vehicle_types.split(",")
+        print("=" * 60)
+        print(f"Calculating tolls for route: {source} → {destination}")
+        print(f"Vehicle Types: {args.vehicle_types}")
+        print("=" * 60)
+        result = get_toll_matrix(source, destination, vehicle_types)
+        print_toll_matrix(result)
+        print("=" * 60)
+        return result
+
+    if args.sweep:
+        start, end, step = args.sweep
+        departures = departure_range(iso_to_epoch(start), iso_to_epoch(end), float(step) * 60)
+        print("=" * 60)
+        print(f"Calculating tolls for route: {source} → {destination}")
+        print(f"Vehicle Type: {vehicle_type} | {len(departures)} departures from {start} to {end}")
+        print("=" * 60)
+        result = get_departure_sweep(source, destination, departures, vehicle_type)
+        print_departure_sweep(result)
+        print("=" * 60)
+        return result
 
-except Exception as e:
-    print(f"\n❌ Error: {e}")
     print("=" * 60)
-    raise
+    print(f"Calculating tolls for route: {source} → {destination}")
+    print(f"Vehicle Type: {vehicle_type}")
+    print("=" * 60)
 
-"""Program Ends"""
+    try:
+        # Step 1 : Provide source and destination and get geocodes from heremaps
+        print("\n[1/5] Geocoding source address...")
+        source_latitude, source_longitude = get_geocodes_from_here_maps(source)
+        print(f"  ✓ Source coordinates: {source_latitude}, {source_longitude}")
+
+        print("\n[2/5] Geocoding destination address...")
+        destination_latitude, destination_longitude = get_geocodes_from_here_maps(destination)
+        print(f"  ✓ Destination coordinates: {destination_latitude}, {destination_longitude}")
+
+        # Step 2 : Get polyline and route data for given source-destination route
+        print("\n[3/5] Fetching route from HERE Maps...")
+        routes, _ = get_routes_from_here_maps(
+            source_latitude, source_longitude, destination_latitude, destination_longitude, vehicle_type,
+            args.alternatives,
+        )
+        print(f"  ✓ Route polyline generated" + (f" for {len(routes)} routes" if len(routes) > 1 else ""))
+
+        # Step 3 : Sections are joined and locTimes generated from their actions and departure times
+        print("\n[4/5] Extracting route timing information...")
+        for route in routes:
+            print(f"  ✓ Generated {len(route['loc_times'])} locTimes entries from {route['sections']} section(s)")
+
+            # Optionally simplify the polyline to shrink the TollGuru request
+            if POLYLINE_SIMPLIFY_TOLERANCE > 0:
+                route["polyline"], route["loc_times"], simplify_stats = simplify_route(route["polyline"], route["loc_times"])
+                print(
+                    f"  ✓ Simplified polyline from {simplify_stats['original_vertices']} to "
+                    f"{simplify_stats['simplified_vertices']} vertices ({simplify_stats['reduction']:.0%} smaller)"
+                )
+
+        # Step 4 : Get rates from tollguru with locTimes, alternatives are rated concurrently
+        print("\n[5/5] Calculating toll rates...")
+        if len(routes) == 1:
+            rates_from_tollguru = get_rates_from_tollguru(routes[0]["polyline"], routes[0]["loc_times"], vehicle_type)
+        else:
+            ranked_routes = rate_routes(routes, vehicle_type)
+            print("  Routes ranked by toll cost and duration:")
+            for rank, route in enumerate(ranked_routes, 1):
+                duration = f"{route['duration'] / 60:.0f} min" if route["duration"] is not None else "unknown duration"
+                if "costs" in route:
+                    print(f"  {rank}. toll ${toll_cost(route['costs'])} | {duration}")
+                else:
+                    print(f"  {rank}. ❌ {route['error']} | {duration}")
+            if "costs" not in ranked_routes[0]:
+                raise Exception("None of the routes could be rated")
+            rates_from_tollguru = ranked_routes[0]["costs"]
+
+        # Print the rates of all the available modes of payment
+        print("\n" + "=" * 60)
+        print("RESULTS")
+        print("=" * 60)
+        if rates_from_tollguru == {}:
+            print("The route doesn't have tolls")
+        else:
+            print(f"The rates are:")
+            try:
+                tag = rates_from_tollguru.get("tag")
+                if tag is not None:
+                    print(f"  Tag: ${tag}")
+            except:
+                pass
+            try:
+                cash = rates_from_tollguru.get("cash")
+                if cash is not None:
+                    print(f"  Cash: ${cash}")
+            except:
+                pass
+            print(f"\nFull details: {rates_from_tollguru}")
+        print("=" * 60)
+        return rates_from_tollguru
+
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        print("=" * 60)
+        raise
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Benchmarks route preparation (transcode, join, locTimes) and simplification in threads vs the CPU pool
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cpu_pool
+from here_route import HereRoute
+from route_helpers import route_loc_times, route_polyline
+from simplify import simplify_polyline
+from Synthetic_Routes import synthetic_response
+
+# Benchmark configuration
+VERTICES = int(os.environ.get("BENCHMARK_VERTICES", 50000))  # vertices per route
+ROUTES = int(os.environ.get("BENCHMARK_ROUTES", 64))  # routes per measurement
+BENCHMARK_WORKERS = [
+    int(value) for value in os.environ.get("BENCHMARK_WORKERS", f"1,{os.cpu_count() or 1}").split(",")
+]
+# Also simplify every route with this tolerance in meters, 0 only prepares the routes
+BENCHMARK_SIMPLIFY_TOLERANCE = float(os.environ.get("BENCHMARK_SIMPLIFY_TOLERANCE", 10))
+
+def synthetic_route(vertices, seed=42):
+    """HereRoute with one section of a synthetic HERE response, an action every 100 vertices"""
+    response = synthetic_response(vertices, max(vertices // 100, 1), seed)
+    return HereRoute.from_json(response["routes"][0])
+
+def process_in_thread(route):
+    polyline, section_starts = route_polyline(route)
+    loc_times = route_loc_times(route, section_starts)
+    if BENCHMARK_SIMPLIFY_TOLERANCE > 0:
+        simplify_polyline(polyline, BENCHMARK_SIMPLIFY_TOLERANCE, loc_times.offsets)
+
+def process_in_pool(route):
+    polyline, _, loc_times = cpu_pool.prepare_route(route)
+    if BENCHMARK_SIMPLIFY_TOLERANCE > 0:
+        cpu_pool.simplify_polyline(polyline, BENCHMARK_SIMPLIFY_TOLERANCE, loc_times.offsets)
+
+def routes_per_second(function, routes, workers):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        start = time.perf_counter()
+        list(executor.map(function, routes))
+        return len(routes) / (time.perf_counter() - start)
+
+def main():
+    routes = [synthetic_route(VERTICES, seed) for seed in range(4)] * (ROUTES // 4)
+
+    print("=" * 60)
+    print(f"{len(routes)} routes of {VERTICES} vertices, {os.cpu_count()} CPUs")
+    print("=" * 60)
+    for workers in BENCHMARK_WORKERS:
+        threads = routes_per_second(process_in_thread, routes, workers)
+
+        cpu_pool.CPU_POOL_WORKERS = workers
+        routes_per_second(process_in_pool, routes[:workers], workers)  # starts the worker processes
+        pool = routes_per_second(process_in_pool, routes, workers)
+        cpu_pool.shutdown()
+
+        print(
+            f"{workers:>3} workers: threads {threads:7.1f} routes/sec | processes {pool:7.1f} routes/sec "
+            f"| {pool / threads:5.1f}x"
+        )
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Benchmarks the JSON codecs of json_codec.py on a long HERE route response and its TollGuru request body
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import json_codec
+from flex_transcode import flexpolyline_to_google
+from loc_times import LocTimes, dumps_payload
+from Synthetic_Routes import synthetic_response
+
+# Size of the synthetic route, a cross-country truck route has tens of thousands of vertices
+VERTICES = int(os.environ.get("BENCHMARK_VERTICES", 50000))
+ACTIONS = int(os.environ.get("BENCHMARK_ACTIONS", 2000))
+REPEAT = int(os.environ.get("BENCHMARK_REPEAT", 5))
+
+def best_of(function):
+    return min(timeit.repeat(function, number=1, repeat=REPEAT))
+
+response = synthetic_response(VERTICES, ACTIONS)
+content = json.dumps(response).encode()
+section = response["routes"][0]["sections"][0]
+polyline = flexpolyline_to_google(section["polyline"])
+loc_times = LocTimes.from_actions(section["actions"], 1704121200)
+params = {"source": "here", "polyline": polyline, "vehicle": {"type": "5AxlesTruck"}}
+
+# The code path before json_codec: requests' .json() and json=params with a list of lists
+baseline_decode = best_of(lambda: json.loads(content))
+baseline_encode = best_of(lambda: json.dumps({**params, "locTimes": loc_times.to_list()}).encode())
+
+print("=" * 72)
+print(f"HERE route response {len(content) / 1024:.0f} KB ({VERTICES} vertices, {ACTIONS} actions), best of {REPEAT}")
+print("=" * 72)
+print(f"{'baseline':10} decode: {baseline_decode * 1000:8.2f} ms          | encode: {baseline_encode * 1000:8.2f} ms")
+for codec in json_codec.CODECS:
+    try:
+        json_codec.set_codec(codec)
+    except ImportError as e:
+        print(f"{codec:10} skipped, {e}")
+        continue
+    decoded = json_codec.loads_route(content)["routes"][0]["sections"][0]
+    if decoded["polyline"] != section["polyline"] or len(decoded["actions"]) != ACTIONS:
+        raise Exception(f"{codec} decoded a different route")
+    if json.loads(dumps_payload(params, loc_times)) != {**params, "locTimes": loc_times.to_list()}:
+        raise Exception(f"{codec} encoded a different request body")
+
+    decode = best_of(lambda: json_codec.loads_route(content))
+    encode = best_of(lambda: dumps_payload(params, loc_times))
+    print(
+        f"{codec:10} decode: {decode * 1000:8.2f} ms {baseline_decode / decode:5.1f}x | "
+        f"encode: {encode * 1000:8.2f} ms {baseline_encode / encode:5.1f}x"
+    )
+print("=" * 72)
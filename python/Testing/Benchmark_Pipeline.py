@@ -0,0 +1,155 @@
+# End-to-end benchmark of the geocode -> route -> toll pipeline against the local mock server (Mock_Server.py)
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# The SQLite geocode and toll caches would outlive the run, they have to be disabled before the pipeline modules load
+os.environ.setdefault("GEOCODE_CACHE_ENABLED", "0")
+os.environ.setdefault("TOLL_CACHE_ENABLED", "0")
+os.environ.setdefault("HERE_API_KEY", "benchmark")
+os.environ.setdefault("TOLLGURU_API_KEY", "benchmark")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from Mock_Server import mock_environ
+
+# Benchmark configuration
+BENCHMARK_LANES = int(os.environ.get("BENCHMARK_LANES", 200))  # lanes per concurrency level
+# Lanes run before the measurements, so imports and connection setup are not counted
+BENCHMARK_WARMUP_LANES = int(os.environ.get("BENCHMARK_WARMUP_LANES", 10))
+BENCHMARK_CONCURRENCY = [int(value) for value in os.environ.get("BENCHMARK_CONCURRENCY", "1,10,50").split(",")]
+# URL of an already running mock server, by default one is started for the benchmark
+BENCHMARK_MOCK_URL = os.environ.get("BENCHMARK_MOCK_URL")
+# Write the results as JSON, e.g. to keep them as the baseline of later runs
+BENCHMARK_OUTPUT = os.environ.get("BENCHMARK_OUTPUT")
+# Results of an earlier run; the benchmark fails when lanes/sec or peak memory regress by more than
+# BENCHMARK_MAX_REGRESSION (a fraction) at any concurrency level
+BENCHMARK_BASELINE = os.environ.get("BENCHMARK_BASELINE")
+BENCHMARK_MAX_REGRESSION = float(os.environ.get("BENCHMARK_MAX_REGRESSION", 0.2))
+
+def start_mock_server_process():
+    """Runs Mock_Server.py in its own process so the server does not compete with the pipeline for the GIL"""
+    process = subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve().parent / "Mock_Server.py")],
+        env={**os.environ, "MOCK_PORT": "0"},
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    base_url = process.stdout.readline().strip()
+    if not base_url:
+        process.kill()
+        raise Exception("Mock server did not start")
+    return process, base_url
+
+def benchmark_lanes(run, count):
+    # New addresses on every level, so caches and in-flight sharing do not carry over between levels
+    return [
+        (f"Benchmark {run} origin {index}", f"Benchmark {run} destination {index}", "2AxlesAuto")
+        for index in range(count)
+    ]
+
+def run_level(run_lanes_async, instrumentation, run, concurrency):
+    """Processes BENCHMARK_LANES new lanes at one concurrency level and returns its results"""
+    lanes = benchmark_lanes(run, BENCHMARK_LANES)
+    instrumentation.reset()
+    start = time.perf_counter()
+    results = asyncio.run(run_lanes_async(lanes, concurrency=concurrency))
+    seconds = time.perf_counter() - start
+    stages = {
+        name: {"p50_ms": stats["p50"] * 1000, "p95_ms": stats["p95"] * 1000, "p99_ms": stats["p99"] * 1000}
+        for name, stats in instrumentation.summary().items()
+    }
+
+    # tracemalloc slows the pipeline down several times, so memory is measured in a separate, shorter
+    # pass that still keeps `concurrency` lanes in flight
+    tracemalloc.start()
+    asyncio.run(run_lanes_async(benchmark_lanes(f"{run} memory", min(BENCHMARK_LANES, 2 * concurrency)), concurrency))
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "concurrency": concurrency,
+        "lanes": len(lanes),
+        "errors": sum(1 for result in results if "error" in result),
+        "seconds": seconds,
+        "lanes_per_second": len(lanes) / seconds,
+        "peak_memory_mb": peak_memory / 1024 / 1024,
+        "stages": stages,
+    }
+
+def find_regressions(results, baseline):
+    """Compares results with a baseline run and returns the regressions as messages"""
+    regressions = []
+    baseline_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in results["levels"]:
+        previous = baseline_levels.get(level["concurrency"])
+        if previous is None:
+            continue
+        if level["lanes_per_second"] < previous["lanes_per_second"] * (1 - BENCHMARK_MAX_REGRESSION):
+            regressions.append(
+                f"concurrency {level['concurrency']}: {level['lanes_per_second']:.1f} lanes/sec, "
+                f"baseline {previous['lanes_per_second']:.1f}"
+            )
+        if level["peak_memory_mb"] > previous["peak_memory_mb"] * (1 + BENCHMARK_MAX_REGRESSION):
+            regressions.append(
+                f"concurrency {level['concurrency']}: {level['peak_memory_mb']:.1f} MB peak memory, "
+                f"baseline {previous['peak_memory_mb']:.1f}"
+            )
+    return regressions
+
+def main():
+    mock_process = None
+    base_url = BENCHMARK_MOCK_URL
+    if base_url is None:
+        mock_process, base_url = start_mock_server_process()
+
+    # The endpoints are read when the pipeline modules are imported, so they are set first
+    os.environ.update(mock_environ(base_url))
+    import instrumentation
+    from async_pipeline import run_lanes_async
+
+    try:
+        print("=" * 60)
+        print(f"Pipeline benchmark against {base_url}, {BENCHMARK_LANES} lanes per level")
+        print("=" * 60)
+        asyncio.run(run_lanes_async(benchmark_lanes("warmup", BENCHMARK_WARMUP_LANES)))
+        results = {"lanes": BENCHMARK_LANES, "levels": []}
+        for run, concurrency in enumerate(BENCHMARK_CONCURRENCY):
+            level = run_level(run_lanes_async, instrumentation, run, concurrency)
+            results["levels"].append(level)
+            print(
+                f"concurrency {concurrency:>4}: {level['lanes_per_second']:8.1f} lanes/sec | "
+                f"{level['seconds']:6.2f}s | {level['peak_memory_mb']:6.1f} MB peak | {level['errors']} errors"
+            )
+            for name, stage in level["stages"].items():
+                print(
+                    f"    {name:<10} p50 {stage['p50_ms']:8.1f} ms | p95 {stage['p95_ms']:8.1f} ms "
+                    f"| p99 {stage['p99_ms']:8.1f} ms"
+                )
+        print("=" * 60)
+    finally:
+        if mock_process is not None:
+            mock_process.terminate()
+            mock_process.wait()
+
+    if BENCHMARK_OUTPUT:
+        with open(BENCHMARK_OUTPUT, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to: {BENCHMARK_OUTPUT}")
+
+    if BENCHMARK_BASELINE:
+        with open(BENCHMARK_BASELINE, "r") as f:
+            regressions = find_regressions(results, json.load(f))
+        if regressions:
+            print(f"Performance regressions against {BENCHMARK_BASELINE}:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"No regressions against {BENCHMARK_BASELINE}")
+
+if __name__ == "__main__":
+    main()
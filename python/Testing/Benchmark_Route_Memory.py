@@ -0,0 +1,46 @@
+# Measures the memory a route keeps resident per lane: the parsed HERE response versus HereRoute objects
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import json_codec
+from here_route import parse_routes
+from Synthetic_Routes import synthetic_response
+
+# Size of the synthetic routes, every lane gets its own copy of the response
+VERTICES = int(os.environ.get("BENCHMARK_VERTICES", 5000))
+ACTIONS = int(os.environ.get("BENCHMARK_ACTIONS", 300))
+LANES = int(os.environ.get("BENCHMARK_LANES", 100))
+
+def retained(build, contents):
+    """Bytes still allocated after build(content) ran for every lane and its results were kept"""
+    # The first call builds the msgspec decoder, that one-time cost is not memory per lane
+    build(contents[0])
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    kept = [build(content) for content in contents]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del kept
+    return size
+
+# One body per lane, so no lane shares strings with another
+contents = [json.dumps(synthetic_response(VERTICES, ACTIONS, seed=lane)).encode() for lane in range(LANES)]
+
+# Before: the whole parsed response stayed resident (in the route cache and while the lane was rated)
+before = retained(json.loads, contents)
+# After: the decoded JSON is dropped right after the HereRoute objects are extracted
+after = retained(lambda content: parse_routes(json_codec.loads_route(content)), contents)
+
+print("=" * 72)
+print(f"HERE route response {len(contents[0]) / 1024:.0f} KB ({VERTICES} vertices, {ACTIONS} actions), {LANES} lanes")
+print("=" * 72)
+print(f"{'parsed response':16} {before / LANES / 1024:10.1f} KB per lane")
+print(f"{'HereRoute':16} {after / LANES / 1024:10.1f} KB per lane {before / after:6.1f}x smaller")
+print("=" * 72)
@@ -0,0 +1,43 @@
+# Benchmarks flex_transcode.flexpolyline_to_google against poly.encode(fp.decode(...))
+import os
+import sys
+import timeit
+from pathlib import Path
+
+import flexpolyline as fp
+import polyline as poly
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from flex_transcode import flexpolyline_to_google
+from Synthetic_Routes import random_walk
+
+# Number of vertices of the synthetic route, a cross-country truck route has tens of thousands
+VERTICES = int(os.environ.get("BENCHMARK_VERTICES", 50000))
+REPEAT = int(os.environ.get("BENCHMARK_REPEAT", 5))
+
+def best_of(function):
+    return min(timeit.repeat(function, number=1, repeat=REPEAT))
+
+points = random_walk(VERTICES, altitude=True)
+cases = [
+    ("precision 5, 2D", fp.encode([p[:2] for p in points], precision=5)),
+    ("precision 6, 2D", fp.encode([p[:2] for p in points], precision=6)),
+    ("precision 5, 3D", fp.encode(points, precision=5, third_dim=fp.ALTITUDE, third_dim_precision=1)),
+]
+
+print("=" * 60)
+print(f"Flexpolyline -> Google polyline, {VERTICES} vertices, best of {REPEAT}")
+print("=" * 60)
+for name, flex_polyline in cases:
+    two_step = poly.encode(fp.decode(flex_polyline))
+    transcoded = flexpolyline_to_google(flex_polyline)
+    if transcoded != two_step:
+        raise Exception(f"Output mismatch for {name}")
+
+    two_step_time = best_of(lambda: poly.encode(fp.decode(flex_polyline)))
+    transcoder_time = best_of(lambda: flexpolyline_to_google(flex_polyline))
+    print(
+        f"{name:16} two-step: {two_step_time * 1000:8.2f} ms | transcoder: {transcoder_time * 1000:8.2f} ms "
+        f"| {two_step_time / transcoder_time:6.1f}x | identical output"
+    )
+print("=" * 60)
@@ -0,0 +1,175 @@
+# Local stand-in for the HERE Geocoding, HERE Routing and TollGuru APIs, used for offline benchmarks
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from geocode_cache import normalize_address
+
+# Mock server configuration
+MOCK_HOST = os.environ.get("MOCK_HOST", "127.0.0.1")
+MOCK_PORT = int(os.environ.get("MOCK_PORT", 8099))  # 0 picks a free port
+# Directory with geocode.json, route.json and tollguru.json recorded from the real APIs
+MOCK_RECORDINGS_DIR = os.environ.get("MOCK_RECORDINGS_DIR", str(Path(__file__).resolve().parent / "recordings"))
+# Simulated server latency per API in milliseconds, +/- MOCK_LATENCY_JITTER_MS
+MOCK_GEOCODE_LATENCY_MS = float(os.environ.get("MOCK_GEOCODE_LATENCY_MS", 40))
+MOCK_ROUTE_LATENCY_MS = float(os.environ.get("MOCK_ROUTE_LATENCY_MS", 150))
+MOCK_TOLLGURU_LATENCY_MS = float(os.environ.get("MOCK_TOLLGURU_LATENCY_MS", 200))
+MOCK_LATENCY_JITTER_MS = float(os.environ.get("MOCK_LATENCY_JITTER_MS", 20))
+# Fraction of requests answered with MOCK_ERROR_STATUS (a 429 carries Retry-After: MOCK_RETRY_AFTER)
+MOCK_ERROR_RATE = float(os.environ.get("MOCK_ERROR_RATE", 0))
+MOCK_ERROR_STATUS = int(os.environ.get("MOCK_ERROR_STATUS", 503))
+MOCK_RETRY_AFTER = int(os.environ.get("MOCK_RETRY_AFTER", 1))
+
+GEOCODE_PATH = "/v1/geocode"
+ROUTE_PATH = "/v8/routes"
+TOLLGURU_PATH = "/toll/v2/complete-polyline-from-mapping-service"
+
+def load_recordings(directory=MOCK_RECORDINGS_DIR):
+    """Loads the recorded responses, geocodes are keyed by normalized address"""
+    directory = Path(directory)
+    with open(directory / "geocode.json", "r") as f:
+        geocodes = {normalize_address(address): response for address, response in json.load(f).items()}
+    with open(directory / "route.json", "r") as f:
+        route = json.load(f)
+    with open(directory / "tollguru.json", "r") as f:
+        tollguru = json.load(f)
+    return {"geocode": geocodes, "route": route, "tollguru": tollguru}
+
+def synthetic_geocode(address):
+    """Stable made-up position for addresses without a recording, so any input file can be replayed"""
+    digest = hashlib.sha256(normalize_address(address).encode()).digest()
+    latitude = 30 + digest[0] / 255 * 15
+    longitude = -120 + digest[1] / 255 * 45
+    return {"items": [{"title": address, "resultType": "locality", "position": {"lat": latitude, "lng": longitude}}]}
+
+def mock_environ(base_url):
+    """Environment variables that point Here_Maps.py, the test script and async_pipeline.py at a mock server"""
+    return {
+        "HERE_GEOCODE_API_URL": f"{base_url}{GEOCODE_PATH}",
+        "HERE_API_URL": f"{base_url}{ROUTE_PATH}",
+        "TOLLGURU_API_URL": f"{base_url}/toll/v2",
+    }
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Replays recorded API responses with simulated latency and injected errors
+
+    Every route request gets the recorded route with its departure time moved forward by one second
+    per request, so TollGuru payloads of different lanes differ like they do against the real APIs.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024  # the default backlog of 5 drops connections under load
+
+    def __init__(
+        self, host=MOCK_HOST, port=MOCK_PORT, recordings=None, error_rate=MOCK_ERROR_RATE,
+        latency_ms=None, jitter_ms=MOCK_LATENCY_JITTER_MS,
+    ):
+        super().__init__((host, port), MockRequestHandler)
+        self.recordings = recordings or load_recordings()
+        self.error_rate = error_rate
+        self.latency_ms = latency_ms or {
+            "geocode": MOCK_GEOCODE_LATENCY_MS,
+            "route": MOCK_ROUTE_LATENCY_MS,
+            "tollguru": MOCK_TOLLGURU_LATENCY_MS,
+        }
+        self.jitter_ms = jitter_ms
+        self.requests = {"geocode": 0, "route": 0, "tollguru": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+        section = self.recordings["route"]["routes"][0]["sections"][0]
+        self._departure = datetime.fromisoformat(section["departure"]["time"])
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environ(self):
+        return mock_environ(self.base_url)
+
+    def count(self, name):
+        with self._lock:
+            self.requests[name] += 1
+            return self.requests[name]
+
+    def route_response(self, number):
+        route = json.loads(json.dumps(self.recordings["route"]))
+        section = route["routes"][0]["sections"][0]
+        section["departure"]["time"] = (self._departure + timedelta(seconds=number)).isoformat()
+        return route
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == GEOCODE_PATH:
+            self.reply("geocode", lambda number: self.geocode(parse_qs(url.query).get("q", [""])[0]))
+        elif url.path == ROUTE_PATH:
+            self.reply("route", self.server.route_response)
+        else:
+            self.send_json(404, {"message": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if urlsplit(self.path).path == TOLLGURU_PATH:
+            self.reply("tollguru", lambda number: self.server.recordings["tollguru"])
+        else:
+            self.send_json(404, {"message": f"Unknown path {self.path}"})
+
+    def geocode(self, address):
+        return self.server.recordings["geocode"].get(normalize_address(address)) or synthetic_geocode(address)
+
+    def reply(self, name, build_response):
+        number = self.server.count(name)
+        latency = self.server.latency_ms[name] + random.uniform(-1, 1) * self.server.jitter_ms
+        time.sleep(max(latency, 0) / 1000)
+
+        if random.random() < self.server.error_rate:
+            self.server.count("errors")
+            headers = {"Retry-After": str(MOCK_RETRY_AFTER)} if MOCK_ERROR_STATUS == 429 else {}
+            self.send_json(MOCK_ERROR_STATUS, {"message": "Injected error"}, headers)
+            return
+        self.send_json(200, build_response(number))
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_mock_server(**kwargs):
+    """Starts a MockServer on a background thread and returns it, call shutdown() to stop it"""
+    server = MockServer(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    server = MockServer()
+    # The first line is read by Benchmark_Pipeline.py to find the server
+    print(server.base_url, flush=True)
+    for key, value in server.environ().items():
+        print(f"export {key}={value}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
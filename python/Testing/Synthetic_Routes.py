@@ -0,0 +1,40 @@
+# Synthetic HERE routes shared by the offline benchmarks
+import random
+
+import flexpolyline as fp
+
+def random_walk(vertices, seed=42, altitude=False):
+    """Random walk from Philadelphia with steps similar to a HERE route, (lat, lng[, altitude]) points"""
+    random.seed(seed)
+    latitude, longitude = 39.95258, -75.16522
+    points = []
+    for _ in range(vertices):
+        latitude += random.uniform(-0.0005, 0.0005)
+        longitude += random.uniform(-0.0005, 0.0008)
+        points.append((latitude, longitude, random.uniform(0, 500)) if altitude else (latitude, longitude))
+    return points
+
+def synthetic_response(vertices, actions, seed=42):
+    """HERE routing response with one section, as return=polyline,actions,summary produces it"""
+    points = random_walk(vertices, seed)
+    step = max(vertices // actions, 1)
+    section = {
+        "id": "section-0",
+        "type": "vehicle",
+        "actions": [
+            {
+                "action": "continue",
+                "duration": random.randint(5, 600),
+                "length": random.randint(50, 20000),
+                "instruction": f"Continue on I-{index % 99} toward Exit {index}. Go for {index * 0.3:.1f} mi.",
+                "offset": min(index * step, vertices - 1),
+            }
+            for index in range(actions)
+        ],
+        "departure": {"time": "2024-01-01T10:00:00-05:00", "place": {"type": "place", "location": {"lat": 39.95, "lng": -75.16}}},
+        "arrival": {"time": "2024-01-02T02:00:00-05:00", "place": {"type": "place", "location": {"lat": 40.71, "lng": -74.0}}},
+        "summary": {"duration": 57600, "length": 1520000, "baseDuration": 55000},
+        "polyline": fp.encode(points),
+        "transport": {"mode": "truck"},
+    }
+    return {"routes": [{"id": "route-0", "sections": [section]}]}
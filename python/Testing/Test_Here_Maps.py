@@ -1,327 +1,298 @@
 # Importing modules
-import json
-import requests
-import flexpolyline as fp
-import polyline as poly
 import os
-from dotenv import load_dotenv
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-# Load environment variables from root .env file
-# This allows sharing the same .env across javascript, python, and other folders
-env_path = Path(__file__).parent.parent.parent / '.env'
-load_dotenv(dotenv_path=env_path)
-
-HERE_API_KEY = os.environ.get("HERE_API_KEY")  # API key for Here Maps
-HERE_API_URL = "https://router.hereapi.com/v8/routes"
-
-TOLLGURU_API_KEY = os.environ.get("TOLLGURU_API_KEY")  # API key for Tollguru
-TOLLGURU_API_URL = "https://apis.tollguru.com/toll/v2"
-POLYLINE_ENDPOINT = "complete-polyline-from-mapping-service"
-
-# Vehicle type mapping: Maps TollGuru vehicle types to HERE Maps transport modes
-TOLLGURU_TYPE_TO_CATEGORY = {
-    # Car / SUV / Pickup / EV / similar
-    "2AxlesAuto": "car",
-    "3AxlesAuto": "car",
-    "4AxlesAuto": "car",
-    "2AxlesDualTire": "car",
-    "3AxlesDualTire": "car",
-    "4AxlesDualTire": "car",
-    "2AxlesEV": "car",
-    "3AxlesEV": "car",
-    "4AxlesEV": "car",
-    # Rideshare/Taxi/Carpool
-    "2AxlesTNC": "car",
-    "2AxlesTNCPool": "car",
-    "2AxlesTaxi": "car",
-    "2AxlesTaxiPool": "car",
-    "Carpool2": "car",
-    "Carpool3": "car",
-    # Truck
-    "2AxlesTruck": "truck",
-    "3AxlesTruck": "truck",
-    "4AxlesTruck": "truck",
-    "5AxlesTruck": "truck",
-    "6AxlesTruck": "truck",
-    "7AxlesTruck": "truck",
-    "8AxlesTruck": "truck",
-    "9AxlesTruck": "truck",
-    # Bus
-    "2AxlesBus": "bus",
-    "3AxlesBus": "bus",
-    # RV
-    "2AxlesRv": "car",
-    "3AxlesRv": "car",
-    "4AxlesRv": "car",
-}
-
-# Explore https://tollguru.com/toll-api-docs to get best of all the parameter that tollguru has to offer
-# Note: Vehicle type is read dynamically from testCases.csv for each test case
-# Note: departure_time removed - we now use locTimes generated from HERE Maps response
-request_parameters = {}
-
-def get_transport_mode(vehicle_type):
-    """Gets the HERE Maps transport mode from TollGuru vehicle type"""
-    if not vehicle_type:
-        print("Warning: No vehicle type provided, defaulting to 'car'")
-        return "car"
-
-    transport_mode = TOLLGURU_TYPE_TO_CATEGORY.get(vehicle_type)
-
-    if not transport_mode:
-        print(f"Warning: Unknown vehicle type '{vehicle_type}', defaulting to 'car'")
-        return "car"
-
-    return transport_mode
-
-def iso_to_epoch(iso_timestamp):
-    """Converts ISO timestamp string to Unix epoch timestamp (seconds)"""
-    from datetime import datetime
-    dt = datetime.fromisoformat(iso_timestamp.replace('Z', '+00:00'))
-    return int(dt.timestamp())
-
-def generate_loc_times(actions, departure_epoch):
-    """
-    Generates locTimes array from HERE Maps actions
-
-    Args:
-        actions: Array of actions from HERE Maps response
-        departure_epoch: Departure time in Unix epoch seconds
-
-    Returns:
-        locTimes array in format [[offset, timestamp], ...]
-    """
-    loc_times = []
-    cumulative_time = departure_epoch
-
-    # Generate locTimes for each action
-    for action in actions:
-        # Add current action's offset and cumulative timestamp
-        loc_times.append([action['offset'], cumulative_time])
-        # Add duration to cumulative time for next action
-        cumulative_time += action['duration']
-
-    return loc_times
-
-def get_geocodes_from_here_maps(address):
-    """Fetching geocodes form here maps"""
-    url = "https://geocode.search.hereapi.com/v1/geocode"
-    para = {"q": address, "apiKey": HERE_API_KEY}
-    response_from_here = requests.get(url, params=para).json()
-
-    # Debug: Print the response to see what we're getting
-    if "items" not in response_from_here:
-        print(f"Geocoding API Error for '{address}':")
-        print(f"Response: {response_from_here}")
-        raise Exception(f"Geocoding failed for address: {address}")
-
-    if len(response_from_here["items"]) == 0:
-        raise Exception(f"No geocoding results found for address: {address}")
-
-    latitude, longitude = response_from_here["items"][0]["position"].values()
-    return (latitude, longitude)
-
-def get_polyline_from_here_maps(
-    source_latitude, source_longitude, destination_latitude, destination_longitude, vehicle_type="2AxlesAuto"
-):
-    """Fetching Polyline, Actions, and route data from Here Maps"""
-    # Get transport mode from vehicle type
-    transport_mode = get_transport_mode(vehicle_type)
-
-    # Query Here Maps with Key and Source-Destination coordinates
-    # Note: We request both polyline and actions
-    url = "{a}?transportMode={b}&origin={c},{d}&destination={e},{f}&apiKey={g}&return=polyline,actions".format(
-        a=HERE_API_URL,
-        b=transport_mode,
-        c=source_latitude,
-        d=source_longitude,
-        e=destination_latitude,
-        f=destination_longitude,
-        g=HERE_API_KEY,
+# Shared helpers live in the parent python folder
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import circuit_breaker
+import cpu_pool
+import hedging
+import http_client
+import instrumentation
+import rate_limiter
+from Here_Maps import (
+    DEFAULT_VEHICLE_TYPE,
+    get_geocodes_for_addresses,
+    get_geocodes_from_here_maps,
+    get_rates_from_tollguru,
+    get_routes_from_here_maps,
+    wait_for_refreshes,
+)
+from batch_io import ResultWriter, read_checkpoint, read_rows
+from geocode_cache import geocode_cache, normalize_address
+from route_cache import route_cache
+from single_flight import geocode_flight, route_flight, tollguru_flight
+from simplify import POLYLINE_SIMPLIFY_TOLERANCE, POLYLINE_SIMPLIFY_VALIDATE, simplify_route
+from toll_cache import toll_cache
+
+# Batch configuration
+# Number of test cases processed concurrently, and the maximum number of in-flight requests per API
+MAX_WORKERS = int(os.environ.get("TEST_MAX_WORKERS", 8))
+GEOCODE_CONCURRENCY = int(os.environ.get("TEST_GEOCODE_CONCURRENCY", MAX_WORKERS))
+ROUTING_CONCURRENCY = int(os.environ.get("TEST_ROUTING_CONCURRENCY", MAX_WORKERS))
+TOLLGURU_CONCURRENCY = int(os.environ.get("TEST_TOLLGURU_CONCURRENCY", MAX_WORKERS))
+
+geocode_slots = threading.BoundedSemaphore(GEOCODE_CONCURRENCY)
+routing_slots = threading.BoundedSemaphore(ROUTING_CONCURRENCY)
+tollguru_slots = threading.BoundedSemaphore(TOLLGURU_CONCURRENCY)
+
+# Streaming input/output configuration
+INPUT_FILE = os.environ.get("TEST_INPUT_FILE", "testCases.csv")
+OUTPUT_FORMAT = os.environ.get("TEST_OUTPUT_FORMAT", "csv")  # csv, jsonl or parquet
+OUTPUT_FILE = os.environ.get("TEST_OUTPUT_FILE", f"testCases_result.{OUTPUT_FORMAT}")
+FLUSH_EVERY = int(os.environ.get("TEST_FLUSH_EVERY", 100))  # rows between flush/fsync and checkpoint
+CHECKPOINT_FILE = os.environ.get("TEST_CHECKPOINT_FILE", f"{OUTPUT_FILE}.checkpoint")
+RESUME = os.environ.get("TEST_RESUME", "1") != "0"
+# Rows submitted ahead of the row being written, bounds memory regardless of the input size
+MAX_IN_FLIGHT = int(os.environ.get("TEST_MAX_IN_FLIGHT", MAX_WORKERS * 4))
+# Geocode every distinct address of the input before routing starts (holds one entry per distinct address)
+GEOCODE_PREPASS = os.environ.get("TEST_GEOCODE_PREPASS", "1") != "0"
+
+# Positions resolved by the geocoding pre-pass, keyed by normalized address
+geocode_table = {}
+
+# Polyline simplification totals, reported at the end of the run
+simplify_totals = {"test_cases": 0, "original_chars": 0, "simplified_chars": 0, "validated": 0, "cost_matches": 0}
+simplify_totals_lock = threading.Lock()
+
+def geocode(address):
+    """Looks the address up in the pre-pass table, geocodes it if the pre-pass did not resolve it"""
+    position = geocode_table.get(normalize_address(address))
+    if position is not None:
+        return position
+    with geocode_slots:
+        return get_geocodes_from_here_maps(address)
+
+def geocode_prepass(skip_rows):
+    """Resolves every distinct address of INPUT_FILE (after the first skip_rows rows) into geocode_table"""
+    start = time.time()
+    addresses = set()
+    rows = 0
+    for count, row in read_rows(INPUT_FILE):
+        if count <= skip_rows:
+            continue
+        rows += 1
+        addresses.update(row[1:3])
+    hits = geocode_cache.hits if geocode_cache is not None else 0
+    resolved, errors = get_geocodes_for_addresses(addresses, GEOCODE_CONCURRENCY)
+    cached = geocode_cache.hits - hits if geocode_cache is not None else 0
+    geocode_table.update(resolved)
+    print(
+        f"Geocoding pre-pass: {len(resolved) + len(errors)} distinct addresses in {rows} test cases, "
+        f"{cached} already cached, {len(errors)} failed, {time.time() - start:.2f}s"
     )
-    # converting the response to json
-    response = requests.get(url).json()
-    # Extracting polyline
-    flex_polyline_here = response["routes"][0]["sections"][0][
-        "polyline"
-    ]  # heremaps provide a flexpolyline
-    decoded_polyline = fp.decode(flex_polyline_here)
-    polyline_from_heremaps = poly.encode(decoded_polyline)  # we converted that to encoded(google) polyline
-
-    # Return polyline and full response for actions and time extraction
-    return polyline_from_heremaps, response
-
-"""Calling Tollguru API"""
-def get_rates_from_tollguru(polyline, loc_times=None, vehicle_type="2AxlesAuto"):
-    # Tollguru resquest parameters
-    headers = {"Content-type": "application/json", "x-api-key": TOLLGURU_API_KEY}
-    params = {
-        **request_parameters,
-        "source": "here",
-        "polyline": polyline,  #  this is polyline that we fetched from the mapping service
-        "vehicle": {
-            "type": vehicle_type,
-        },
-    }
 
-    # Add locTimes if provided
-    if loc_times:
-        params["locTimes"] = loc_times
-
-    # Requesting Tollguru with parameters
-    response = requests.post(
-        f"{TOLLGURU_API_URL}/{POLYLINE_ENDPOINT}",
-        json=params,
-        headers=headers,
-    )
+def run_test_case(count, i):
+    """Runs geocode -> route -> toll for one CSV row and appends the result columns to it"""
+    print(f"\n[Test {count}] {i[1]} → {i[2]}")
+
+    polyline = None
+    loc_times = None
+    simplify_stats = None
+    try:
+        # Get vehicle type from CSV (index 4), default to DEFAULT_VEHICLE_TYPE if not provided
+        vehicle_type = i[4] if len(i) > 4 and i[4] else DEFAULT_VEHICLE_TYPE
+
+        source_latitude, source_longitude = geocode(i[1])
+        destination_latitude, destination_longitude = geocode(i[2])
+
+        # Get polyline and locTimes of the route, all sections joined
+        with routing_slots:
+            routes, _ = get_routes_from_here_maps(
+                source_latitude,
+                source_longitude,
+                destination_latitude,
+                destination_longitude,
+                vehicle_type,
+                alternatives=0,
+            )
+        polyline, loc_times = routes[0]["polyline"], routes[0]["loc_times"]
+
+        # Optionally simplify the polyline to shrink the TollGuru request
+        if POLYLINE_SIMPLIFY_TOLERANCE > 0:
+            full_polyline, full_loc_times = polyline, loc_times
+            polyline, loc_times, simplify_stats = simplify_route(polyline, loc_times)
+            print(
+                f"  [Test {count}] Simplified polyline: {simplify_stats['original_vertices']} → "
+                f"{simplify_stats['simplified_vertices']} vertices, {simplify_stats['reduction']:.0%} smaller"
+            )
 
-    # Check HTTP status code
-    if response.status_code != 200:
-        # Log the error details
-        print(f"\n  ❌ TollGuru API Error:")
-        print(f"     Status Code: {response.status_code}")
+        i.append(polyline)
+    except Exception as e:
+        print(f"  ❌ [Test {count}] Routing Error: {e}")
+        i.append("Routing Error")
+        loc_times = None
 
-        # Try to parse JSON response
+    with tollguru_slots:
+        start = time.time()
         try:
-            response_data = response.json()
-            if 'code' in response_data:
-                print(f"     Error Code: {response_data['code']}")
-            if 'value' in response_data:
-                print(f"     Error Message: {response_data['value']}")
-            if 'message' in response_data:
-                print(f"     Message: {response_data['message']}")
-            print(f"\n     Full Response Body:")
-            print(f"     {json.dumps(response_data, indent=2)}")
-        except:
-            print(f"     Raw Response: {response.text}")
-
-        # Log the payload that was sent
-        print(f"\n  Payload sent to TollGuru:")
-        print(f"     URL: {TOLLGURU_API_URL}/{POLYLINE_ENDPOINT}")
-        print(f"     Vehicle Type: {vehicle_type}")
-        print(f"     Polyline Length: {len(polyline)} chars")
-        print(f"     Number of locTimes: {len(loc_times) if loc_times else 0}")
-
-        # Print full request body for debugging
-        print(f"\n     Full Request Body:")
-        request_body_copy = params.copy()
+            if polyline is None:
+                raise Exception("No polyline available for this test case")
+            # Pass locTimes and vehicle_type to Tollguru API
+            rates = get_rates_from_tollguru(polyline, loc_times, vehicle_type)
+        except Exception as e:
+            i.append(False)
+            rates = {}
+        time_taken = time.time() - start
+
+    if rates == {}:
+        i.append((None, None))
+    else:
         try:
-            # Redact sensitive fields
-            if 'polyline' in request_body_copy:
-                request_body_copy['polyline'] = "REDACTED"
-            if 'locTimes' in request_body_copy:
-                # Keep count but redact content
-                request_body_copy['locTimes'] = f"Array of {len(request_body_copy['locTimes'])} items (REDACTED)"
-            print(f"     {json.dumps(request_body_copy, indent=2)}")
-        except Exception:
-            print("     (Could not safely print request body)")
-
-        # Raise exception with error details
+            tag = rates["tag"]
+        except:
+            tag = None
         try:
-            response_data = response.json()
-            error_msg = response_data.get('value', response_data.get('message', response_data.get('code', 'Unknown error')))
+            cash = rates["cash"]
         except:
-            error_msg = f"HTTP {response.status_code}: {response.text}"
-        raise Exception(error_msg)
-
-    # Return costs from successful response
-    response_data = response.json()
-    return response_data["route"]["costs"]
+            cash = None
+        i.extend((tag, cash))
+        print(f"  ✓ [Test {count}] Tag: ${tag if tag else 'N/A'} | Cash: ${cash if cash else 'N/A'} | {time_taken:.2f}s")
+    i.append(time_taken)
 
-"""Testing"""
-# Importing Functions
-from csv import reader, writer
-import time
-
-print("=" * 60)
-print("Starting toll calculation tests...")
-print("=" * 60)
-
-temp_list = []
-with open("testCases.csv", "r") as f:
-    csv_reader = reader(f)
-    for count, i in enumerate(csv_reader):
-        # if count>2:
-        # break
-        if count == 0:
-            i.extend(
-                (
-                    "Input_polyline",
-                    "Tollguru_Tag_Cost",
-                    "Tollguru_Cash_Cost",
-                    "Tollguru_QueryTime_In_Sec",
-                )
+    # Validation mode: rate the full polyline too and compare the costs
+    if POLYLINE_SIMPLIFY_VALIDATE and simplify_stats is not None and rates != {}:
+        try:
+            with tollguru_slots:
+                full_rates = get_rates_from_tollguru(full_polyline, full_loc_times, vehicle_type)
+            simplify_stats["cost_matches"] = (
+                full_rates.get("tag") == rates.get("tag") and full_rates.get("cash") == rates.get("cash")
             )
-        else:
-            print(f"\n[Test {count}] {i[1]} → {i[2]}")
-
-            try:
-                # Get vehicle type from CSV (index 4), default to 2AxlesAuto if not provided
-                vehicle_type = i[4] if len(i) > 4 and i[4] else "2AxlesAuto"
-
-                source_latitude, source_longitude = get_geocodes_from_here_maps(i[1])
-                (
-                    destination_latitude,
-                    destination_longitude,
-                ) = get_geocodes_from_here_maps(i[2])
-
-                # Get polyline and HERE response
-                polyline, here_response = get_polyline_from_here_maps(
-                    source_latitude,
-                    source_longitude,
-                    destination_latitude,
-                    destination_longitude,
-                    vehicle_type,
+            if not simplify_stats["cost_matches"]:
+                print(
+                    f"  ⚠ [Test {count}] Simplification changed costs: full tag/cash "
+                    f"{full_rates.get('tag')}/{full_rates.get('cash')}, simplified {rates.get('tag')}/{rates.get('cash')}"
                 )
+        except Exception as e:
+            print(f"  ❌ [Test {count}] Validation Error: {e}")
+    if simplify_stats is not None:
+        with simplify_totals_lock:
+            simplify_totals["test_cases"] += 1
+            simplify_totals["original_chars"] += simplify_stats["original_chars"]
+            simplify_totals["simplified_chars"] += simplify_stats["simplified_chars"]
+            if "cost_matches" in simplify_stats:
+                simplify_totals["validated"] += 1
+                simplify_totals["cost_matches"] += simplify_stats["cost_matches"]
+    return i
+
+def main():
+    """Runs every test case of INPUT_FILE and writes the results to OUTPUT_FILE"""
+    print("=" * 60)
+    print("Starting toll calculation tests...")
+    print(f"Workers: {MAX_WORKERS} | Geocode: {GEOCODE_CONCURRENCY} | Routing: {ROUTING_CONCURRENCY} | TollGuru: {TOLLGURU_CONCURRENCY}")
+    if cpu_pool.CPU_POOL_WORKERS:
+        print(f"CPU pool: {cpu_pool.CPU_POOL_WORKERS} processes for polylines over {cpu_pool.CPU_POOL_MIN_CHARS} chars")
+    print("=" * 60)
+
+    rows = read_rows(INPUT_FILE)
+    _, header = next(rows)
+    header.extend(
+        (
+            "Input_polyline",
+            "Tollguru_Tag_Cost",
+            "Tollguru_Cash_Cost",
+            "Tollguru_QueryTime_In_Sec",
+        )
+    )
 
-                # Extract actions and departure time from HERE Maps response
-                first_section = here_response["routes"][0]["sections"][0]
-                actions = first_section["actions"]
-                departure_time = first_section["departure"]["time"]
-
-                # Convert departure time to Unix epoch and generate locTimes
-                departure_epoch = iso_to_epoch(departure_time)
-                loc_times = generate_loc_times(actions, departure_epoch)
-
-                i.append(polyline)
-            except Exception as e:
-                print(f"  ❌ Routing Error: {e}")
-                i.append("Routing Error")
-                loc_times = None
-
-            start = time.time()
-            try:
-                # Pass locTimes and vehicle_type to Tollguru API
-                rates = get_rates_from_tollguru(polyline, loc_times, vehicle_type)
-            except Exception as e:
-                i.append(False)
-                rates = {}
-            time_taken = time.time() - start
-
-            if rates == {}:
-                i.append((None, None))
-            else:
-                try:
-                    tag = rates["tag"]
-                except:
-                    tag = None
-                try:
-                    cash = rates["cash"]
-                except:
-                    cash = None
-                i.extend((tag, cash))
-                print(f"  ✓ Tag: ${tag if tag else 'N/A'} | Cash: ${cash if cash else 'N/A'} | {time_taken:.2f}s")
-            i.append(time_taken)
-        # print(f"{len(i)}   {i}\n")
-        temp_list.append(i)
-
-with open("testCases_result.csv", "w") as f:
-    writer(f).writerows(temp_list)
-
-print("\n" + "=" * 60)
-print(f"Testing complete! Processed {len(temp_list) - 1} test cases.")
-print(f"Results saved to: testCases_result.csv")
-print("=" * 60)
-
-"""Testing Ends"""
+    # Continue after the last checkpointed row if a previous run did not finish
+    checkpoint = read_checkpoint(CHECKPOINT_FILE) if RESUME and OUTPUT_FORMAT != "parquet" else None
+    result_writer = ResultWriter(OUTPUT_FILE, header, OUTPUT_FORMAT, FLUSH_EVERY, CHECKPOINT_FILE, checkpoint)
+    # The writer discards a checkpoint whose output file is missing or too short, then nothing is skipped
+    skip_rows = result_writer.rows_written
+    if skip_rows:
+        print(f"Resuming from checkpoint: skipping {skip_rows} test cases already in {OUTPUT_FILE}")
+    if GEOCODE_PREPASS:
+        geocode_prepass(skip_rows)
+
+    # Rows are read lazily and written as soon as they are done, in input order.
+    # At most MAX_IN_FLIGHT rows are held in memory at any time.
+    processed = 0
+    completed = False
+    batch_start = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            in_flight = deque()
+            for count, row in rows:
+                if count <= skip_rows:
+                    continue
+                in_flight.append(executor.submit(run_test_case, count, row))
+                if len(in_flight) >= MAX_IN_FLIGHT:
+                    result_writer.write(in_flight.popleft().result())
+                    processed += 1
+            while in_flight:
+                result_writer.write(in_flight.popleft().result())
+                processed += 1
+        completed = True
+    finally:
+        result_writer.close(completed)
+        wait_for_refreshes()
+        http_client.close_sessions()
+        hedging.shutdown()
+        cpu_pool.shutdown()
+    batch_time = time.time() - batch_start
+
+    print("\n" + "=" * 60)
+    print(f"Testing complete! Processed {processed} test cases in {batch_time:.2f}s.")
+    print(f"Results saved to: {OUTPUT_FILE}")
+    if geocode_cache is not None:
+        stats = geocode_cache.stats()
+        print(f"Geocode cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+    if route_cache is not None:
+        stats = route_cache.stats()
+        print(f"Route cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+    if toll_cache is not None:
+        stats = toll_cache.stats()
+        print(
+            f"TollGuru cache: {stats['hits'] + stats['stale_hits']} hits ({stats['stale_hits']} stale), "
+            f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+            f"{stats['error_fallbacks']} served after TollGuru errors"
+        )
+    if simplify_totals["test_cases"]:
+        original_chars = simplify_totals["original_chars"]
+        simplified_chars = simplify_totals["simplified_chars"]
+        print(
+            f"Polyline simplification ({POLYLINE_SIMPLIFY_TOLERANCE:g} m): {original_chars} → {simplified_chars} chars "
+            f"({1 - simplified_chars / original_chars:.0%} smaller)"
+        )
+        if simplify_totals["validated"]:
+            print(
+                f"Simplification validation: {simplify_totals['cost_matches']}/{simplify_totals['validated']} "
+                f"test cases with unchanged costs"
+            )
+    for name, flight in (("geocode", geocode_flight), ("route", route_flight), ("tollguru", tollguru_flight)):
+        stats = flight.stats()
+        if stats["shared"]:
+            print(f"Single-flight {name}: {stats['shared']} requests shared an in-flight call, {stats['executed']} sent")
+    for endpoint, limiter in rate_limiter.limiters.items():
+        stats = limiter.stats()
+        if stats["throttled"] or stats["penalties"]:
+            print(
+                f"Rate limiter {endpoint}: {stats['throttled']}/{stats['acquired']} requests throttled, "
+                f"{stats['throttled_seconds']:.2f}s waiting, {stats['penalties']} Retry-After pauses"
+            )
+    for endpoint, breaker in circuit_breaker.breakers.items():
+        stats = breaker.stats()
+        if stats["opened"] or stats["rejected"]:
+            print(
+                f"Circuit breaker {endpoint}: opened {stats['opened']} times, {stats['rejected']} requests failed fast, "
+                f"now {stats['state']}"
+            )
+    for endpoint, hedger in hedging.hedgers.items():
+        stats = hedger.stats()
+        print(
+            f"Hedging {endpoint}: {stats['hedged']}/{stats['requests']} requests hedged, {stats['hedge_wins']} won by "
+            f"the duplicate, delay {stats['delay'] * 1000:.0f} ms"
+        )
+    if instrumentation.INSTRUMENTATION_ENABLED:
+        print("\nPer-stage latency:")
+        instrumentation.print_summary()
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,513 @@
+# Importing modules
+import asyncio
+import os
+import time
+
+import cpu_pool
+import Here_Maps
+import json_codec
+from circuit_breaker import get_breaker
+from Here_Maps import (
+    DEFAULT_VEHICLE_TYPE,
+    HERE_API_KEY,
+    HERE_ROUTE_ALTERNATIVES,
+    HERE_API_URL,
+    HERE_GEOCODE_API_URL,
+    POLYLINE_ENDPOINT,
+    TOLLGURU_API_KEY,
+    TOLLGURU_API_URL,
+    sweep_buckets,
+    sweep_result,
+)
+from geocode_cache import geocode_cache, normalize_address
+from hedging import get_hedger
+from here_route import parse_routes
+from http_client import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_POOL_SIZE,
+    HTTP_READ_TIMEOUT,
+    RETRY_STATUS_CODES,
+    backoff_delay,
+    endpoint_timeout,
+    parse_retry_after,
+)
+from instrumentation import annotate, increment, stage
+from loc_times import LocTimes, dumps_payload
+from rate_limiter import HERE_GEOCODE, HERE_ROUTING, TOLLGURU, get_limiter
+from route_cache import route_cache, route_cache_key
+from route_helpers import (
+    TOLLGURU_TYPE_TO_CATEGORY,
+    cost_matrix_row,
+    get_transport_mode,
+    group_vehicle_types,
+    rank_routes,
+    route_loc_times,
+    route_polyline,
+)
+from single_flight import geocode_flight, payload_key, route_flight, tollguru_flight
+from simplify import POLYLINE_SIMPLIFY_TOLERANCE, simplify_route
+from toll_cache import EXPIRED, STALE, toll_cache, toll_cache_key
+
+# Maximum number of lanes processed at the same time by run_lanes_async
+ASYNC_MAX_CONCURRENCY = int(os.environ.get("ASYNC_MAX_CONCURRENCY", 50))
+
+# Background refreshes of stale toll cache entries that are still running
+_refresh_tasks = set()
+
+def create_async_client(pool_size=HTTP_POOL_SIZE):
+    """
+    Creates the httpx.AsyncClient shared by all async calls
+
+    httpx is an optional dependency, it is only needed for this module (pip install httpx)
+    """
+    try:
+        import httpx
+    except ImportError:
+        raise ImportError("async_pipeline requires httpx, install it with: pip install httpx")
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+async def request_async(client, method, url, endpoint=None, max_retries=HTTP_MAX_RETRIES, **kwargs):
+    """
+    Async counterpart of http_client.request, retrying 429/5xx and transport errors with backoff
+
+    Uses the same per-endpoint timeouts, circuit breakers and hedgers as http_client.request.
+    """
+    import httpx
+
+    connect_timeout, read_timeout = endpoint_timeout(endpoint)
+    kwargs.setdefault("timeout", httpx.Timeout(read_timeout, connect=connect_timeout))
+    limiter = get_limiter(endpoint)
+    breaker = get_breaker(endpoint)
+    hedger = get_hedger(endpoint) if method == "GET" else None
+
+    def send():
+        return client.request(method, url, **kwargs)
+
+    attempt = 0
+    while True:
+        probe = breaker.before_request() if breaker is not None else False
+        if limiter is not None:
+            await limiter.acquire_async()
+        try:
+            if hedger is not None:
+                response = await hedger.call_async(send, limiter and limiter.acquire_async)
+            else:
+                response = await send()
+        except httpx.TransportError:
+            if breaker is not None:
+                breaker.record(False, probe)
+            if attempt >= max_retries:
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+            attempt += 1
+            increment("retries")
+            continue
+        except BaseException:
+            # Includes cancellation, so a cancelled probe does not leave the breaker half open
+            if breaker is not None:
+                breaker.record(False, probe)
+            raise
+        if breaker is not None:
+            breaker.record(response.status_code < 500, probe)
+
+        increment("bytes_sent", len(response.request.content))
+        increment("bytes_received", len(response.content))
+
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+            return response
+
+        retry_after = parse_retry_after(response)
+        if limiter is not None and response.status_code == 429 and retry_after is not None:
+            limiter.penalize(backoff_delay(attempt, retry_after))
+        else:
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+        attempt += 1
+        increment("retries")
+
+async def get_geocodes_from_here_maps_async(client, address):
+    """Fetching geocodes form Here maps"""
+    with stage("geocode"):
+        # Serve repeated addresses from the local geocode cache, its SQLite tier is read off the event loop
+        if geocode_cache is not None:
+            cached = await asyncio.to_thread(geocode_cache.get, address)
+            if cached is not None:
+                annotate(cache_hit=True)
+                return cached
+
+        async def fetch():
+            params = {"q": address, "apiKey": HERE_API_KEY}
+            response = await request_async(client, "GET", HERE_GEOCODE_API_URL, endpoint=HERE_GEOCODE, params=params)
+            return json_codec.loads(response.content)
+
+        # Concurrent lookups of the same address share one request
+        response_from_here = await geocode_flight.do_async(normalize_address(address), fetch)
+
+        if "items" not in response_from_here:
+            print(f"Geocoding API Error for '{address}':")
+            print(f"Response: {response_from_here}")
+            raise Exception(f"Geocoding failed for address: {address}")
+
+        if len(response_from_here["items"]) == 0:
+            raise Exception(f"No geocoding results found for address: {address}")
+
+        latitude, longitude = response_from_here["items"][0]["position"].values()
+        if geocode_cache is not None:
+            await asyncio.to_thread(geocode_cache.set, address, latitude, longitude)
+        return (latitude, longitude)
+
+async def get_routes_from_here_maps_async(
+    client, source_latitude, source_longitude, destination_latitude, destination_longitude,
+    vehicle_type=DEFAULT_VEHICLE_TYPE, alternatives=HERE_ROUTE_ALTERNATIVES,
+):
+    """Async counterpart of Here_Maps.get_routes_from_here_maps, returns (route dicts, HereRoute objects)"""
+    transport_mode = get_transport_mode(vehicle_type)
+
+    with stage("route", transport_mode=transport_mode, alternatives=alternatives):
+        # Serve repeated origin/destination/mode combinations from the route cache
+        route_key = route_cache_key(
+            source_latitude, source_longitude, destination_latitude, destination_longitude, transport_mode, alternatives
+        )
+        cached = route_cache.get(route_key) if route_cache is not None else None
+        if cached is not None:
+            annotate(cache_hit=True)
+            here_routes = cached["routes"]
+        else:
+            params = {
+                "transportMode": transport_mode,
+                "origin": f"{source_latitude},{source_longitude}",
+                "destination": f"{destination_latitude},{destination_longitude}",
+                "apiKey": HERE_API_KEY,
+                "return": "polyline,actions,summary",
+            }
+            if alternatives:
+                params["alternatives"] = alternatives
+
+            async def fetch():
+                response = await request_async(client, "GET", HERE_API_URL, endpoint=HERE_ROUTING, params=params)
+                response = json_codec.loads_route(response.content)
+                if not response.get("routes"):
+                    print(f"Routing API Error: {response}")
+                    raise Exception("No route found between source and destination")
+                # The decoded JSON is dropped here, only the HereRoute objects are kept
+                return parse_routes(response)
+
+            # Concurrent requests for the same route share one request
+            here_routes = await route_flight.do_async(route_key, fetch)
+            if route_cache is not None:
+                route_cache.set(route_key, here_routes)
+
+    routes = []
+    for route in here_routes:
+        if cpu_pool.should_offload(sum(len(section.polyline) for section in route.sections)):
+            with stage("transcode", sections=len(route.sections), offloaded=True):
+                polyline, section_starts, loc_times = await cpu_pool.prepare_route_async(route)
+        else:
+            with stage("transcode", sections=len(route.sections)):
+                polyline, section_starts = route_polyline(route)
+            with stage("loc_times"):
+                loc_times = route_loc_times(route, section_starts)
+        routes.append(
+            {
+                "polyline": polyline,
+                "loc_times": loc_times,
+                "duration": route.duration,
+                "length": route.length,
+                "sections": len(route.sections),
+            }
+        )
+    return routes, here_routes
+
+async def get_polyline_from_here_maps_async(
+    client, source_latitude, source_longitude, destination_latitude, destination_longitude, vehicle_type=DEFAULT_VEHICLE_TYPE
+):
+    """Fetching Polyline and Actions from Here Maps"""
+    routes, here_routes = await get_routes_from_here_maps_async(
+        client, source_latitude, source_longitude, destination_latitude, destination_longitude, vehicle_type, 0
+    )
+    return routes[0]["polyline"], here_routes[0]
+
+async def get_rates_from_tollguru_async(
+    client, polyline, loc_times=None, vehicle_type=DEFAULT_VEHICLE_TYPE, request_parameters=None, absolute_departure=False
+):
+    """
+    Async counterpart of Here_Maps.get_rates_from_tollguru, served from the toll cache when possible
+
+    `request_parameters` defaults to Here_Maps.request_parameters, so both pipelines send the same
+    request and share toll cache entries.
+    """
+    if request_parameters is None:
+        request_parameters = Here_Maps.request_parameters
+    with stage("tollguru", vehicle_type=vehicle_type):
+        if toll_cache is None:
+            return await fetch_rates_from_tollguru_async(client, polyline, loc_times, vehicle_type, request_parameters)
+
+        departure_epoch = LocTimes.coerce(loc_times).departure if loc_times else None
+        key = toll_cache_key(polyline, vehicle_type, request_parameters, departure_epoch, absolute=absolute_departure)
+        # The toll cache commits to SQLite, so it is used from a thread and the event loop keeps running
+        cached = await asyncio.to_thread(toll_cache.get, key)
+        if cached is not None and cached[1] != EXPIRED:
+            annotate(cache_hit=True, stale=cached[1] == STALE)
+            if cached[1] == STALE and toll_cache.start_refresh(key):
+                task = asyncio.create_task(
+                    refresh_rates_from_tollguru_async(client, key, polyline, loc_times, vehicle_type, request_parameters)
+                )
+                # The event loop only keeps weak references to tasks
+                _refresh_tasks.add(task)
+                task.add_done_callback(_refresh_tasks.discard)
+            return cached[0]
+
+        try:
+            costs = await fetch_rates_from_tollguru_async(client, polyline, loc_times, vehicle_type, request_parameters)
+        except Exception as e:
+            if cached is None:
+                raise
+            print(f"Warning: TollGuru failed ({e}), using cached costs")
+            annotate(cache_hit=True, stale=True)
+            toll_cache.record_error_fallback()
+            return cached[0]
+        await asyncio.to_thread(toll_cache.set, key, costs)
+        return costs
+
+async def refresh_rates_from_tollguru_async(client, key, polyline, loc_times, vehicle_type, request_parameters=None):
+    """Re-rates a stale toll cache entry in a background task"""
+    try:
+        with stage("tollguru_refresh", vehicle_type=vehicle_type):
+            costs = await fetch_rates_from_tollguru_async(client, polyline, loc_times, vehicle_type, request_parameters)
+            await asyncio.to_thread(toll_cache.set, key, costs)
+    except Exception as e:
+        print(f"Warning: Background TollGuru refresh failed, keeping the stale costs: {e}")
+    finally:
+        toll_cache.finish_refresh(key)
+
+async def wait_for_refreshes_async():
+    """Waits for the background toll cache refreshes, call it before closing a client passed to these functions"""
+    if _refresh_tasks:
+        await asyncio.gather(*_refresh_tasks, return_exceptions=True)
+
+async def fetch_rates_from_tollguru_async(client, polyline, loc_times=None, vehicle_type=DEFAULT_VEHICLE_TYPE, request_parameters=None):
+    """Calling Tollguru API, returns the route costs (request_parameters defaults to Here_Maps.request_parameters)"""
+    if request_parameters is None:
+        request_parameters = Here_Maps.request_parameters
+    headers = {"Content-type": "application/json", "x-api-key": TOLLGURU_API_KEY or ""}
+    params = {
+        **request_parameters,
+        "source": "here",
+        "polyline": polyline,
+        "vehicle": {
+            "type": vehicle_type,
+        },
+    }
+    body = dumps_payload(params, loc_times)
+
+    url = f"{TOLLGURU_API_URL}/{POLYLINE_ENDPOINT}"
+    # Concurrent requests with an identical payload share one request
+    response = await tollguru_flight.do_async(
+        payload_key(body), request_async, client, "POST", url, endpoint=TOLLGURU, content=body, headers=headers
+    )
+
+    if response.status_code != 200:
+        try:
+            response_data = json_codec.loads(response.content)
+            error_msg = response_data.get('value', response_data.get('message', response_data.get('code', 'Unknown error')))
+        except Exception:
+            error_msg = f"HTTP {response.status_code}: {response.text}"
+        print(f"❌ TollGuru API Error ({response.status_code}) for vehicle type {vehicle_type}: {error_msg}")
+        raise Exception(error_msg)
+
+    return json_codec.loads(response.content)["route"]["costs"]
+
+async def rate_routes_async(client, routes, vehicle_type=DEFAULT_VEHICLE_TYPE):
+    """Async counterpart of Here_Maps.rate_routes, rates every route concurrently and ranks them"""
+    async def rate(route):
+        try:
+            return {**route, "costs": await get_rates_from_tollguru_async(client, route["polyline"], route["loc_times"], vehicle_type)}
+        except Exception as e:
+            return {**route, "error": str(e)}
+
+    return rank_routes(await asyncio.gather(*(rate(route) for route in routes)))
+
+async def simplify_route_async(polyline, loc_times):
+    """simplify_route that keeps the event loop free while the CPU pool simplifies a long polyline"""
+    if cpu_pool.should_offload(len(polyline)):
+        # The worker process does the work, a thread waits for it
+        return await asyncio.to_thread(simplify_route, polyline, loc_times)
+    return simplify_route(polyline, loc_times)
+
+async def run_lane_async(
+    client, source, destination, vehicle_type=DEFAULT_VEHICLE_TYPE, alternatives=HERE_ROUTE_ALTERNATIVES
+):
+    """
+    Runs geocode -> route -> toll for one lane, geocoding source and destination concurrently
+
+    With `alternatives` the alternative routes are rated concurrently and the cheapest one is reported,
+    the ranked list is returned under "routes".
+
+    Returns:
+        dict with polyline, rates and per-stage timings in seconds
+        (geocode, route, simplify when enabled, tollguru, total)
+    """
+    timings = {}
+    lane_start = time.perf_counter()
+
+    start = time.perf_counter()
+    (source_latitude, source_longitude), (destination_latitude, destination_longitude) = await asyncio.gather(
+        get_geocodes_from_here_maps_async(client, source),
+        get_geocodes_from_here_maps_async(client, destination),
+    )
+    timings["geocode"] = time.perf_counter() - start
+
+    # Includes joining the sections and generating locTimes
+    start = time.perf_counter()
+    routes, _ = await get_routes_from_here_maps_async(
+        client, source_latitude, source_longitude, destination_latitude, destination_longitude, vehicle_type,
+        alternatives,
+    )
+    timings["route"] = time.perf_counter() - start
+
+    if POLYLINE_SIMPLIFY_TOLERANCE > 0:
+        start = time.perf_counter()
+        for route in routes:
+            route["polyline"], route["loc_times"], _ = await simplify_route_async(route["polyline"], route["loc_times"])
+        timings["simplify"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = {"source": source, "destination": destination, "vehicle_type": vehicle_type}
+    if len(routes) == 1:
+        polyline = routes[0]["polyline"]
+        rates = await get_rates_from_tollguru_async(client, polyline, routes[0]["loc_times"], vehicle_type)
+    else:
+        ranked_routes = await rate_routes_async(client, routes, vehicle_type)
+        if "costs" not in ranked_routes[0]:
+            raise Exception(f"None of the routes could be rated: {ranked_routes[0]['error']}")
+        polyline, rates = ranked_routes[0]["polyline"], ranked_routes[0]["costs"]
+        result["routes"] = ranked_routes
+    timings["tollguru"] = time.perf_counter() - start
+
+    timings["total"] = time.perf_counter() - lane_start
+    return {**result, "polyline": polyline, "rates": rates, "timings": timings}
+
+async def get_toll_matrix_async(client, source, destination, vehicle_types=None):
+    """
+    Async counterpart of Here_Maps.get_toll_matrix: geocodes once, routes once per HERE transport mode and
+    rates every vehicle type concurrently
+
+    Returns:
+        dict with "matrix" ({vehicle type: {payment method: cost}}), "costs", "errors" and "routes"
+    """
+    vehicle_types = list(dict.fromkeys(vehicle_types or TOLLGURU_TYPE_TO_CATEGORY))
+    groups = group_vehicle_types(vehicle_types)
+    (source_latitude, source_longitude), (destination_latitude, destination_longitude) = await asyncio.gather(
+        get_geocodes_from_here_maps_async(client, source),
+        get_geocodes_from_here_maps_async(client, destination),
+    )
+    result = {"matrix": {}, "costs": {}, "errors": {}, "routes": {}}
+
+    async def rate(vehicle_type, route):
+        try:
+            costs = await get_rates_from_tollguru_async(client, route["polyline"], route["loc_times"], vehicle_type)
+        except Exception as e:
+            result["errors"][vehicle_type] = str(e)
+            return
+        result["costs"][vehicle_type] = costs
+
+    async def rate_mode(mode, mode_vehicle_types):
+        try:
+            routes, _ = await get_routes_from_here_maps_async(
+                client, source_latitude, source_longitude, destination_latitude, destination_longitude,
+                mode_vehicle_types[0], 0,
+            )
+            route = routes[0]
+            if POLYLINE_SIMPLIFY_TOLERANCE > 0:
+                route["polyline"], route["loc_times"], _ = await simplify_route_async(route["polyline"], route["loc_times"])
+        except Exception as e:
+            for vehicle_type in mode_vehicle_types:
+                result["errors"][vehicle_type] = f"Routing failed: {e}"
+            return
+        result["routes"][mode] = route
+        await asyncio.gather(*(rate(vehicle_type, route) for vehicle_type in mode_vehicle_types))
+
+    await asyncio.gather(*(rate_mode(mode, mode_vehicle_types) for mode, mode_vehicle_types in groups.items()))
+    # Rows in the order the vehicle types were requested
+    for vehicle_type in vehicle_types:
+        if vehicle_type in result["costs"]:
+            result["matrix"][vehicle_type] = cost_matrix_row(result["costs"][vehicle_type])
+    return result
+
+async def get_departure_sweep_async(client, source, destination, departures, vehicle_type=DEFAULT_VEHICLE_TYPE):
+    """
+    Async counterpart of Here_Maps.get_departure_sweep: routes once and rates every departure bucket concurrently
+
+    Returns:
+        dict with "curve" ([(departure epoch, TollGuru costs)]), "errors", "cheapest" and "route"
+    """
+    (source_latitude, source_longitude), (destination_latitude, destination_longitude) = await asyncio.gather(
+        get_geocodes_from_here_maps_async(client, source),
+        get_geocodes_from_here_maps_async(client, destination),
+    )
+    routes, _ = await get_routes_from_here_maps_async(
+        client, source_latitude, source_longitude, destination_latitude, destination_longitude, vehicle_type, 0
+    )
+    route = routes[0]
+    if POLYLINE_SIMPLIFY_TOLERANCE > 0:
+        route["polyline"], route["loc_times"], _ = await simplify_route_async(route["polyline"], route["loc_times"])
+    if not len(route["loc_times"]):
+        raise Exception("The route has no locTimes, TollGuru can only rate it for the current time")
+    template = route["loc_times"].shifted(-route["loc_times"].departure)
+
+    buckets = sweep_buckets(departures)
+    costs, errors = {}, {}
+
+    async def rate(bucket, departure):
+        try:
+            costs[bucket] = await get_rates_from_tollguru_async(
+                client, route["polyline"], template.shifted(departure), vehicle_type, absolute_departure=True
+            )
+        except Exception as e:
+            errors[bucket] = str(e)
+
+    await asyncio.gather(*(rate(bucket, bucket_departures[0]) for bucket, bucket_departures in buckets.items()))
+    return sweep_result(buckets, costs, errors, route)
+
+async def run_lanes_async(lanes, concurrency=ASYNC_MAX_CONCURRENCY, client=None, alternatives=HERE_ROUTE_ALTERNATIVES):
+    """
+    Runs many lanes on one event loop with at most `concurrency` lanes in flight
+
+    Args:
+        lanes: Iterable of (source, destination, vehicle_type) tuples
+        concurrency: Maximum number of lanes processed at the same time
+        client: Optional httpx.AsyncClient, one is created and closed here when omitted
+        alternatives: Alternative routes requested per lane, the cheapest one is reported
+
+    Returns:
+        List of results in input order; a failed lane is reported as {"error": str, "timings": {}}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    own_client = client is None
+    if own_client:
+        client = create_async_client()
+
+    async def run_one(source, destination, vehicle_type):
+        async with semaphore:
+            try:
+                return await run_lane_async(client, source, destination, vehicle_type, alternatives)
+            except Exception as e:
+                return {
+                    "source": source,
+                    "destination": destination,
+                    "vehicle_type": vehicle_type,
+                    "error": str(e),
+                    "timings": {},
+                }
+
+    try:
+        return await asyncio.gather(*(run_one(*lane) for lane in lanes))
+    finally:
+        if own_client:
+            # Stale toll cache entries being refreshed still need the client
+            await wait_for_refreshes_async()
+            await client.aclose()
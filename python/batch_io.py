@@ -0,0 +1,144 @@
+# Importing modules
+import csv
+import json
+import os
+
+# Output formats supported by ResultWriter
+OUTPUT_FORMATS = ("csv", "jsonl", "parquet")
+
+def read_rows(path):
+    """Yields (row number, row) lazily, row 0 is the header"""
+    with open(path, "r", newline="") as f:
+        for count, row in enumerate(csv.reader(f)):
+            yield count, row
+
+def read_checkpoint(checkpoint_path):
+    """Returns the checkpoint dict ({"rows": int, "offset": int}) or None if there is none"""
+    try:
+        with open(checkpoint_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_checkpoint(checkpoint_path, rows, offset):
+    """Atomically records how many data rows are safely written and the output size at that point"""
+    temp_path = f"{checkpoint_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"rows": rows, "offset": offset}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, checkpoint_path)
+
+class ResultWriter:
+    """
+    Writes result rows as soon as they are ready instead of at the end of the run
+
+    Rows are flushed and fsynced every `flush_every` rows, then the checkpoint is updated. A restarted
+    run passes the checkpoint back in `resume`: the output is truncated to the checkpointed size (dropping
+    a partially written batch) and appended to, and the caller skips the first `rows_written` rows. If the
+    output is missing or shorter than the checkpoint, the checkpoint is discarded and a fresh file started.
+
+    Args:
+        path: Output file
+        header: Column names, written once at the top of CSV output and used as JSONL keys
+        output_format: "csv", "jsonl" or "parquet" (parquet needs pyarrow and cannot be resumed)
+        flush_every: Number of rows between flush/fsync and checkpoint updates
+        checkpoint_path: Checkpoint file, or None to disable checkpoints
+        resume: Checkpoint dict from read_checkpoint to continue from, or None to start fresh
+    """
+
+    def __init__(self, path, header, output_format="csv", flush_every=100, checkpoint_path=None, resume=None):
+        if output_format not in OUTPUT_FORMATS:
+            raise Exception(f"Unknown output format '{output_format}', expected one of {', '.join(OUTPUT_FORMATS)}")
+        if resume and (not os.path.isfile(path) or os.path.getsize(path) < resume["offset"]):
+            print(f"Warning: {path} is missing or shorter than its checkpoint, starting a fresh output file")
+            resume = None
+
+        self.path = path
+        self.header = header
+        self.output_format = output_format
+        self.flush_every = max(int(flush_every), 1)
+        self.checkpoint_path = checkpoint_path
+        self.rows_written = resume["rows"] if resume else 0
+        self._pending = 0
+        self._parquet_writer = None
+        self._parquet_batch = []
+
+        if output_format == "parquet":
+            # Parquet files cannot be appended to, so they are always written from scratch
+            self.rows_written = 0
+            return
+
+        if resume:
+            with open(path, "r+b") as f:
+                f.truncate(resume["offset"])
+            self._file = open(path, "a", newline="")
+        else:
+            self._file = open(path, "w", newline="")
+            if output_format == "csv":
+                csv.writer(self._file).writerow(header)
+            # The first checkpoint must cover the header, a resume truncates to its offset
+            self._file.flush()
+        self._csv_writer = csv.writer(self._file)
+        self._checkpoint()
+
+    def write(self, row):
+        """Writes one result row"""
+        if self.output_format == "csv":
+            self._csv_writer.writerow(row)
+        elif self.output_format == "jsonl":
+            self._file.write(json.dumps(dict(zip(self.header, row)), default=str) + "\n")
+        else:
+            self._parquet_batch.append(row)
+
+        self.rows_written += 1
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Makes every written row durable and updates the checkpoint"""
+        self._pending = 0
+        if self.output_format == "parquet":
+            self._write_parquet_batch()
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._checkpoint()
+
+    def _checkpoint(self):
+        if self.checkpoint_path:
+            write_checkpoint(self.checkpoint_path, self.rows_written, os.path.getsize(self.path))
+
+    def _write_parquet_batch(self):
+        if not self._parquet_batch:
+            return
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output requires pyarrow, install it with: pip install pyarrow")
+
+        # Result rows mix strings, numbers, booleans and tuples, so every column is stored as a string
+        columns = list(zip(*[row + [None] * (len(self.header) - len(row)) for row in self._parquet_batch]))
+        table = pa.table(
+            {
+                name: pa.array([None if value is None else str(value) for value in column], type=pa.string())
+                for name, column in zip(self.header, columns)
+            }
+        )
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+        self._parquet_writer.write_table(table)
+        self._parquet_batch = []
+
+    def close(self, completed=True):
+        """Flushes the remaining rows; a completed run removes its checkpoint"""
+        self.flush()
+        if self.output_format == "parquet":
+            if self._parquet_writer is not None:
+                self._parquet_writer.close()
+        else:
+            self._file.close()
+        if completed and self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
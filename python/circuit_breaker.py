@@ -0,0 +1,144 @@
+# Importing modules
+import os
+import threading
+import time
+from collections import deque
+
+from instrumentation import increment
+from rate_limiter import HERE_GEOCODE, HERE_ROUTING, TOLLGURU
+
+# Circuit breaker configuration, CIRCUIT_BREAKER_<ENDPOINT>_<SETTING> overrides a setting for one endpoint
+CIRCUIT_BREAKER_ENABLED = os.environ.get("CIRCUIT_BREAKER_ENABLED", "1") != "0"
+CIRCUIT_BREAKER_WINDOW = float(os.environ.get("CIRCUIT_BREAKER_WINDOW", 30))  # seconds of outcomes considered
+CIRCUIT_BREAKER_ERROR_RATE = float(os.environ.get("CIRCUIT_BREAKER_ERROR_RATE", 0.5))  # failed fraction that opens it
+# Attempts within the window before the error rate is trusted
+CIRCUIT_BREAKER_MIN_REQUESTS = int(os.environ.get("CIRCUIT_BREAKER_MIN_REQUESTS", 20))
+CIRCUIT_BREAKER_COOLDOWN = float(os.environ.get("CIRCUIT_BREAKER_COOLDOWN", 30))  # seconds open before a probe
+
+# Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the endpoint's breaker is open"""
+
+class CircuitBreaker:
+    """
+    Fails fast while an endpoint keeps failing, instead of letting every worker wait for its timeouts
+
+    Every attempt (including retries) is recorded as a success or a failure (connection error, timeout
+    or 5xx). When at least `min_requests` attempts in the last `window` seconds failed at `error_rate`
+    or more, the breaker opens and requests raise CircuitOpenError. After `cooldown` seconds one probe
+    request is let through (half open): a success closes the breaker, a failure opens it again.
+
+    Args:
+        name: Endpoint name used in error messages
+        window: Seconds of outcomes the error rate is computed over
+        error_rate: Failed fraction of attempts that opens the breaker
+        min_requests: Attempts within the window before the breaker can open
+        cooldown: Seconds the breaker stays open before a probe
+    """
+
+    def __init__(
+        self, name, window=CIRCUIT_BREAKER_WINDOW, error_rate=CIRCUIT_BREAKER_ERROR_RATE,
+        min_requests=CIRCUIT_BREAKER_MIN_REQUESTS, cooldown=CIRCUIT_BREAKER_COOLDOWN,
+    ):
+        self.name = name
+        self.window = window
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened = 0  # times the breaker opened
+        self.rejected = 0  # requests failed fast
+        self._outcomes = deque()  # (monotonic time, failed)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        # Must be called with self._lock held
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            _, failed = self._outcomes.popleft()
+            self._failures -= failed
+
+    def before_request(self):
+        """
+        Raises CircuitOpenError if the request must not be sent
+
+        Returns:
+            True if the request is the probe of a half open breaker, pass it on to record()
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+        increment("circuit_rejections")
+        raise CircuitOpenError(f"Circuit breaker for {self.name} is open, failing fast")
+
+    def record(self, success, probe=False):
+        """Records the outcome of an attempt that was let through"""
+        with self._lock:
+            now = time.monotonic()
+            if probe:
+                # The probe decides: close and start over, or stay open for another cooldown
+                self._probing = False
+                if success:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+                else:
+                    self.state = OPEN
+                    self._opened_at = now
+                return
+            if self.state != CLOSED:
+                # Requests sent before the breaker opened do not count
+                return
+
+            self._outcomes.append((now, not success))
+            self._failures += not success
+            self._trim(now)
+            if len(self._outcomes) >= self.min_requests and self._failures >= self.error_rate * len(self._outcomes):
+                self.state = OPEN
+                self._opened_at = now
+                self.opened += 1
+
+    def stats(self):
+        """Returns the state, the error rate within the window and the open/reject counters"""
+        with self._lock:
+            self._trim(time.monotonic())
+            total = len(self._outcomes)
+            return {
+                "state": self.state,
+                "error_rate": self._failures / total if total else 0.0,
+                "requests": total,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+def breaker_from_env(endpoint):
+    """Builds the breaker for an endpoint, CIRCUIT_BREAKER_<ENDPOINT>_<SETTING> overrides the defaults"""
+    prefix = f"CIRCUIT_BREAKER_{endpoint.upper()}"
+    return CircuitBreaker(
+        endpoint,
+        window=float(os.environ.get(f"{prefix}_WINDOW", CIRCUIT_BREAKER_WINDOW)),
+        error_rate=float(os.environ.get(f"{prefix}_ERROR_RATE", CIRCUIT_BREAKER_ERROR_RATE)),
+        min_requests=int(os.environ.get(f"{prefix}_MIN_REQUESTS", CIRCUIT_BREAKER_MIN_REQUESTS)),
+        cooldown=float(os.environ.get(f"{prefix}_COOLDOWN", CIRCUIT_BREAKER_COOLDOWN)),
+    )
+
+# One shared breaker per endpoint
+breakers = {endpoint: breaker_from_env(endpoint) for endpoint in (HERE_GEOCODE, HERE_ROUTING, TOLLGURU)}
+
+def get_breaker(endpoint):
+    """Returns the shared breaker for the endpoint name, or None for unknown endpoints or when disabled"""
+    if endpoint is None or not CIRCUIT_BREAKER_ENABLED:
+        return None
+    return breakers.get(endpoint)
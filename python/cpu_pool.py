@@ -0,0 +1,217 @@
+# Importing modules
+import os
+import threading
+from array import array
+
+# CPU pool configuration
+# Worker processes for the CPU-bound stages (transcoding, locTimes, simplification), 0 keeps them in the calling thread
+CPU_POOL_WORKERS = int(os.environ.get("CPU_POOL_WORKERS", 0))
+# Polylines shorter than this (in characters) are processed in the calling thread, the hand-off would cost more
+CPU_POOL_MIN_CHARS = int(os.environ.get("CPU_POOL_MIN_CHARS", 20000))
+
+# Upper bound of Google encoded characters per flexpolyline character: every value takes at least one
+# flexpolyline character and at most six Google characters at precision 5
+_GOOGLE_CHARS_PER_FLEX_CHAR = 6
+_INT64 = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def should_offload(chars):
+    """True if a polyline of `chars` characters is worth sending to the pool"""
+    return CPU_POOL_WORKERS > 0 and chars >= CPU_POOL_MIN_CHARS
+
+def get_pool():
+    """Returns the shared ProcessPoolExecutor, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # spawn instead of fork: the batch scripts run many threads, which fork does not copy safely
+            _pool = ProcessPoolExecutor(max_workers=CPU_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def shutdown():
+    """Stops the worker processes, e.g. at the end of a batch run"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+class _Block:
+    """
+    One shared memory block holding the inputs and the reserved output space of a task
+
+    Only the block name and the offsets are pickled, the polylines and arrays themselves are written
+    once into shared memory by one side and read once by the other.
+    """
+
+    def __init__(self, inputs, output_size):
+        from multiprocessing.shared_memory import SharedMemory
+
+        self.offsets = []
+        size = 0
+        for data in inputs:
+            self.offsets.append((size, len(data)))
+            size += len(data)
+        self.output = size
+        self.shm = SharedMemory(create=True, size=max(size + output_size, 1))
+        for data, (offset, length) in zip(inputs, self.offsets):
+            self.shm.buf[offset:offset + length] = data
+
+    def read(self, offset, length):
+        return bytes(self.shm.buf[offset:offset + length])
+
+    def read_array(self, offset, count):
+        return _read_array(self.shm.buf, offset, count)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def _attach(name):
+    """Opens a block created by the parent process"""
+    from multiprocessing.shared_memory import SharedMemory
+
+    # Spawned workers share the parent's resource tracker, which already knows the block; the parent
+    # unlinks it, so the worker only closes its mapping
+    return SharedMemory(name=name)
+
+def _read_array(buf, offset, count):
+    values = array("q")
+    values.frombytes(buf[offset:offset + count * _INT64])
+    return values
+
+def _prepare_route_worker(name, polyline_spans, action_spans, departures, output, per_vertex):
+    """Worker side of prepare_route, writes the polyline and locTimes into the output part of the block"""
+    from flex_transcode import flexpolyline_to_google, join_google_polylines
+    from loc_times import LocTimes
+    from route_helpers import join_loc_times
+
+    shm = _attach(name)
+    try:
+        buf = shm.buf
+        polylines = [
+            flexpolyline_to_google(bytes(buf[offset:offset + length]).decode("ascii"))
+            for offset, length in polyline_spans
+        ]
+        polyline, section_starts = join_google_polylines(polylines)
+        sections = [
+            LocTimes.from_durations(_read_array(buf, offset, count), _read_array(buf, offset + count * _INT64, count), departure)
+            for (offset, count), departure in zip(action_spans, departures)
+        ]
+        loc_times = join_loc_times(sections, section_starts, per_vertex)
+
+        encoded = polyline.encode("ascii")
+        buf[output:output + len(encoded)] = encoded
+        offset = output + len(encoded)
+        for values in (loc_times.offsets, loc_times.timestamps):
+            data = values.tobytes()
+            buf[offset:offset + len(data)] = data
+            offset += len(data)
+        del buf
+        return len(encoded), section_starts, len(loc_times)
+    finally:
+        shm.close()
+
+def _submit_route(route):
+    from loc_times import LOC_TIMES_PER_VERTEX
+
+    sections = route.sections
+    inputs = [section.polyline for section in sections]
+    departures = []
+    action_count = 0
+    for section in sections:
+        inputs.append(section.offsets.tobytes())
+        inputs.append(section.durations.tobytes())
+        departures.append(section.departure)
+        action_count += len(section.offsets)
+
+    flex_chars = sum(len(section.polyline) for section in sections)
+    polyline_size = _GOOGLE_CHARS_PER_FLEX_CHAR * flex_chars + 16 * len(sections)
+    # Per vertex locTimes have at most one entry per vertex plus one per action
+    loc_times_count = flex_chars // 2 + action_count + 1 if LOC_TIMES_PER_VERTEX else action_count
+    block = _Block(inputs, polyline_size + 2 * _INT64 * loc_times_count)
+
+    polyline_spans = block.offsets[:len(sections)]
+    action_spans = [(offset, length // _INT64) for offset, length in block.offsets[len(sections)::2]]
+    future = get_pool().submit(
+        _prepare_route_worker, block.shm.name, polyline_spans, action_spans, departures, block.output,
+        LOC_TIMES_PER_VERTEX,
+    )
+    return block, future
+
+def _read_route(block, result):
+    from loc_times import LocTimes
+
+    polyline_length, section_starts, count = result
+    offset = block.output + polyline_length
+    loc_times = LocTimes(block.read_array(offset, count), block.read_array(offset + count * _INT64, count))
+    return block.read(block.output, polyline_length).decode("ascii"), section_starts, loc_times
+
+def prepare_route(route):
+    """
+    Transcodes and joins the sections of a HereRoute and generates its locTimes in a worker process
+
+    Returns:
+        (polyline, section starts, LocTimes), the same as route_polyline followed by route_loc_times
+    """
+    block, future = _submit_route(route)
+    try:
+        return _read_route(block, future.result())
+    finally:
+        block.close()
+
+async def prepare_route_async(route):
+    """prepare_route for the event loop, the loop keeps running while the worker is busy"""
+    import asyncio  # only async callers pay for importing asyncio
+
+    block, future = _submit_route(route)
+    try:
+        return _read_route(block, await asyncio.wrap_future(future))
+    finally:
+        block.close()
+
+def _simplify_worker(name, polyline_span, offsets_span, tolerance_meters, output, output_size):
+    """Worker side of simplify_polyline, writes the kept vertex indices and then the polyline"""
+    from simplify import simplify_polyline as simplify
+
+    shm = _attach(name)
+    try:
+        buf = shm.buf
+        offset, length = polyline_span
+        polyline = bytes(buf[offset:offset + length]).decode("ascii")
+        keep_indices = _read_array(buf, offsets_span[0], offsets_span[1] // _INT64)
+        simplified, kept_indices, vertex_count = simplify(polyline, tolerance_meters, keep_indices)
+
+        kept = array("q", kept_indices).tobytes()
+        encoded = simplified.encode("ascii")
+        if len(kept) + len(encoded) > output_size:
+            raise Exception("Simplified polyline does not fit the shared memory block")
+        buf[output:output + len(kept)] = kept
+        buf[output + len(kept):output + len(kept) + len(encoded)] = encoded
+        del buf
+        return len(kept_indices), len(encoded), vertex_count
+    finally:
+        shm.close()
+
+def simplify_polyline(polyline, tolerance_meters, keep_indices=()):
+    """simplify.simplify_polyline in a worker process, returns the same (polyline, kept indices, vertex count)"""
+    # A polyline has at most one vertex per two characters; the simplified one at most 12 characters per vertex
+    max_vertices = len(polyline) // 2 + 1
+    output_size = _INT64 * max_vertices + 12 * max_vertices
+    block = _Block([polyline.encode("ascii"), array("q", keep_indices).tobytes()], output_size)
+    try:
+        future = get_pool().submit(
+            _simplify_worker, block.shm.name, block.offsets[0], block.offsets[1], tolerance_meters, block.output,
+            output_size,
+        )
+        kept_count, polyline_length, vertex_count = future.result()
+        kept_indices = block.read_array(block.output, kept_count)
+        simplified = block.read(block.output + kept_count * _INT64, polyline_length).decode("ascii")
+        return simplified, kept_indices, vertex_count
+    finally:
+        block.close()
@@ -0,0 +1,187 @@
+# Converts HERE flexible polylines straight to Google encoded polylines
+#
+# Both formats store zigzag encoded deltas as little endian 5 bit chunks with a 0x20 continuation bit,
+# they only differ in the header and in the alphabet used for the chunks. So instead of decoding every
+# vertex to a float tuple and re-encoding it (poly.encode(fp.decode(...))), the values are transcoded
+# in one pass over the string. The output is byte-identical to the two step conversion.
+import re
+
+# Alphabet used by flexible polylines (URL safe base64), the index is the chunk value
+FLEX_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+FLEX_DECODING = {char: value for value, char in enumerate(FLEX_ALPHABET)}
+FLEX_FORMAT_VERSION = 1
+
+# Google polylines encode chunk values as chr(value + 63)
+FLEX_TO_GOOGLE = str.maketrans({char: chr(value + 63) for value, char in enumerate(FLEX_ALPHABET)})
+
+# The translate fast path is only exact for minimally encoded bodies made of valid characters:
+# a continuation chunk (value >= 32) followed by a terminating zero chunk ("A") would be written
+# shorter by the Google encoder
+NOT_TRANSLATABLE = re.compile(r"[^A-Za-z0-9_\-]|[g-z0-9_\-]A")
+FLEX_TERMINATING_CHARS = FLEX_ALPHABET[:32]
+
+def _unsigned_values(encoded, start=0):
+    """Yields (unsigned value, index after the value) for every varint in the string"""
+    result = shift = 0
+    for index in range(start, len(encoded)):
+        try:
+            value = FLEX_DECODING[encoded[index]]
+        except KeyError:
+            raise ValueError('Invalid encoding')
+        result |= (value & 0x1F) << shift
+        if value & 0x20:
+            shift += 5
+        else:
+            yield result, index + 1
+            result = shift = 0
+    if shift > 0:
+        raise ValueError('Invalid encoding')
+
+def _encode_google_value(value, output):
+    """Appends one signed delta in Google polyline format"""
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        output.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    output.append(chr(value + 63))
+
+def _py2_round(value):
+    # Same rounding as polyline.encode (half away from zero), needed for byte-identical output
+    return int(-((-value + 0.5) // 1)) if value < 0 else int((value + 0.5) // 1)
+
+def decode_header(encoded):
+    """
+    Reads the flexible polyline header
+
+    Returns:
+        (precision, third_dim, third_dim_precision, index of the first body character)
+    """
+    values = _unsigned_values(encoded)
+    try:
+        version, _ = next(values)
+        header, body_start = next(values)
+    except StopIteration:
+        raise ValueError('Invalid encoding')
+    if version != FLEX_FORMAT_VERSION:
+        raise ValueError('Invalid format version')
+    return header & 15, (header >> 4) & 7, (header >> 7) & 15, body_start
+
+def flexpolyline_to_google(encoded, precision=5):
+    """
+    Transcodes a HERE flexible polyline to a Google encoded polyline
+
+    Args:
+        encoded: Flexible polyline string from the HERE routing response
+        precision: Precision of the Google polyline, the same default as polyline.encode
+
+    Returns:
+        Encoded polyline string, identical to poly.encode(fp.decode(encoded), precision).
+        A third dimension (elevation, level, ...) is dropped, as polyline.encode does.
+    """
+    flex_precision, third_dim, _, body_start = decode_header(encoded)
+    body = encoded[body_start:]
+    if not body:
+        raise ValueError('Polyline has no coordinates')
+
+    # Fast path: same precision and no third dimension means the deltas are already the Google deltas
+    if flex_precision == precision and not third_dim and not NOT_TRANSLATABLE.search(body):
+        if body[-1] not in FLEX_TERMINATING_CHARS:
+            raise ValueError('Invalid encoding')
+        value_count = len(body) - len(body.translate(str.maketrans("", "", FLEX_TERMINATING_CHARS)))
+        if value_count % 2:
+            raise ValueError("Invalid encoding. Premature ending reached")
+        return body.translate(FLEX_TO_GOOGLE)
+
+    # Streaming path: rescale every coordinate while walking the varints once
+    dimensions = 3 if third_dim else 2
+    same_precision = flex_precision == precision
+    factor_flex = 10.0 ** flex_precision
+    factor_google = int(10 ** precision)
+    absolute = [0, 0]  # flexible polyline lat/lng integers
+    previous = [0, 0]  # last Google lat/lng integers
+    output = []
+    position = 0
+
+    for value, _ in _unsigned_values(encoded, body_start):
+        axis = position % dimensions
+        position += 1
+        if axis == 2:
+            continue  # third dimension is not part of Google polylines
+
+        delta = ~(value >> 1) if value & 1 else value >> 1
+        if same_precision:
+            _encode_google_value(delta, output)
+            continue
+
+        absolute[axis] += delta
+        current = _py2_round(absolute[axis] / factor_flex * factor_google)
+        _encode_google_value(current - previous[axis], output)
+        previous[axis] = current
+
+    if position % dimensions:
+        raise ValueError("Invalid encoding. Premature ending reached")
+    return "".join(output)
+
+def _google_points(encoded):
+    """
+    Scans a Google encoded polyline without building the vertex list
+
+    Returns:
+        (vertex count, first vertex, index after the first vertex, last vertex), vertices as integer pairs
+    """
+    point = [0, 0]
+    first = None
+    first_end = 0
+    value_count = 0
+    result = shift = 0
+    for index, char in enumerate(encoded):
+        chunk = ord(char) - 63
+        result |= (chunk & 0x1F) << shift
+        if chunk & 0x20:
+            shift += 5
+            continue
+        point[value_count % 2] += ~(result >> 1) if result & 1 else result >> 1
+        value_count += 1
+        result = shift = 0
+        if value_count == 2:
+            first, first_end = tuple(point), index + 1
+    if shift or value_count % 2 or first is None:
+        raise ValueError("Invalid encoding. Premature ending reached")
+    return value_count // 2, first, first_end, tuple(point)
+
+def join_google_polylines(polylines):
+    """
+    Joins Google encoded polylines end to end, e.g. the sections of a HERE route
+
+    Only the first vertex of every following polyline is re-encoded (relative to the previous last
+    vertex), the rest of each string is copied. A first vertex that repeats the previous last vertex,
+    as the section boundaries of HERE routes do, is kept once.
+
+    Returns:
+        (joined polyline, index of the first vertex of every input polyline in the joined polyline)
+    """
+    if len(polylines) == 1:
+        return polylines[0], [0]
+
+    parts = []
+    starts = []
+    vertex_count = 0
+    previous_last = None
+    for encoded in polylines:
+        count, first, first_end, last = _google_points(encoded)
+        if previous_last is None:
+            parts.append(encoded)
+            starts.append(0)
+        elif first == previous_last:
+            parts.append(encoded[first_end:])
+            starts.append(vertex_count - 1)
+            count -= 1
+        else:
+            output = []
+            _encode_google_value(first[0] - previous_last[0], output)
+            _encode_google_value(first[1] - previous_last[1], output)
+            parts.append("".join(output) + encoded[first_end:])
+            starts.append(vertex_count)
+        vertex_count += count
+        previous_last = last
+    return "".join(parts), starts
@@ -0,0 +1,128 @@
+# Importing modules
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# Cache configuration
+# The on-disk cache lives next to this file so Here_Maps.py and the Testing scripts share it
+GEOCODE_CACHE_PATH = os.environ.get(
+    "GEOCODE_CACHE_PATH", str(Path(__file__).parent / ".cache" / "geocodes.sqlite")
+)
+GEOCODE_CACHE_TTL = int(os.environ.get("GEOCODE_CACHE_TTL", 30 * 24 * 60 * 60))  # seconds, 30 days
+GEOCODE_CACHE_MEMORY_SIZE = int(os.environ.get("GEOCODE_CACHE_MEMORY_SIZE", 10000))  # entries
+GEOCODE_CACHE_ENABLED = os.environ.get("GEOCODE_CACHE_ENABLED", "1") != "0"
+
+def normalize_address(address):
+    """Normalizes an address so that trivial spelling variations share one cache entry"""
+    return " ".join(address.replace(",", ", ").split()).lower()
+
+class GeocodeCache:
+    """
+    Two tier geocode cache: an in-memory LRU in front of a SQLite table
+
+    Args:
+        path: SQLite file path, or None to keep the cache in memory only
+        ttl: Seconds after which an entry is considered expired (0 disables expiry)
+        memory_size: Maximum number of entries held in the in-memory LRU tier
+    """
+
+    def __init__(self, path=GEOCODE_CACHE_PATH, ttl=GEOCODE_CACHE_TTL, memory_size=GEOCODE_CACHE_MEMORY_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connection(self):
+        """Opens the SQLite file on first use, so creating the shared instance at import costs nothing"""
+        # Must be called with self._lock held
+        if self._db is None and self.path:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            # The harness calls the cache from several worker threads, access is serialized by self._lock
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS geocodes ("
+                "address TEXT PRIMARY KEY, latitude REAL, longitude REAL, created_at REAL)"
+            )
+            self._db.commit()
+        return self._db
+
+    def _expired(self, created_at):
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, address):
+        """Returns cached (latitude, longitude) for the address, or None on a miss"""
+        key = normalize_address(address)
+        with self._lock:
+            entry = self._memory.get(key)
+            db = self._connection() if entry is None else None
+            if db is not None:
+                row = db.execute(
+                    "SELECT latitude, longitude, created_at FROM geocodes WHERE address = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = ((row[0], row[1]), row[2])
+                    self._remember(key, entry)
+
+            if entry is None or self._expired(entry[1]):
+                self.misses += 1
+                return None
+
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, address, latitude, longitude):
+        """Stores the coordinates for the address in both tiers"""
+        key = normalize_address(address)
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, ((latitude, longitude), created_at))
+            db = self._connection()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO geocodes (address, latitude, longitude, created_at) VALUES (?, ?, ?, ?)",
+                    (key, latitude, longitude, created_at),
+                )
+                db.commit()
+
+    def purge_expired(self):
+        """Deletes expired entries from the SQLite table and returns how many were removed"""
+        if not self.path or self.ttl <= 0:
+            return 0
+        with self._lock:
+            db = self._connection()
+            cursor = db.execute("DELETE FROM geocodes WHERE created_at < ?", (time.time() - self.ttl,))
+            db.commit()
+            return cursor.rowcount
+
+    def stats(self):
+        """Returns hit/miss counters and the hit rate"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+# Shared cache instance used by get_geocodes_from_here_maps (None when caching is disabled)
+geocode_cache = GeocodeCache() if GEOCODE_CACHE_ENABLED else None
@@ -0,0 +1,205 @@
+# Importing modules
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError, wait
+
+from instrumentation import increment, percentile
+
+# Hedging configuration
+# Comma-separated endpoints whose GET requests are hedged, e.g. "here_geocode,here_routing" (off by default)
+HEDGE_ENDPOINTS = set(filter(None, os.environ.get("HEDGE_ENDPOINTS", "").split(",")))
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", 0.95))  # latency percentile after which a duplicate is sent
+HEDGE_DELAY = float(os.environ.get("HEDGE_DELAY", 1.0))  # seconds, used until HEDGE_MIN_SAMPLES latencies are known
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", 20))
+HEDGE_SAMPLE_SIZE = int(os.environ.get("HEDGE_SAMPLE_SIZE", 200))  # recent latencies the percentile is computed over
+# Maximum fraction of requests that may be hedged, so a slow upstream is not sent twice the load
+HEDGE_MAX_RATIO = float(os.environ.get("HEDGE_MAX_RATIO", 0.1))
+# Hedges that may be sent back to back; every request adds HEDGE_MAX_RATIO of a hedge to the budget up to this
+HEDGE_MAX_BURST = float(os.environ.get("HEDGE_MAX_BURST", 10))
+HEDGE_WORKERS = int(os.environ.get("HEDGE_WORKERS", 64))  # threads sending hedged blocking requests
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+        return _executor
+
+def _retrieve(task):
+    """Consumes the exception of the cancelled or failed duplicate, so asyncio does not log it"""
+    if not task.cancelled():
+        task.exception()
+
+class Hedger:
+    """
+    Sends a duplicate of a slow request and returns whichever reply comes first
+
+    The duplicate is sent once the request has taken longer than the `percentile` latency of the
+    recent requests, so only the slowest requests are hedged. The delay starts when the request starts
+    running, not while it waits for a free hedging thread. Hedges are paid from a token budget: every
+    request adds `max_ratio` of a token, at most `max_burst` tokens are saved up, and a hedge spends
+    one, so at most `max_ratio` of the requests are hedged even after a quiet period. Only idempotent
+    requests (HERE GETs) should be hedged.
+
+    Args:
+        name: Endpoint name
+        percentile: Latency percentile after which the duplicate is sent
+        delay: Seconds to wait before hedging while fewer than `min_samples` latencies are known
+        min_samples: Latencies needed before the percentile is used
+        sample_size: Recent latencies kept
+        max_ratio: Maximum fraction of requests that may be hedged
+        max_burst: Maximum hedges the budget saves up
+    """
+
+    def __init__(
+        self, name, percentile=HEDGE_PERCENTILE, delay=HEDGE_DELAY, min_samples=HEDGE_MIN_SAMPLES,
+        sample_size=HEDGE_SAMPLE_SIZE, max_ratio=HEDGE_MAX_RATIO, max_burst=HEDGE_MAX_BURST,
+    ):
+        self.name = name
+        self.percentile = percentile
+        self.default_delay = delay
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.max_burst = max_burst
+        self._budget = 0.0  # hedges that may be sent now
+        self.requests = 0
+        self.hedged = 0  # duplicates sent
+        self.hedge_wins = 0  # duplicates that replied first
+        self._latencies = deque(maxlen=sample_size)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Seconds after which a request is hedged"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.default_delay
+            latencies = sorted(self._latencies)
+        return percentile(latencies, self.percentile)
+
+    def _observe(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _start(self):
+        with self._lock:
+            self.requests += 1
+            self._budget = min(self._budget + self.max_ratio, self.max_burst)
+
+    def _may_hedge(self):
+        with self._lock:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            self.hedged += 1
+        increment("hedges")
+        return True
+
+    def _won(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def _timed(self, function, started=None):
+        if started is not None:
+            started.set()
+        start = time.perf_counter()
+        result = function()
+        self._observe(time.perf_counter() - start)
+        return result
+
+    async def _timed_async(self, function):
+        start = time.perf_counter()
+        result = await function()
+        self._observe(time.perf_counter() - start)
+        return result
+
+    def call(self, function, before_hedge=None):
+        """
+        Calls function() in a hedging thread, and again in a second one if it is slower than delay()
+
+        Args:
+            before_hedge: Called before the duplicate is sent, e.g. to take a rate limiter token
+
+        Returns:
+            The first successful result; if both calls fail the exception of the last one is raised
+        """
+        self._start()
+        executor = _get_executor()
+        started = threading.Event()
+        primary = executor.submit(self._timed, function, started)
+        # Time spent queued for a hedging thread does not count, a full pool must not trigger hedges
+        started.wait()
+        try:
+            return primary.result(timeout=self.delay())
+        except TimeoutError:
+            pass
+        if not self._may_hedge():
+            return primary.result()
+
+        if before_hedge is not None:
+            before_hedge()
+        backup = executor.submit(self._timed, function)
+        done, _ = wait([primary, backup], return_when=FIRST_COMPLETED)
+        first = backup if backup in done and (primary not in done or primary.exception() is not None) else primary
+        other = primary if first is backup else backup
+        if first.exception() is not None:
+            return other.result()
+        if first is backup:
+            self._won()
+        # requests has read the body already, the slower reply is simply dropped
+        return first.result()
+
+    async def call_async(self, function, before_hedge=None):
+        """call() for coroutine functions, the slower request is cancelled once the first one succeeds"""
+        import asyncio  # only async callers pay for importing asyncio
+
+        self._start()
+        primary = asyncio.ensure_future(self._timed_async(function))
+        done, _ = await asyncio.wait({primary}, timeout=self.delay())
+        if done or not self._may_hedge():
+            return await primary
+
+        if before_hedge is not None:
+            await before_hedge()
+        backup = asyncio.ensure_future(self._timed_async(function))
+        done, _ = await asyncio.wait({primary, backup}, return_when=asyncio.FIRST_COMPLETED)
+        first = backup if backup in done and (primary not in done or primary.exception() is not None) else primary
+        other = primary if first is backup else backup
+        if first.exception() is not None:
+            return await other
+        if first is backup:
+            self._won()
+        other.cancel()
+        other.add_done_callback(_retrieve)
+        return first.result()
+
+    def stats(self):
+        """Returns request and hedge counters and the current hedging delay"""
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "budget": self._budget,
+            "delay": self.delay(),
+        }
+
+# One hedger per endpoint listed in HEDGE_ENDPOINTS
+hedgers = {endpoint: Hedger(endpoint) for endpoint in HEDGE_ENDPOINTS}
+
+def get_hedger(endpoint):
+    """Returns the hedger for the endpoint name, or None if its requests are not hedged"""
+    if endpoint is None:
+        return None
+    return hedgers.get(endpoint)
+
+def shutdown():
+    """Stops the hedging threads"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
@@ -0,0 +1,87 @@
+# Importing modules
+from array import array
+from operator import itemgetter
+
+from loc_times import LocTimes
+from route_helpers import iso_to_epoch
+
+_get_offset = itemgetter("offset")
+_get_duration = itemgetter("duration")
+
+class RouteSection:
+    """
+    One section of a HERE route, only the fields the toll flow reads
+
+    The flexpolyline is kept as ASCII bytes and the actions as two array('q') columns (offset,
+    duration), eight bytes per value instead of a dict per action.
+    """
+
+    __slots__ = ("polyline", "offsets", "durations", "departure", "arrival", "length")
+
+    def __init__(self, polyline, offsets, durations, departure, arrival=None, length=None):
+        self.polyline = polyline
+        self.offsets = offsets
+        self.durations = durations
+        self.departure = departure  # epoch seconds
+        self.arrival = arrival  # epoch seconds, None if HERE did not send it
+        self.length = length  # meters from the section summary, None without return=summary
+
+    @classmethod
+    def from_json(cls, section):
+        """Extracts a section of a decoded HERE v8 response"""
+        actions = section.get("actions", [])
+        arrival = section.get("arrival", {}).get("time")
+        return cls(
+            section["polyline"].encode("ascii"),
+            array("q", map(_get_offset, actions)),
+            array("q", map(_get_duration, actions)),
+            iso_to_epoch(section["departure"]["time"]),
+            iso_to_epoch(arrival) if arrival is not None else None,
+            (section.get("summary") or {}).get("length"),
+        )
+
+    def loc_times(self):
+        """Times the actions from the section's departure, see LocTimes.from_durations"""
+        # The offsets are copied, cached sections are shared between lanes
+        return LocTimes.from_durations(array("q", self.offsets), self.durations, self.departure)
+
+class HereRoute:
+    """
+    Compact HERE route: its sections and nothing else of the routing response
+
+    Built right after decoding, so the parsed JSON (instructions, transport details, ...) is dropped
+    at once instead of staying resident while the route is transcoded, simplified and rated.
+    """
+
+    __slots__ = ("sections",)
+
+    def __init__(self, sections):
+        self.sections = sections
+
+    @classmethod
+    def from_json(cls, route):
+        return cls([RouteSection.from_json(section) for section in route["sections"]])
+
+    @property
+    def departure(self):
+        """Departure of the first section in epoch seconds"""
+        return self.sections[0].departure
+
+    @property
+    def duration(self):
+        """Seconds from the departure of the first section to the arrival of the last, None without arrival times"""
+        arrival = self.sections[-1].arrival
+        return arrival - self.departure if arrival is not None else None
+
+    @property
+    def length(self):
+        """Meters over all sections, None if a section has no summary"""
+        lengths = [section.length for section in self.sections]
+        return None if None in lengths else sum(lengths)
+
+    def __repr__(self):
+        return f"HereRoute({len(self.sections)} sections)"
+
+def parse_routes(response):
+    """Extracts every route of a decoded HERE v8 routing response as HereRoute"""
+    return [HereRoute.from_json(route) for route in response["routes"]]
@@ -0,0 +1,153 @@
+# Importing modules
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from circuit_breaker import get_breaker
+from hedging import get_hedger
+from instrumentation import increment
+from rate_limiter import get_limiter
+
+# Client configuration
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 32))  # keep-alive connections per host
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))  # seconds
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 30))  # seconds
+# HTTP_TIMEOUT_<ENDPOINT> (e.g. HTTP_TIMEOUT_TOLLGURU=10) overrides the read timeout for one endpoint
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 3))
+HTTP_BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", 0.5))  # seconds, doubled on every retry
+HTTP_BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", 20))  # seconds
+
+# Rate limiting (429) and transient server errors are retried, everything else is returned to the caller
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(url):
+    """Returns the shared keep-alive Session for the host of the url"""
+    # requests is imported on first use, so importing the pipeline modules stays fast for worker processes
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+def close_sessions():
+    """Closes every pooled Session, e.g. at the end of a batch run"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+def endpoint_timeout(endpoint):
+    """Returns the (connect, read) timeout in seconds for an endpoint name, see HTTP_TIMEOUT_<ENDPOINT>"""
+    if endpoint is None:
+        return HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+    return HTTP_CONNECT_TIMEOUT, float(os.environ.get(f"HTTP_TIMEOUT_{endpoint.upper()}", HTTP_READ_TIMEOUT))
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Computes how long to wait before the next attempt
+
+    Args:
+        attempt: Number of the attempt that just failed, starting at 0
+        retry_after: Value of the Retry-After header in seconds, if the server sent one
+
+    Returns:
+        Delay in seconds, exponential with full jitter and capped at HTTP_BACKOFF_MAX
+    """
+    if retry_after is not None:
+        return min(retry_after, HTTP_BACKOFF_MAX)
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+def parse_retry_after(response):
+    """Reads the Retry-After header (delta seconds form) from a response"""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+def request(method, url, endpoint=None, max_retries=HTTP_MAX_RETRIES, **kwargs):
+    """
+    Sends a request through the pooled Session for the url's host
+
+    Connection errors, timeouts and RETRY_STATUS_CODES responses are retried with exponential backoff.
+    The last response is returned even if it is still an error, so callers keep their own error handling.
+
+    `endpoint` names the rate limiter (see rate_limiter.py) every attempt has to acquire a token from.
+    A 429 Retry-After pauses that limiter, so all workers calling the endpoint back off together.
+    It also selects the timeout, the circuit breaker (see circuit_breaker.py), which raises
+    CircuitOpenError instead of sending while the endpoint keeps failing, and for GET requests the
+    hedger (see hedging.py).
+    """
+    import requests
+
+    kwargs.setdefault("timeout", endpoint_timeout(endpoint))
+    session = get_session(url)
+    limiter = get_limiter(endpoint)
+    breaker = get_breaker(endpoint)
+    hedger = get_hedger(endpoint) if method == "GET" else None
+
+    def send():
+        return session.request(method, url, **kwargs)
+
+    attempt = 0
+    while True:
+        probe = breaker.before_request() if breaker is not None else False
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = hedger.call(send, limiter and limiter.acquire) if hedger is not None else send()
+        except (requests.ConnectionError, requests.Timeout):
+            if breaker is not None:
+                breaker.record(False, probe)
+            if attempt >= max_retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+            increment("retries")
+            continue
+        except BaseException:
+            # Includes KeyboardInterrupt, so an interrupted probe does not leave the breaker half open
+            if breaker is not None:
+                breaker.record(False, probe)
+            raise
+        if breaker is not None:
+            breaker.record(response.status_code < 500, probe)
+
+        # Body sizes are added to the span of the running stage (see instrumentation.py)
+        body = response.request.body or b""
+        increment("bytes_sent", len(body.encode() if isinstance(body, str) else body))
+        increment("bytes_received", len(response.content))
+
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+            return response
+
+        retry_after = parse_retry_after(response)
+        response.close()
+        if limiter is not None and response.status_code == 429 and retry_after is not None:
+            # The limiter holds every worker until the server is ready again
+            limiter.penalize(backoff_delay(attempt, retry_after))
+        else:
+            time.sleep(backoff_delay(attempt, retry_after))
+        attempt += 1
+        increment("retries")
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
@@ -0,0 +1,209 @@
+# Importing modules
+import contextvars
+import math
+import os
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+# Instrumentation configuration
+INSTRUMENTATION_ENABLED = os.environ.get("INSTRUMENTATION_ENABLED", "1") != "0"
+# Durations kept per stage for percentiles (reservoir sample, so memory does not grow with the run)
+INSTRUMENTATION_SAMPLE_SIZE = int(os.environ.get("INSTRUMENTATION_SAMPLE_SIZE", 10000))
+# Export spans through the OpenTelemetry API (needs opentelemetry-api and a configured SDK)
+INSTRUMENTATION_OTEL = os.environ.get("INSTRUMENTATION_OTEL", "0") == "1"
+# Serve Prometheus metrics on this port (needs prometheus-client), 0 disables the exporter
+PROMETHEUS_PORT = int(os.environ.get("PROMETHEUS_PORT", 0))
+
+# Span attributes that are summed per stage in the summary
+COUNTERS = ("bytes_sent", "bytes_received", "retries", "hedges", "circuit_rejections")
+
+_current_span = contextvars.ContextVar("instrumentation_span", default=None)
+_hooks = []
+_metrics = {}
+_metrics_lock = threading.Lock()
+_tracer = None
+
+class StageMetrics:
+    """Aggregated measurements of one pipeline stage"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.total_seconds = 0.0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.samples = []
+
+    def add(self, span):
+        self.count += 1
+        self.total_seconds += span["duration"]
+        if "error" in span:
+            self.errors += 1
+        if span.get("cache_hit"):
+            self.cache_hits += 1
+        for name in COUNTERS:
+            self.counters[name] += span.get(name, 0)
+
+        # Reservoir sampling keeps a uniform sample of INSTRUMENTATION_SAMPLE_SIZE durations
+        if len(self.samples) < INSTRUMENTATION_SAMPLE_SIZE:
+            self.samples.append(span["duration"])
+        else:
+            index = random.randrange(self.count)
+            if index < INSTRUMENTATION_SAMPLE_SIZE:
+                self.samples[index] = span["duration"]
+
+def add_hook(callback):
+    """Registers callback(span) to be called with every finished span dict"""
+    _hooks.append(callback)
+
+def remove_hook(callback):
+    _hooks.remove(callback)
+
+def _get_tracer():
+    global _tracer
+    if _tracer is None:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise ImportError("INSTRUMENTATION_OTEL requires opentelemetry-api, install it with: pip install opentelemetry-api")
+        _tracer = trace.get_tracer("toll-for-route-here-maps")
+    return _tracer
+
+@contextmanager
+def stage(name, **attributes):
+    """
+    Times one pipeline stage
+
+    Code running inside the block can add to the span with annotate() and increment(), e.g. http_client
+    records bytes and retries and the caches record cache hits. When the block ends the span dict
+    (stage, duration, attributes, error) is aggregated and passed to every hook.
+    """
+    if not INSTRUMENTATION_ENABLED:
+        yield {}
+        return
+
+    span = {"stage": name, **attributes}
+    token = _current_span.set(span)
+    with ExitStack() as stack:
+        # OpenTelemetry spans are made current so nested stages become child spans
+        otel_span = stack.enter_context(_get_tracer().start_as_current_span(name)) if INSTRUMENTATION_OTEL else None
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span["duration"] = time.perf_counter() - start
+            _current_span.reset(token)
+            if otel_span is not None:
+                for key, value in span.items():
+                    if isinstance(value, (str, bool, int, float)):
+                        otel_span.set_attribute(key, value)
+            _record(span)
+
+def annotate(**values):
+    """Sets attributes on the span of the stage currently running, if any"""
+    span = _current_span.get()
+    if span is not None:
+        span.update(values)
+
+def increment(name, amount=1):
+    """Adds to a numeric attribute of the span of the stage currently running, if any"""
+    span = _current_span.get()
+    if span is not None:
+        span[name] = span.get(name, 0) + amount
+
+def _record(span):
+    with _metrics_lock:
+        metrics = _metrics.get(span["stage"])
+        if metrics is None:
+            metrics = _metrics[span["stage"]] = StageMetrics()
+        metrics.add(span)
+    for callback in _hooks:
+        try:
+            callback(span)
+        except Exception as e:
+            print(f"Warning: instrumentation hook failed: {e}")
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summary():
+    """Returns per-stage count, errors, cache hits, counters and p50/p95/p99/mean durations in seconds"""
+    result = {}
+    with _metrics_lock:
+        for name, metrics in _metrics.items():
+            samples = sorted(metrics.samples)
+            result[name] = {
+                "count": metrics.count,
+                "errors": metrics.errors,
+                "cache_hits": metrics.cache_hits,
+                "mean": metrics.total_seconds / metrics.count if metrics.count else 0.0,
+                "p50": percentile(samples, 0.50),
+                "p95": percentile(samples, 0.95),
+                "p99": percentile(samples, 0.99),
+                **metrics.counters,
+            }
+    return result
+
+def print_summary():
+    """Prints the per-stage latency table"""
+    stages = summary()
+    if not stages:
+        return
+    print(
+        f"{'Stage':<12}{'Count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'Errors':>8}{'Cache':>8}{'Retries':>9}"
+        f"{'Hedges':>8}{'Rejected':>10}{'Sent KB':>10}{'Recv KB':>10}"
+    )
+    for name, stats in stages.items():
+        print(
+            f"{name:<12}{stats['count']:>8}{stats['p50'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}"
+            f"{stats['p99'] * 1000:>10.1f}{stats['errors']:>8}{stats['cache_hits']:>8}{stats['retries']:>9}"
+            f"{stats['hedges']:>8}{stats['circuit_rejections']:>10}"
+            f"{stats['bytes_sent'] / 1024:>10.1f}{stats['bytes_received'] / 1024:>10.1f}"
+        )
+
+def reset():
+    """Clears the aggregated metrics, e.g. between benchmark runs"""
+    with _metrics_lock:
+        _metrics.clear()
+
+def start_prometheus_exporter(port=PROMETHEUS_PORT):
+    """Serves stage metrics for Prometheus on the given port"""
+    try:
+        import prometheus_client
+    except ImportError:
+        raise ImportError("PROMETHEUS_PORT requires prometheus-client, install it with: pip install prometheus-client")
+
+    durations = prometheus_client.Histogram(
+        "toll_pipeline_stage_seconds", "Duration of toll pipeline stages", ["stage"]
+    )
+    errors = prometheus_client.Counter("toll_pipeline_stage_errors_total", "Failed stages", ["stage"])
+    cache_hits = prometheus_client.Counter("toll_pipeline_cache_hits_total", "Stages served from a cache", ["stage"])
+    counters = {
+        name: prometheus_client.Counter(f"toll_pipeline_{name}_total", f"Sum of {name} per stage", ["stage"])
+        for name in COUNTERS
+    }
+
+    def export(span):
+        durations.labels(span["stage"]).observe(span["duration"])
+        if "error" in span:
+            errors.labels(span["stage"]).inc()
+        if span.get("cache_hit"):
+            cache_hits.labels(span["stage"]).inc()
+        for name, counter in counters.items():
+            if span.get(name):
+                counter.labels(span["stage"]).inc(span[name])
+
+    add_hook(export)
+    prometheus_client.start_http_server(port)
+
+if PROMETHEUS_PORT and INSTRUMENTATION_ENABLED:
+    start_prometheus_exporter()
@@ -0,0 +1,157 @@
+# Importing modules
+import json
+import os
+from array import array
+
+# JSON codec configuration
+# "auto" uses msgspec, then orjson, whichever is installed first, "msgspec", "orjson" or "json" force one
+JSON_CODEC = os.environ.get("JSON_CODEC", "auto")
+
+CODECS = ("msgspec", "orjson", "json")
+
+_codec = None
+_route_decoder = None
+
+# Pairs formatted per step of dumps_pairs, bounds the temporary integers and strings
+_PAIRS_CHUNK = 4096
+_PAIRS_FORMAT = "[%d,%d]," * _PAIRS_CHUNK
+
+def get_codec():
+    """Returns the name of the codec in use, resolved on first use"""
+    global _codec
+    if _codec is None:
+        _codec = _resolve_codec(JSON_CODEC)
+    return _codec
+
+def set_codec(name):
+    """Switches the codec, e.g. for benchmarks ("auto" resolves again)"""
+    global _codec, _route_decoder
+    _codec = _resolve_codec(name)
+    _route_decoder = None
+
+def _resolve_codec(name):
+    if name not in CODECS + ("auto",):
+        raise Exception(f"Unknown JSON codec '{name}', expected auto or one of {', '.join(CODECS)}")
+    if name == "json":
+        return name
+
+    if name != "auto":
+        try:
+            __import__(name)
+        except ImportError:
+            raise ImportError(f"JSON_CODEC={name} requires {name}, install it with: pip install {name}")
+        return name
+
+    for candidate in ("msgspec", "orjson"):
+        try:
+            __import__(candidate)
+            return candidate
+        except ImportError:
+            pass
+    return "json"
+
+def dumps(value):
+    """Encodes value as compact JSON bytes"""
+    codec = get_codec()
+    if codec == "msgspec":
+        import msgspec
+
+        return msgspec.json.encode(value)
+    if codec == "orjson":
+        import orjson
+
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+def dumps_pairs(first, second):
+    """
+    Encodes two equally long array('q') columns as a JSON array of pairs, e.g. locTimes
+
+    The same for every codec: the columns are interleaved into one array in C and formatted
+    _PAIRS_CHUNK pairs at a time into a bytearray, so no tuple or list is built per pair.
+    """
+    count = len(first)
+    if not count:
+        return b"[]"
+    interleaved = array("q", bytes(16 * count))
+    interleaved[0::2] = first
+    interleaved[1::2] = second
+
+    body = bytearray(b"[")
+    step = 2 * _PAIRS_CHUNK
+    for start in range(0, 2 * count, step):
+        values = interleaved[start:start + step]
+        fmt = _PAIRS_FORMAT if len(values) == step else "[%d,%d]," * (len(values) // 2)
+        body += (fmt % tuple(values)).encode()
+    # The trailing comma of the last pair closes the array
+    body[-1:] = b"]"
+    return bytes(body)
+
+def loads(content):
+    """Decodes JSON bytes (or str) into dicts and lists"""
+    codec = get_codec()
+    if codec == "msgspec":
+        import msgspec
+
+        return msgspec.json.decode(content)
+    if codec == "orjson":
+        import orjson
+
+        return orjson.loads(content)
+    return json.loads(content)
+
+def _build_route_decoder():
+    """
+    msgspec decoder for HERE routing responses that only materializes the fields the pipeline uses
+
+    Everything else in the response (instructions, lengths, transport, ids, ...) is skipped while
+    parsing. The error fields HERE sends instead of routes are kept for the error messages.
+    """
+    from typing import Any, List, TypedDict
+
+    import msgspec
+
+    Time = TypedDict("Time", {"time": str}, total=False)
+    Action = TypedDict("Action", {"offset": int, "duration": int}, total=False)
+    Summary = TypedDict("Summary", {"length": int, "duration": int}, total=False)
+    Section = TypedDict(
+        "Section",
+        {"polyline": str, "actions": List[Action], "departure": Time, "arrival": Time, "summary": Summary},
+        total=False,
+    )
+    Route = TypedDict("Route", {"sections": List[Section]}, total=False)
+    Response = TypedDict(
+        "Response",
+        {
+            "routes": List[Route],
+            "notices": Any,
+            "title": Any,
+            "status": Any,
+            "cause": Any,
+            "error": Any,
+            "error_description": Any,
+        },
+        total=False,
+    )
+    return msgspec.json.Decoder(Response)
+
+def loads_route(content):
+    """
+    Decodes a HERE routing response
+
+    With msgspec only routes -> sections -> polyline, actions (offset, duration), departure, arrival and
+    summary (length, duration) are decoded; the other codecs decode the whole response. A response that
+    does not match the expected shape is decoded in full, so its error details are not lost.
+    """
+    global _route_decoder
+    if get_codec() != "msgspec":
+        return loads(content)
+
+    import msgspec
+
+    if _route_decoder is None:
+        _route_decoder = _build_route_decoder()
+    try:
+        return _route_decoder.decode(content)
+    except msgspec.ValidationError:
+        return loads(content)
@@ -0,0 +1,363 @@
+# Importing modules
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from Here_Maps import (
+    DEFAULT_VEHICLE_TYPE,
+    fetch_rates_from_tollguru,
+    get_geocodes_for_addresses,
+    get_rates_from_tollguru,
+    get_routes_from_here_maps,
+    wait_for_refreshes,
+)
+from batch_io import read_rows
+from geocode_cache import normalize_address
+from loc_times import LocTimes
+from simplify import POLYLINE_SIMPLIFY_TOLERANCE, simplify_route
+from toll_cache import WEEK, departure_bucket
+
+# Lane table configuration
+LANE_TABLE_PATH = os.environ.get("LANE_TABLE_PATH", str(Path(__file__).parent / ".cache" / "lanes.sqlite"))
+# Departure times within the same bucket of the week (seconds) share one precomputed cost
+LANE_TABLE_TIME_BUCKET = int(os.environ.get("LANE_TABLE_TIME_BUCKET", 60 * 60))
+LANE_TABLE_TTL = int(os.environ.get("LANE_TABLE_TTL", 7 * 24 * 60 * 60))  # seconds before refresh_lanes re-rates an entry
+LANE_TABLE_WORKERS = int(os.environ.get("LANE_TABLE_WORKERS", 8))  # concurrent HERE and TollGuru requests
+
+def lane_key(source, destination, vehicle_type):
+    return f"{normalize_address(source)}|{normalize_address(destination)}|{vehicle_type}"
+
+def bucket_departure(bucket, bucket_size=LANE_TABLE_TIME_BUCKET, now=None):
+    """Start of the next occurrence of a bucket of the week (the current one if it has not ended yet)"""
+    now = time.time() if now is None else now
+    departure = int(now - now % WEEK) + bucket * bucket_size
+    if departure + bucket_size <= now:
+        departure += WEEK
+    return departure
+
+class LaneTable:
+    """
+    Precomputed tolls of known lanes, stored in SQLite and indexed in memory
+
+    The routes table holds one row per lane (source, destination, vehicle type) with its polyline and
+    its locTimes as a template relative to the departure, so the lane can be rated for any departure
+    without routing it again. The tolls table holds the TollGuru costs per lane and departure bucket.
+    The costs are loaded into a dict on first lookup, so known lanes are answered without SQLite.
+
+    Args:
+        path: SQLite file path, or None to keep the table in memory only
+        bucket_size: Seconds per departure bucket of the week
+        ttl: Seconds after which an entry is returned by stale_entries
+    """
+
+    def __init__(self, path=LANE_TABLE_PATH, bucket_size=LANE_TABLE_TIME_BUCKET, ttl=LANE_TABLE_TTL):
+        self.path = path
+        self.bucket_size = bucket_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._index = None
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connection(self):
+        # Must be called with self._lock held
+        if self._db is None:
+            if self.path:
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.path or ":memory:", check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS routes (lane TEXT PRIMARY KEY, source TEXT, destination TEXT, "
+                "vehicle_type TEXT, polyline TEXT, offsets BLOB, times BLOB, created_at REAL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tolls (lane TEXT, bucket INTEGER, costs TEXT, created_at REAL, "
+                "PRIMARY KEY (lane, bucket))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS tolls_created_at ON tolls (created_at)")
+            self._db.commit()
+        return self._db
+
+    def _load(self):
+        # Must be called with self._lock held
+        if self._index is None:
+            rows = self._connection().execute("SELECT lane, bucket, costs FROM tolls")
+            self._index = {(lane, bucket): json.loads(costs) for lane, bucket, costs in rows}
+        return self._index
+
+    def bucket(self, departure_epoch=None):
+        return departure_bucket(departure_epoch, self.bucket_size)
+
+    def lookup(self, source, destination, vehicle_type=DEFAULT_VEHICLE_TYPE, departure_epoch=None):
+        """Returns the precomputed costs of a lane for the departure (now by default), None if unknown"""
+        key = (lane_key(source, destination, vehicle_type), self.bucket(departure_epoch))
+        with self._lock:
+            costs = self._load().get(key)
+            if costs is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return costs
+
+    def route(self, source, destination, vehicle_type=DEFAULT_VEHICLE_TYPE):
+        """Returns the stored (polyline, locTimes template) of a lane, None if it was never routed"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT polyline, offsets, times FROM routes WHERE lane = ?", (lane_key(source, destination, vehicle_type),)
+            ).fetchone()
+        if row is None:
+            return None
+        offsets, times = array("q"), array("q")
+        offsets.frombytes(row[1])
+        times.frombytes(row[2])
+        return row[0], LocTimes(offsets, times)
+
+    def set_route(self, source, destination, vehicle_type, polyline, template):
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    lane_key(source, destination, vehicle_type), source, destination, vehicle_type, polyline,
+                    template.offsets.tobytes(), template.timestamps.tobytes(), time.time(),
+                ),
+            )
+            db.commit()
+
+    def set_costs(self, source, destination, vehicle_type, bucket, costs):
+        key = lane_key(source, destination, vehicle_type)
+        with self._lock:
+            db = self._connection()
+            db.execute("INSERT OR REPLACE INTO tolls VALUES (?, ?, ?, ?)", (key, bucket, json.dumps(costs), time.time()))
+            db.commit()
+            if self._index is not None:
+                self._index[(key, bucket)] = costs
+
+    def stale_entries(self, limit=None):
+        """Returns (source, destination, vehicle type, bucket) of entries older than ttl, oldest first"""
+        with self._lock:
+            return self._connection().execute(
+                "SELECT r.source, r.destination, r.vehicle_type, t.bucket FROM tolls t JOIN routes r ON r.lane = t.lane "
+                "WHERE t.created_at < ? ORDER BY t.created_at LIMIT ?",
+                (time.time() - self.ttl, -1 if limit is None else limit),
+            ).fetchall()
+
+    def stats(self):
+        """Returns lookup hits/misses, the hit rate and the number of lanes and entries"""
+        with self._lock:
+            db = self._connection()
+            lanes = db.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+            entries = db.execute("SELECT COUNT(*) FROM tolls").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "lanes": lanes,
+            "entries": entries,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+# Shared table used by get_tolls and the command line
+lane_table = LaneTable()
+
+def route_lane(source, destination, vehicle_type, position=None, table=None):
+    """
+    Routes a lane with HERE and stores its polyline and locTimes template
+
+    Args:
+        position: Optional (source latitude, source longitude, destination latitude, destination longitude),
+            the addresses are geocoded when omitted
+    """
+    table = table or lane_table
+    if position is None:
+        positions, errors = get_geocodes_for_addresses([source, destination])
+        if errors:
+            raise Exception(next(iter(errors.values())))
+        position = (*positions[normalize_address(source)], *positions[normalize_address(destination)])
+    routes, _ = get_routes_from_here_maps(*position, vehicle_type, 0)
+    polyline, loc_times = routes[0]["polyline"], routes[0]["loc_times"]
+    if POLYLINE_SIMPLIFY_TOLERANCE > 0:
+        polyline, loc_times, _ = simplify_route(polyline, loc_times)
+    template = loc_times.shifted(-loc_times.departure) if len(loc_times) else loc_times
+    table.set_route(source, destination, vehicle_type, polyline, template)
+    return polyline, template
+
+def rate_lane(source, destination, vehicle_type, bucket, route, table=None, refresh=False):
+    """
+    Rates a routed lane for the start of a departure bucket and stores the costs
+
+    With `refresh` TollGuru is always called: the toll cache could return stale or fallback costs,
+    which would then be stored as if they were new.
+    """
+    table = table or lane_table
+    polyline, template = route
+    departure = bucket_departure(bucket, table.bucket_size)
+    rate = fetch_rates_from_tollguru if refresh else get_rates_from_tollguru
+    costs = rate(polyline, template.shifted(departure) if len(template) else None, vehicle_type)
+    table.set_costs(source, destination, vehicle_type, bucket, costs)
+    return costs
+
+def precompute_lanes(lanes, buckets=None, table=None, max_workers=LANE_TABLE_WORKERS):
+    """
+    Runs the full pipeline for a lane list and stores every lane in the lane table
+
+    Every distinct address is geocoded once, every lane is routed once and then rated for every bucket
+    from its locTimes template.
+
+    Args:
+        lanes: Iterable of (source, destination, vehicle_type) tuples
+        buckets: Departure buckets of the week to rate, the current bucket by default
+
+    Returns:
+        dict with the number of "lanes" and "entries" stored and "errors" ({lane: message})
+    """
+    table = table or lane_table
+    lanes = list(dict.fromkeys(lanes))
+    buckets = [table.bucket()] if buckets is None else list(buckets)
+    positions, geocode_errors = get_geocodes_for_addresses(
+        [address for lane in lanes for address in lane[:2]], max_workers
+    )
+    result = {"lanes": 0, "entries": 0, "errors": {}}
+
+    def route(lane):
+        source, destination, vehicle_type = lane
+        for address in (source, destination):
+            if normalize_address(address) in geocode_errors:
+                raise Exception(geocode_errors[normalize_address(address)])
+        position = (*positions[normalize_address(source)], *positions[normalize_address(destination)])
+        return route_lane(source, destination, vehicle_type, position, table)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        route_futures = {lane: executor.submit(route, lane) for lane in lanes}
+        rate_futures = []
+        # The buckets of a lane are rated as soon as its route is ready
+        for lane, future in route_futures.items():
+            try:
+                lane_route = future.result()
+            except Exception as e:
+                result["errors"][lane] = f"Routing failed: {e}"
+                continue
+            result["lanes"] += 1
+            for bucket in buckets:
+                rate_futures.append((lane, executor.submit(rate_lane, *lane, bucket, lane_route, table)))
+
+        for lane, future in rate_futures:
+            try:
+                future.result()
+                result["entries"] += 1
+            except Exception as e:
+                result["errors"][lane] = str(e)
+    return result
+
+def refresh_lanes(table=None, limit=None, max_workers=LANE_TABLE_WORKERS):
+    """
+    Re-rates the entries older than the table TTL, oldest first, from their stored locTimes templates
+
+    Routes are not requested again, use precompute_lanes to re-route lanes. The costs are always
+    requested from TollGuru, not from the toll cache.
+
+    Returns:
+        dict with the number of "entries" refreshed and "errors" ({(lane, bucket): message})
+    """
+    table = table or lane_table
+    result = {"entries": 0, "errors": {}}
+
+    def refresh(entry):
+        source, destination, vehicle_type, bucket = entry
+        rate_lane(
+            source, destination, vehicle_type, bucket, table.route(source, destination, vehicle_type), table, refresh=True
+        )
+
+    entries = table.stale_entries(limit)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for entry, future in [(entry, executor.submit(refresh, entry)) for entry in entries]:
+            try:
+                future.result()
+                result["entries"] += 1
+            except Exception as e:
+                result["errors"][(entry[:3], entry[3])] = str(e)
+    return result
+
+def get_tolls(source, destination, vehicle_type=DEFAULT_VEHICLE_TYPE, departure_epoch=None, table=None):
+    """
+    Returns the TollGuru costs of a lane, from the lane table when it is known
+
+    On a miss the lane is rated live (routed too if it was never routed) and the result is stored, so
+    the next lookup of the same lane and bucket is a hit.
+    """
+    table = table or lane_table
+    costs = table.lookup(source, destination, vehicle_type, departure_epoch)
+    if costs is not None:
+        return costs
+    route = table.route(source, destination, vehicle_type) or route_lane(source, destination, vehicle_type, table=table)
+    return rate_lane(source, destination, vehicle_type, table.bucket(departure_epoch), route, table)
+
+def read_lanes(path):
+    """Reads (source, destination, vehicle type) lanes from a CSV in the testCases.csv format"""
+    for count, row in read_rows(path):
+        if count == 0:
+            continue
+        yield row[1], row[2], row[4] if len(row) > 4 and row[4] else DEFAULT_VEHICLE_TYPE
+
+def parse_buckets(value, bucket_size=LANE_TABLE_TIME_BUCKET):
+    """Parses --buckets: "current", "all" or comma-separated bucket numbers"""
+    if value == "current":
+        return None
+    if value == "all":
+        return range(WEEK // bucket_size)
+    return [int(bucket) for bucket in value.split(",")]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute and look up the tolls of known lanes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    precompute = commands.add_parser("precompute", help="Route and rate every lane of a CSV file")
+    precompute.add_argument("input", help="CSV file in the testCases.csv format")
+    precompute.add_argument(
+        "--buckets", default="current",
+        help="Departure buckets of the week to rate: current (default), all or comma-separated bucket numbers",
+    )
+    refresh = commands.add_parser("refresh", help=f"Re-rate entries older than LANE_TABLE_TTL ({LANE_TABLE_TTL}s)")
+    refresh.add_argument("--limit", type=int, help="Maximum number of entries to refresh")
+    lookup = commands.add_parser("lookup", help="Print the tolls of one lane, rated live if it is unknown")
+    lookup.add_argument("--source", required=True)
+    lookup.add_argument("--destination", required=True)
+    lookup.add_argument("--vehicle-type", default=DEFAULT_VEHICLE_TYPE)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.time()
+    try:
+        if args.command == "precompute":
+            result = precompute_lanes(read_lanes(args.input), parse_buckets(args.buckets))
+            print(f"Precomputed {result['entries']} entries for {result['lanes']} lanes in {time.time() - start:.2f}s")
+        elif args.command == "refresh":
+            result = refresh_lanes(limit=args.limit)
+            print(f"Refreshed {result['entries']} entries in {time.time() - start:.2f}s")
+        else:
+            result = get_tolls(args.source, args.destination, args.vehicle_type)
+            print(f"{args.source} → {args.destination} ({args.vehicle_type}): {result}")
+            return result
+        for key, error in result["errors"].items():
+            print(f"  ❌ {key}: {error}")
+        stats = lane_table.stats()
+        print(f"Lane table: {stats['lanes']} lanes, {stats['entries']} entries")
+        return result
+    finally:
+        wait_for_refreshes()
+        lane_table.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Importing modules
+import os
+from array import array
+from itertools import accumulate, repeat
+from operator import add, floordiv, itemgetter
+
+import json_codec
+
+# locTimes configuration
+# Send a locTimes entry for every polyline vertex instead of one per HERE action (see LocTimes.per_vertex)
+LOC_TIMES_PER_VERTEX = os.environ.get("LOC_TIMES_PER_VERTEX", "0") == "1"
+
+_get_offset = itemgetter("offset")
+_get_duration = itemgetter("duration")
+
+class LocTimes:
+    """
+    TollGuru locTimes ([[vertex index, epoch seconds], ...]) stored as two array('q') columns
+
+    Eight bytes per value instead of a list and two int objects per entry, which matters once routes are
+    timed per vertex. Iterating yields (offset, timestamp) pairs, so code written for the list format
+    keeps working.
+    """
+
+    __slots__ = ("offsets", "timestamps")
+
+    def __init__(self, offsets=None, timestamps=None):
+        self.offsets = offsets if offsets is not None else array("q")
+        self.timestamps = timestamps if timestamps is not None else array("q")
+        if len(self.offsets) != len(self.timestamps):
+            raise ValueError("offsets and timestamps must have the same length")
+
+    @classmethod
+    def from_actions(cls, actions, departure_epoch):
+        """
+        Times HERE actions from the departure time
+
+        Every action is stamped with the departure time plus the durations of the actions before it,
+        the running sum is computed by itertools.accumulate straight into the array.
+        """
+        return cls.from_durations(
+            array("q", map(_get_offset, actions)), array("q", map(_get_duration, actions)), departure_epoch
+        )
+
+    @classmethod
+    def from_durations(cls, offsets, durations, departure_epoch):
+        """Same as from_actions for action offsets and durations that are already in arrays"""
+        timestamps = array("q", accumulate(durations[:-1], initial=departure_epoch)) if len(offsets) else array("q")
+        return cls(offsets, timestamps)
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Builds LocTimes from the list format"""
+        return cls(array("q", map(itemgetter(0), pairs)), array("q", map(itemgetter(1), pairs)))
+
+    @classmethod
+    def coerce(cls, value):
+        """Returns value unchanged if it already is LocTimes, otherwise converts the list format"""
+        return value if isinstance(value, cls) else cls.from_pairs(value)
+
+    @classmethod
+    def concatenate(cls, parts, shifts):
+        """Joins the locTimes of route sections, adding each section's start vertex to its offsets"""
+        offsets = array("q")
+        timestamps = array("q")
+        for part, shift in zip(parts, shifts):
+            offsets.extend(map(add, part.offsets, repeat(shift)) if shift else part.offsets)
+            timestamps.extend(part.timestamps)
+        return cls(offsets, timestamps)
+
+    def shifted(self, seconds):
+        """Returns a copy with every timestamp moved by `seconds`, e.g. to re-time a route for another departure"""
+        return LocTimes(array("q", self.offsets), array("q", map(add, self.timestamps, repeat(seconds))))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        return zip(self.offsets, self.timestamps)
+
+    def __eq__(self, other):
+        if isinstance(other, LocTimes):
+            return self.offsets == other.offsets and self.timestamps == other.timestamps
+        return NotImplemented
+
+    @property
+    def departure(self):
+        """Timestamp of the first entry, None when empty"""
+        return self.timestamps[0] if len(self.timestamps) else None
+
+    def __repr__(self):
+        return f"LocTimes({len(self)} entries)"
+
+    def per_vertex(self):
+        """
+        Interpolates a timestamp for every vertex from the first to the last timed vertex
+
+        Vertices between two timed vertices are timed linearly by vertex index. Entries sharing one
+        vertex (a section's arrival and the next section's departure) are all kept, so waits survive.
+        """
+        offsets = array("q")
+        timestamps = array("q")
+        last = len(self.offsets) - 1
+        for index in range(last):
+            start, end = self.offsets[index], self.offsets[index + 1]
+            count = end - start
+            if count <= 0:
+                offsets.append(start)
+                timestamps.append(self.timestamps[index])
+                continue
+            time = self.timestamps[index]
+            elapsed = self.timestamps[index + 1] - time
+            offsets.extend(range(start, end))
+            if elapsed > 0:
+                # time + step * elapsed // count for every step, without a Python level loop
+                timestamps.extend(map(add, repeat(time), map(floordiv, range(0, count * elapsed, elapsed), repeat(count))))
+            else:
+                timestamps.extend(repeat(time, count))
+        if last >= 0:
+            offsets.append(self.offsets[last])
+            timestamps.append(self.timestamps[last])
+        return LocTimes(offsets, timestamps)
+
+    def to_list(self):
+        """Returns the list format, [[offset, timestamp], ...]"""
+        return [[offset, timestamp] for offset, timestamp in self]
+
+    def to_json(self):
+        """Serializes to the JSON array TollGuru expects (as bytes), without building the list format first"""
+        return json_codec.dumps_pairs(self.offsets, self.timestamps)
+
+def dumps_payload(payload, loc_times=None):
+    """
+    Encodes a TollGuru request body, appending locTimes as a pre-serialized JSON array
+
+    Returns:
+        UTF-8 encoded JSON body, also used as the de-duplication key of the request
+    """
+    body = json_codec.dumps(payload)
+    if loc_times:
+        separator = b"," if payload else b""
+        body = b"".join((body[:-1], separator, b'"locTimes":', LocTimes.coerce(loc_times).to_json(), b"}"))
+    return body
@@ -0,0 +1,110 @@
+# Importing modules
+import os
+import threading
+import time
+
+# Endpoint names used by the get_* functions when calling http_client
+HERE_GEOCODE = "here_geocode"
+HERE_ROUTING = "here_routing"
+TOLLGURU = "tollguru"
+
+class TokenBucket:
+    """
+    Token bucket shared by every worker calling one endpoint
+
+    Callers reserve a token and sleep until it is available, so concurrent workers are spread out at
+    `rate` requests per second with bursts of up to `burst` requests.
+
+    Args:
+        rate: Sustained requests per second, 0 disables the QPS limit (Retry-After pauses still apply)
+        burst: Maximum number of tokens the bucket holds
+    """
+
+    def __init__(self, rate=0.0, burst=1):
+        self.rate = float(rate)
+        self.burst = max(int(burst), 1)
+        self.acquired = 0
+        self.throttled = 0  # requests that had to wait
+        self.throttled_seconds = 0.0
+        self.penalties = 0
+        self._tokens = float(self.burst)
+        # Time the token count refers to, in the future while the endpoint is paused by Retry-After
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # Must be called with self._lock held
+        if now > self._updated:
+            if self.rate > 0:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def _reserve(self):
+        """Takes one token and returns how many seconds the caller has to wait for it"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            wait = self._updated - now
+            if self.rate > 0:
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait += -self._tokens / self.rate
+
+            self.acquired += 1
+            if wait > 0:
+                self.throttled += 1
+                self.throttled_seconds += wait
+            return wait
+
+    def acquire(self):
+        """Blocks until a request may be sent"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Waits on the event loop until a request may be sent"""
+        import asyncio  # only async callers pay for importing asyncio
+
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def penalize(self, seconds):
+        """Pauses the endpoint for `seconds`, e.g. from a 429 Retry-After header"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            resume_at = now + seconds
+            if resume_at > self._updated:
+                self._updated = resume_at
+                self._tokens = min(self._tokens, 0.0)
+            self.penalties += 1
+
+    def stats(self):
+        """Returns request and throttling counters"""
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "throttled_seconds": self.throttled_seconds,
+            "penalties": self.penalties,
+        }
+
+def limiter_from_env(endpoint):
+    """Builds the bucket for an endpoint from RATE_LIMIT_<ENDPOINT>_QPS and RATE_LIMIT_<ENDPOINT>_BURST"""
+    prefix = f"RATE_LIMIT_{endpoint.upper()}"
+    rate = float(os.environ.get(f"{prefix}_QPS", 0))
+    burst = int(os.environ.get(f"{prefix}_BURST", max(rate, 1)))
+    return TokenBucket(rate, burst)
+
+# One shared bucket per endpoint, used by every worker of a batch run
+limiters = {endpoint: limiter_from_env(endpoint) for endpoint in (HERE_GEOCODE, HERE_ROUTING, TOLLGURU)}
+
+def get_limiter(endpoint):
+    """Returns the shared bucket for the endpoint name, or None for unknown endpoints"""
+    if endpoint is None:
+        return None
+    return limiters.get(endpoint)
@@ -0,0 +1,80 @@
+# Importing modules
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Cache configuration
+ROUTE_CACHE_PRECISION = int(os.environ.get("ROUTE_CACHE_PRECISION", 5))  # decimal places, 5 is about 1.1 m
+ROUTE_CACHE_SIZE = int(os.environ.get("ROUTE_CACHE_SIZE", 1000))  # entries
+ROUTE_CACHE_TTL = int(os.environ.get("ROUTE_CACHE_TTL", 60 * 60))  # seconds, HERE routes depend on traffic
+ROUTE_CACHE_ENABLED = os.environ.get("ROUTE_CACHE_ENABLED", "1") != "0"
+
+def route_cache_key(
+    source_latitude, source_longitude, destination_latitude, destination_longitude, transport_mode,
+    alternatives=0, precision=ROUTE_CACHE_PRECISION,
+):
+    """Builds a content hash from the rounded coordinates, the HERE transport mode and the number of alternatives"""
+    coordinates = (source_latitude, source_longitude, destination_latitude, destination_longitude)
+    rounded = ",".join(f"{float(value):.{precision}f}" for value in coordinates)
+    return hashlib.sha256(f"{rounded}|{transport_mode}|{alternatives}".encode()).hexdigest()
+
+class RouteCache:
+    """
+    In-memory LRU cache of HERE route data
+
+    Entries hold the HereRoute objects of a response (see here_route.py), so only the fields the toll
+    flow needs are kept. They are shared by every lane served from the cache and must not be modified.
+
+    Args:
+        max_size: Maximum number of routes kept, the least recently used route is evicted first
+        ttl: Seconds after which a cached route is refetched (0 disables expiry)
+
+    Keys are built with route_cache_key.
+    """
+
+    def __init__(self, max_size=ROUTE_CACHE_SIZE, ttl=ROUTE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached route dict for the key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl > 0 and time.time() - entry["cached_at"] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, routes):
+        """Stores the HereRoute list of a HERE v8 response and evicts the least recently used entries above max_size"""
+        with self._lock:
+            self._entries[key] = {"routes": routes, "cached_at": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Returns hit/miss counters and the hit rate"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+# Shared cache instance used by get_polyline_from_here_maps (None when caching is disabled)
+route_cache = RouteCache() if ROUTE_CACHE_ENABLED else None
@@ -0,0 +1,117 @@
+# Helpers shared by Here_Maps.py, the Testing scripts and async_pipeline.py
+from datetime import datetime
+
+from flex_transcode import flexpolyline_to_google, join_google_polylines
+from loc_times import LOC_TIMES_PER_VERTEX, LocTimes
+
+# Vehicle type mapping: Maps TollGuru vehicle types to HERE Maps transport modes
+TOLLGURU_TYPE_TO_CATEGORY = {
+    # Car / SUV / Pickup / EV / similar
+    "2AxlesAuto": "car",
+    "3AxlesAuto": "car",
+    "4AxlesAuto": "car",
+    "2AxlesDualTire": "car",
+    "3AxlesDualTire": "car",
+    "4AxlesDualTire": "car",
+    "2AxlesEV": "car",
+    "3AxlesEV": "car",
+    "4AxlesEV": "car",
+    # Rideshare/Taxi/Carpool
+    "2AxlesTNC": "car",
+    "2AxlesTNCPool": "car",
+    "2AxlesTaxi": "car",
+    "2AxlesTaxiPool": "car",
+    "Carpool2": "car",
+    "Carpool3": "car",
+    # Truck
+    "2AxlesTruck": "truck",
+    "3AxlesTruck": "truck",
+    "4AxlesTruck": "truck",
+    "5AxlesTruck": "truck",
+    "6AxlesTruck": "truck",
+    "7AxlesTruck": "truck",
+    "8AxlesTruck": "truck",
+    "9AxlesTruck": "truck",
+    # Bus
+    "2AxlesBus": "bus",
+    "3AxlesBus": "bus",
+    # RV
+    "2AxlesRv": "car",
+    "3AxlesRv": "car",
+    "4AxlesRv": "car",
+}
+
+# Payment methods of the TollGuru costs dict, the columns of the vehicle type x payment method matrix
+PAYMENT_METHODS = ("tag", "cash", "licensePlate", "prepaidCard", "creditCard")
+
+def get_transport_mode(vehicle_type):
+    """Gets the HERE Maps transport mode from TollGuru vehicle type"""
+    if not vehicle_type:
+        print("Warning: No vehicle type provided, defaulting to 'car'")
+        return "car"
+
+    transport_mode = TOLLGURU_TYPE_TO_CATEGORY.get(vehicle_type)
+
+    if not transport_mode:
+        print(f"Warning: Unknown vehicle type '{vehicle_type}', defaulting to 'car'")
+        return "car"
+
+    return transport_mode
+
+def iso_to_epoch(iso_timestamp):
+    """Converts ISO timestamp string to Unix epoch timestamp (seconds)"""
+    return int(datetime.fromisoformat(iso_timestamp.replace('Z', '+00:00')).timestamp())
+
+def route_polyline(route):
+    """
+    Transcodes every section of a HereRoute and joins them into one encoded(google) polyline
+
+    Returns:
+        (polyline, index of the first vertex of every section in the polyline)
+    """
+    return join_google_polylines(
+        [flexpolyline_to_google(section.polyline.decode("ascii")) for section in route.sections]
+    )
+
+def route_loc_times(route, section_starts, per_vertex=LOC_TIMES_PER_VERTEX):
+    """
+    Generates the locTimes of a whole HereRoute as LocTimes
+
+    Every section is timed from its own departure time (so waits, e.g. for a ferry, are kept) and its
+    action offsets are shifted by the section's start index from route_polyline. With `per_vertex` the
+    timestamps are interpolated onto every vertex between the actions.
+    """
+    return join_loc_times([section.loc_times() for section in route.sections], section_starts, per_vertex)
+
+def join_loc_times(sections, section_starts, per_vertex=LOC_TIMES_PER_VERTEX):
+    """Joins the LocTimes of every section of a route, see route_loc_times"""
+    loc_times = sections[0] if len(sections) == 1 else LocTimes.concatenate(sections, section_starts)
+    return loc_times.per_vertex() if per_vertex else loc_times
+
+def toll_cost(costs):
+    """Lowest toll cost of a TollGuru costs dict, used to rank routes (0 for a route without tolls)"""
+    if costs.get("minimumTollCost") is not None:
+        return costs["minimumTollCost"]
+    values = [costs[key] for key in PAYMENT_METHODS if costs.get(key) is not None]
+    return min(values) if values else 0
+
+def group_vehicle_types(vehicle_types):
+    """Groups TollGuru vehicle types by HERE transport mode, so every mode is routed once"""
+    groups = {}
+    for vehicle_type in vehicle_types:
+        groups.setdefault(get_transport_mode(vehicle_type), []).append(vehicle_type)
+    return groups
+
+def cost_matrix_row(costs):
+    """Cost per payment method of a TollGuru costs dict, None where the method is not available"""
+    return {method: costs.get(method) for method in PAYMENT_METHODS}
+
+def rank_routes(routes):
+    """Sorts rated route dicts by toll cost, then by duration; routes that failed to rate come last"""
+    def key(route):
+        if "costs" not in route:
+            return (1, 0, 0)
+        duration = route["duration"] if route["duration"] is not None else float("inf")
+        return (0, toll_cost(route["costs"]), duration)
+
+    return sorted(routes, key=key)
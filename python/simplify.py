@@ -0,0 +1,128 @@
+# Importing modules
+import math
+import os
+from array import array
+from bisect import bisect_right
+
+from instrumentation import annotate, stage
+from loc_times import LocTimes
+
+# Simplification configuration
+# Maximum distance in meters a removed vertex may lie from the simplified line, 0 disables simplification
+POLYLINE_SIMPLIFY_TOLERANCE = float(os.environ.get("POLYLINE_SIMPLIFY_TOLERANCE", 0))
+# Rate both the full and the simplified polyline and report the cost difference
+POLYLINE_SIMPLIFY_VALIDATE = os.environ.get("POLYLINE_SIMPLIFY_VALIDATE", "0") == "1"
+
+EARTH_RADIUS_METERS = 6371008.8
+
+def _to_meters(points):
+    """Projects (lat, lng) points to a local equirectangular plane in meters"""
+    reference_latitude = math.radians(sum(point[0] for point in points) / len(points))
+    x_scale = EARTH_RADIUS_METERS * math.cos(reference_latitude) * math.pi / 180
+    y_scale = EARTH_RADIUS_METERS * math.pi / 180
+    return [(lng * x_scale, lat * y_scale) for lat, lng in points]
+
+def _segment_distance(point, start, end):
+    """Distance in meters from point to the segment start-end"""
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    if dx == 0 and dy == 0:
+        return math.hypot(point[0] - start[0], point[1] - start[1])
+    t = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / (dx * dx + dy * dy)
+    t = max(0.0, min(1.0, t))
+    return math.hypot(point[0] - start[0] - t * dx, point[1] - start[1] - t * dy)
+
+def douglas_peucker(points, tolerance_meters, keep_indices=()):
+    """
+    Douglas-Peucker simplification
+
+    Args:
+        points: List of (lat, lng) tuples
+        tolerance_meters: Maximum distance a removed vertex may lie from the simplified line
+        keep_indices: Vertex indices that must survive, e.g. the offsets of HERE actions
+
+    Returns:
+        Sorted list of the indices of the vertices that are kept
+    """
+    count = len(points)
+    if count < 3:
+        return list(range(count))
+
+    projected = _to_meters(points)
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    for index in keep_indices:
+        if 0 <= index < count:
+            keep[index] = True
+
+    # Forced vertices split the line into independent runs, each simplified with an explicit stack
+    anchors = [index for index in range(count) if keep[index]]
+    stack = list(zip(anchors, anchors[1:]))
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        max_distance, max_index = -1.0, first
+        for index in range(first + 1, last):
+            distance = _segment_distance(projected[index], projected[first], projected[last])
+            if distance > max_distance:
+                max_distance, max_index = distance, index
+        if max_distance > tolerance_meters:
+            keep[max_index] = True
+            stack.append((first, max_index))
+            stack.append((max_index, last))
+
+    return [index for index in range(count) if keep[index]]
+
+def remap_loc_times(loc_times, kept_indices):
+    """
+    Maps locTimes offsets from original vertex indices onto the simplified vertex indices
+
+    An offset whose vertex was removed maps to the closest kept vertex before it.
+    """
+    loc_times = LocTimes.coerce(loc_times)
+    offsets = array("q", (max(bisect_right(kept_indices, offset) - 1, 0) for offset in loc_times.offsets))
+    return LocTimes(offsets, loc_times.timestamps)
+
+def simplify_polyline(polyline, tolerance_meters, keep_indices=()):
+    """
+    Decodes, simplifies and re-encodes a Google encoded polyline
+
+    Returns:
+        (simplified polyline, kept vertex indices, original vertex count)
+    """
+    import polyline as poly  # imported on first use, like requests in http_client
+
+    points = poly.decode(polyline)
+    kept_indices = douglas_peucker(points, tolerance_meters, keep_indices)
+    return poly.encode([points[index] for index in kept_indices]), kept_indices, len(points)
+
+def simplify_route(polyline, loc_times, tolerance_meters=POLYLINE_SIMPLIFY_TOLERANCE):
+    """
+    Simplifies an encoded polyline before it is sent to TollGuru
+
+    Vertices referenced by locTimes are always kept, so every timestamp stays on the same location.
+    Long polylines are simplified in the CPU pool when it is enabled (see cpu_pool.py).
+
+    Returns:
+        (simplified polyline, remapped locTimes, stats dict with vertex and character counts)
+    """
+    import cpu_pool
+
+    with stage("simplify"):
+        offsets = LocTimes.coerce(loc_times).offsets if loc_times else []
+        if cpu_pool.should_offload(len(polyline)):
+            annotate(offloaded=True)
+            simplified, kept_indices, vertex_count = cpu_pool.simplify_polyline(polyline, tolerance_meters, offsets)
+        else:
+            simplified, kept_indices, vertex_count = simplify_polyline(polyline, tolerance_meters, offsets)
+        simplified_loc_times = remap_loc_times(loc_times, kept_indices) if loc_times else loc_times
+        annotate(original_vertices=vertex_count, simplified_vertices=len(kept_indices))
+
+    stats = {
+        "original_vertices": vertex_count,
+        "simplified_vertices": len(kept_indices),
+        "original_chars": len(polyline),
+        "simplified_chars": len(simplified),
+        "reduction": 1 - len(simplified) / len(polyline) if polyline else 0.0,
+    }
+    return simplified, simplified_loc_times, stats
@@ -0,0 +1,120 @@
+# Importing modules
+import hashlib
+import json
+import threading
+
+from instrumentation import annotate
+
+class _Call:
+    """One outstanding call and the result every waiting caller receives"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class _AsyncCall:
+    """One outstanding async call: the task running it and how many callers await it"""
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls into one
+
+    While a call for a key is in flight, other callers with the same key wait for it and receive its
+    result (or its exception) instead of sending their own request. Nothing is kept once the call
+    finishes, caching is left to geocode_cache and route_cache.
+    """
+
+    def __init__(self):
+        self.executed = 0  # calls that reached the API
+        self.shared = 0  # calls served by another caller's request
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args, **kwargs):
+        """Runs function(*args, **kwargs) unless a call for the key is already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            annotate(single_flight_shared=True)
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def do_async(self, key, function, *args, **kwargs):
+        """
+        Async counterpart of do, `function` is a coroutine function
+
+        The call runs in its own task that every caller (including the first) awaits through
+        asyncio.shield, so cancelling one caller does not cancel the others. The task is cancelled
+        once no caller is waiting for it any more.
+        """
+        import asyncio  # only async callers pay for importing asyncio
+
+        flight_key = (id(asyncio.get_running_loop()), key)
+        call = self._async_calls.get(flight_key)
+        if call is not None:
+            self.shared += 1
+            annotate(single_flight_shared=True)
+        else:
+            self.executed += 1
+            call = self._async_calls[flight_key] = _AsyncCall(asyncio.ensure_future(function(*args, **kwargs)))
+            call.task.add_done_callback(lambda task, call=call: self._finish_async(flight_key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                # Every caller was cancelled, nobody needs the result
+                self._forget_async(flight_key, call)
+                call.task.cancel()
+
+    def _forget_async(self, flight_key, call):
+        if self._async_calls.get(flight_key) is call:
+            del self._async_calls[flight_key]
+
+    def _finish_async(self, flight_key, call):
+        self._forget_async(flight_key, call)
+        if not call.task.cancelled():
+            call.task.exception()  # marks the exception as retrieved when nobody was waiting any more
+
+    def stats(self):
+        """Returns how many calls were executed and how many shared an in-flight call"""
+        return {"executed": self.executed, "shared": self.shared}
+
+def payload_key(payload):
+    """Hashes a JSON request body (a dict or already encoded bytes) so identical TollGuru requests share one key"""
+    if not isinstance(payload, bytes):
+        payload = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+# Shared instances, one per API
+geocode_flight = SingleFlight()
+route_flight = SingleFlight()
+tollguru_flight = SingleFlight()
@@ -0,0 +1,220 @@
+# Importing modules
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# Cache configuration
+# Lives next to the geocode cache, so Here_Maps.py and the Testing scripts share it
+TOLL_CACHE_PATH = os.environ.get("TOLL_CACHE_PATH", str(Path(__file__).parent / ".cache" / "tollguru.sqlite"))
+TOLL_CACHE_TTL = int(os.environ.get("TOLL_CACHE_TTL", 24 * 60 * 60))  # seconds an entry is fresh
+# Seconds after the TTL during which a stale entry is returned while it is refreshed in the background
+TOLL_CACHE_STALE_WHILE_REVALIDATE = int(os.environ.get("TOLL_CACHE_STALE_WHILE_REVALIDATE", 24 * 60 * 60))
+# Seconds an entry is kept at all, older entries are only served when TollGuru fails
+TOLL_CACHE_MAX_STALE = int(os.environ.get("TOLL_CACHE_MAX_STALE", 7 * 24 * 60 * 60))
+# Departure times within the same bucket of the week (seconds) share one entry, time based tolls change
+TOLL_CACHE_TIME_BUCKET = int(os.environ.get("TOLL_CACHE_TIME_BUCKET", 15 * 60))
+TOLL_CACHE_SIZE = int(os.environ.get("TOLL_CACHE_SIZE", 100000))  # entries in the SQLite table
+TOLL_CACHE_MEMORY_SIZE = int(os.environ.get("TOLL_CACHE_MEMORY_SIZE", 10000))  # entries
+TOLL_CACHE_ENABLED = os.environ.get("TOLL_CACHE_ENABLED", "1") != "0"
+
+WEEK = 7 * 24 * 60 * 60
+
+# Entry states returned by TollCache.get
+FRESH = "fresh"
+STALE = "stale"
+EXPIRED = "expired"
+
+def departure_bucket(departure_epoch, bucket=TOLL_CACHE_TIME_BUCKET):
+    """
+    Buckets a departure time by its position in the week (UTC)
+
+    Toll schedules repeat weekly, so Monday 8:00 this week and next week share one entry. Without a
+    departure time (no locTimes) TollGuru prices the current time, so the current time is used.
+    """
+    if departure_epoch is None:
+        departure_epoch = time.time()
+    return int(departure_epoch % WEEK) // max(bucket, 1)
+
+def absolute_bucket(departure_epoch, bucket=TOLL_CACHE_TIME_BUCKET):
+    """Buckets a departure time by its absolute position in time, departures in different weeks never share one"""
+    return int(departure_epoch) // max(bucket, 1)
+
+def toll_cache_key(
+    polyline, vehicle_type, request_parameters=None, departure_epoch=None, bucket=TOLL_CACHE_TIME_BUCKET,
+    absolute=False,
+):
+    """
+    Builds a content hash from the polyline, the vehicle type, the extra request parameters and the departure bucket
+
+    With `absolute` the departure is bucketed by absolute_bucket instead of its time of week, for callers
+    that rate explicit future departures and must not be served another week's costs.
+    """
+    parameters = json.dumps(request_parameters or {}, sort_keys=True, separators=(",", ":"))
+    polyline_hash = hashlib.sha256(polyline.encode()).hexdigest()
+    if absolute and departure_epoch is not None:
+        time_key = f"@{absolute_bucket(departure_epoch, bucket)}"
+    else:
+        time_key = departure_bucket(departure_epoch, bucket)
+    key = f"{polyline_hash}|{vehicle_type}|{parameters}|{time_key}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+class TollCache:
+    """
+    Two tier cache of TollGuru costs: an in-memory LRU in front of a SQLite table
+
+    Entries are fresh for `ttl` seconds, then stale for `stale_while_revalidate` seconds (served while
+    a refresh runs in the background), then expired until `max_stale` (served only when TollGuru fails).
+
+    Args:
+        path: SQLite file path, or None to keep the cache in memory only
+        ttl: Seconds an entry is fresh
+        stale_while_revalidate: Seconds after the TTL during which a stale entry is served
+        max_stale: Seconds after which an entry is deleted
+        max_size: Maximum number of entries in the SQLite table, the oldest are deleted first
+        memory_size: Maximum number of entries held in the in-memory LRU tier
+
+    Keys are built with toll_cache_key.
+    """
+
+    def __init__(
+        self, path=TOLL_CACHE_PATH, ttl=TOLL_CACHE_TTL, stale_while_revalidate=TOLL_CACHE_STALE_WHILE_REVALIDATE,
+        max_stale=TOLL_CACHE_MAX_STALE, max_size=TOLL_CACHE_SIZE, memory_size=TOLL_CACHE_MEMORY_SIZE,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.max_stale = max(max_stale, ttl + stale_while_revalidate)
+        self.max_size = max_size
+        self.memory_size = memory_size
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.error_fallbacks = 0
+        self._memory = OrderedDict()
+        self._refreshing = set()
+        self._inserts = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connection(self):
+        """Opens the SQLite file on first use, so creating the shared instance at import costs nothing"""
+        # Must be called with self._lock held
+        if self._db is None and self.path:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS tolls (key TEXT PRIMARY KEY, costs TEXT, created_at REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS tolls_created_at ON tolls (created_at)")
+            self._db.commit()
+        return self._db
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _state(self, created_at):
+        age = time.time() - created_at
+        if age <= self.ttl:
+            return FRESH
+        if age <= self.ttl + self.stale_while_revalidate:
+            return STALE
+        if age <= self.max_stale:
+            return EXPIRED
+        return None
+
+    def get(self, key):
+        """
+        Looks the key up in both tiers
+
+        Returns:
+            (costs, FRESH/STALE/EXPIRED), or None if there is no entry younger than max_stale
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            db = self._connection() if entry is None else None
+            if db is not None:
+                row = db.execute("SELECT costs, created_at FROM tolls WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+                    self._remember(key, entry)
+
+            state = self._state(entry[1]) if entry is not None else None
+            if state == FRESH:
+                self.hits += 1
+            elif state == STALE:
+                self.stale_hits += 1
+            else:
+                self.misses += 1
+            if state is None:
+                return None
+
+            self._memory.move_to_end(key)
+            return entry[0], state
+
+    def set(self, key, costs):
+        """Stores the costs in both tiers and deletes the oldest entries above max_size"""
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, (costs, created_at))
+            db = self._connection()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO tolls (key, costs, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(costs), created_at),
+                )
+                # Counting the table on every insert would be slow, the size limit is enforced every 100 inserts
+                self._inserts += 1
+                if self._inserts % 100 == 0:
+                    self._evict(db)
+                db.commit()
+
+    def _evict(self, db):
+        db.execute("DELETE FROM tolls WHERE created_at < ?", (time.time() - self.max_stale,))
+        db.execute(
+            "DELETE FROM tolls WHERE key IN (SELECT key FROM tolls ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+
+    def start_refresh(self, key):
+        """Claims the background refresh of a stale key, False if one is already running"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def finish_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def record_error_fallback(self):
+        """Counts a response served from the cache because TollGuru failed"""
+        with self._lock:
+            self.error_fallbacks += 1
+
+    def stats(self):
+        """Returns hit/miss counters and the hit rate (stale hits count as hits)"""
+        total = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "error_fallbacks": self.error_fallbacks,
+            "hit_rate": (self.hits + self.stale_hits) / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+# Shared cache instance used by get_rates_from_tollguru (None when caching is disabled)
+toll_cache = TollCache() if TOLL_CACHE_ENABLED else None
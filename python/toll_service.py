@@ -0,0 +1,413 @@
+# Importing modules
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError, as_completed, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import circuit_breaker
+import cpu_pool
+import hedging
+import http_client
+import instrumentation
+from Here_Maps import (
+    DEFAULT_VEHICLE_TYPE,
+    HERE_ROUTE_ALTERNATIVES,
+    get_geocodes_for_addresses,
+    get_rates_from_tollguru,
+    get_routes_from_here_maps,
+    rate_routes,
+    wait_for_refreshes,
+)
+from geocode_cache import geocode_cache, normalize_address
+from instrumentation import annotate, stage
+from route_cache import route_cache
+from route_helpers import TOLLGURU_TYPE_TO_CATEGORY, get_transport_mode
+from single_flight import geocode_flight, route_flight, tollguru_flight
+from simplify import POLYLINE_SIMPLIFY_TOLERANCE, simplify_route
+from toll_cache import toll_cache
+
+# Service configuration
+SERVICE_HOST = os.environ.get("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("SERVICE_PORT", 8080))
+# Lanes arriving within this window (milliseconds) after the first one are processed as one batch
+SERVICE_BATCH_WINDOW_MS = float(os.environ.get("SERVICE_BATCH_WINDOW_MS", 20))
+SERVICE_MAX_BATCH = int(os.environ.get("SERVICE_MAX_BATCH", 100))  # lanes per batch
+# Lanes accepted but not finished; above this new lanes are rejected with 503 and Retry-After
+SERVICE_MAX_PENDING = int(os.environ.get("SERVICE_MAX_PENDING", 1000))
+SERVICE_BATCH_CONCURRENCY = int(os.environ.get("SERVICE_BATCH_CONCURRENCY", 4))  # batches processed at the same time
+SERVICE_WORKERS = int(os.environ.get("SERVICE_WORKERS", 32))  # concurrent HERE and TollGuru requests
+SERVICE_REQUEST_TIMEOUT = float(os.environ.get("SERVICE_REQUEST_TIMEOUT", 120))  # seconds a request waits for its lanes
+
+# HERE returns at most 6 alternative routes
+MAX_ALTERNATIVES = 6
+
+class Overloaded(Exception):
+    """Raised by LaneBatcher.submit when SERVICE_MAX_PENDING lanes are already pending"""
+
+class _Lane:
+    __slots__ = ("source", "destination", "vehicle_type", "alternatives", "future", "enqueued")
+
+    def __init__(self, source, destination, vehicle_type, alternatives):
+        self.source = source
+        self.destination = destination
+        self.vehicle_type = vehicle_type
+        self.alternatives = alternatives
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+    def route_key(self):
+        """Lanes with the same key share one HERE route"""
+        return (
+            normalize_address(self.source), normalize_address(self.destination),
+            get_transport_mode(self.vehicle_type), self.alternatives,
+        )
+
+class LaneBatcher:
+    """
+    Collects lane requests into micro-batches and runs geocode -> route -> toll once per distinct step
+
+    A batch starts with the first queued lane and closes after `window` seconds or `max_batch` lanes.
+    Within a batch every distinct address is geocoded once, every distinct origin/destination/transport
+    mode is routed once and every distinct route/vehicle type is rated once. Across batches the caches
+    and single_flight share the work.
+
+    Args:
+        window: Seconds a batch stays open after its first lane
+        max_batch: Maximum lanes per batch
+        max_pending: Maximum lanes queued or in progress, submit raises Overloaded above it
+        batch_concurrency: Batches processed at the same time
+        workers: Concurrent HERE and TollGuru requests
+    """
+
+    def __init__(
+        self, window=SERVICE_BATCH_WINDOW_MS / 1000, max_batch=SERVICE_MAX_BATCH, max_pending=SERVICE_MAX_PENDING,
+        batch_concurrency=SERVICE_BATCH_CONCURRENCY, workers=SERVICE_WORKERS,
+    ):
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._batches = ThreadPoolExecutor(max_workers=batch_concurrency, thread_name_prefix="batch")
+        self._work = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lane")
+        self._stopping = False
+        self.metrics = {
+            "accepted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+            "batches": 0,
+            "batched_lanes": 0,
+            "max_batch_size": 0,
+            "max_queue_depth": 0,
+            "max_pending": 0,
+            "queue_wait_seconds": 0.0,
+            "shared_geocodes": 0,
+            "shared_routes": 0,
+            "shared_ratings": 0,
+        }
+        self._thread = threading.Thread(target=self._collect, name="batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, source, destination, vehicle_type=DEFAULT_VEHICLE_TYPE, alternatives=HERE_ROUTE_ALTERNATIVES):
+        """Queues one lane, returns a Future of its result dict (polyline, rates, routes with alternatives)"""
+        lane = _Lane(source, destination, vehicle_type, alternatives)
+        with self._lock:
+            if self._stopping or self._pending >= self.max_pending:
+                self.metrics["rejected"] += 1
+                raise Overloaded(f"{self._pending} lanes pending, try again later")
+            self._pending += 1
+            self.metrics["accepted"] += 1
+            self.metrics["max_pending"] = max(self.metrics["max_pending"], self._pending)
+            self._queue.put(lane)
+            self.metrics["max_queue_depth"] = max(self.metrics["max_queue_depth"], self._queue.qsize())
+        lane.future.add_done_callback(self._finished)
+        return lane.future
+
+    def _finished(self, future):
+        with self._lock:
+            self._pending -= 1
+            self.metrics["completed" if future.exception() is None else "failed"] += 1
+
+    def stats(self):
+        """Returns the counters plus the current queue depth and pending lanes"""
+        with self._lock:
+            batches = self.metrics["batches"]
+            return {
+                **self.metrics,
+                "queue_depth": self._queue.qsize(),
+                "pending": self._pending,
+                "mean_batch_size": self.metrics["batched_lanes"] / batches if batches else 0.0,
+            }
+
+    def close(self):
+        """Stops accepting lanes and waits for the queued ones to finish"""
+        with self._lock:
+            self._stopping = True
+        self._queue.put(None)
+        self._thread.join()
+        self._batches.shutdown()
+        self._work.shutdown()
+
+    def _collect(self):
+        """Batcher thread: waits for a lane, then gathers more until the window closes or the batch is full"""
+        while True:
+            lane = self._queue.get()
+            if lane is None:
+                return
+            batch = [lane]
+            deadline = time.perf_counter() + self.window
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    lane = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if lane is None:
+                    stop = True
+                    break
+                batch.append(lane)
+
+            now = time.perf_counter()
+            with self._lock:
+                self.metrics["batches"] += 1
+                self.metrics["batched_lanes"] += len(batch)
+                self.metrics["max_batch_size"] = max(self.metrics["max_batch_size"], len(batch))
+                self.metrics["queue_wait_seconds"] += sum(now - lane.enqueued for lane in batch)
+            self._batches.submit(self._run_batch, batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch):
+        try:
+            with stage("batch", lanes=len(batch)):
+                self._process(batch)
+        except Exception as e:
+            for lane in batch:
+                if not lane.future.done():
+                    lane.future.set_exception(e)
+
+    def _process(self, batch):
+        # Keyed like the geocode cache, so addresses that only differ in case or spacing count as shared
+        addresses = {normalize_address(address) for lane in batch for address in (lane.source, lane.destination)}
+        positions, geocode_errors = get_geocodes_for_addresses(addresses, executor=self._work)
+
+        # One route per distinct origin/destination/transport mode/alternatives
+        route_lanes = {}
+        for lane in batch:
+            route_lanes.setdefault(lane.route_key(), []).append(lane)
+
+        def route(key, vehicle_type):
+            source, destination, _, alternatives = key
+            for address in (source, destination):
+                if address in geocode_errors:
+                    raise Exception(geocode_errors[address])
+            routes, _ = get_routes_from_here_maps(*positions[source], *positions[destination], vehicle_type, alternatives)
+            if POLYLINE_SIMPLIFY_TOLERANCE > 0:
+                for item in routes:
+                    item["polyline"], item["loc_times"], _ = simplify_route(item["polyline"], item["loc_times"])
+            return routes
+
+        def rate(routes, vehicle_type):
+            if len(routes) == 1:
+                rates = get_rates_from_tollguru(routes[0]["polyline"], routes[0]["loc_times"], vehicle_type)
+                return {"polyline": routes[0]["polyline"], "rates": rates}
+            ranked_routes = rate_routes(routes, vehicle_type)
+            if "costs" not in ranked_routes[0]:
+                raise Exception(f"None of the routes could be rated: {ranked_routes[0]['error']}")
+            return {"polyline": ranked_routes[0]["polyline"], "rates": ranked_routes[0]["costs"], "routes": ranked_routes}
+
+        def resolve(lanes, future):
+            # Runs as soon as the rating is done, a slow lane does not hold up the others
+            try:
+                result = future.result()
+            except Exception as e:
+                for lane in lanes:
+                    lane.future.set_exception(e)
+                return
+            for lane in lanes:
+                lane.future.set_result(
+                    {"source": lane.source, "destination": lane.destination, "vehicle_type": lane.vehicle_type, **result}
+                )
+
+        route_futures = {
+            self._work.submit(route, key, lanes[0].vehicle_type): key for key, lanes in route_lanes.items()
+        }
+        rate_futures = {}
+        for future in as_completed(route_futures):
+            key = route_futures[future]
+            try:
+                routes = future.result()
+            except Exception as e:
+                for lane in route_lanes[key]:
+                    lane.future.set_exception(e)
+                continue
+            # One TollGuru request per distinct route and vehicle type
+            rate_lanes = {}
+            for lane in route_lanes[key]:
+                rate_lanes.setdefault(lane.vehicle_type, []).append(lane)
+            for vehicle_type, lanes in rate_lanes.items():
+                rate_future = rate_futures[(key, vehicle_type)] = self._work.submit(rate, routes, vehicle_type)
+                rate_future.add_done_callback(lambda done, lanes=lanes: resolve(lanes, done))
+        wait(rate_futures.values())
+
+        annotate(addresses=len(addresses), routes=len(route_futures), ratings=len(rate_futures))
+        with self._lock:
+            self.metrics["shared_geocodes"] += 2 * len(batch) - len(addresses)
+            self.metrics["shared_routes"] += len(batch) - len(route_futures)
+            self.metrics["shared_ratings"] += len(batch) - len(rate_futures)
+
+def lane_from_json(body):
+    """Validates one lane object of a request body, returns submit() arguments"""
+    if not isinstance(body, dict) or not body.get("source") or not body.get("destination"):
+        raise ValueError("A lane needs a source and a destination")
+    if not isinstance(body["source"], str) or not isinstance(body["destination"], str):
+        raise ValueError("source and destination must be strings")
+    vehicle_type = body.get("vehicle_type") or DEFAULT_VEHICLE_TYPE
+    if not isinstance(vehicle_type, str) or vehicle_type not in TOLLGURU_TYPE_TO_CATEGORY:
+        raise ValueError(f"Unknown vehicle_type {vehicle_type!r}")
+    alternatives = body.get("alternatives", HERE_ROUTE_ALTERNATIVES)
+    if isinstance(alternatives, bool) or not isinstance(alternatives, int) or not 0 <= alternatives <= MAX_ALTERNATIVES:
+        raise ValueError(f"alternatives must be an integer from 0 to {MAX_ALTERNATIVES}")
+    return body["source"], body["destination"], vehicle_type, alternatives
+
+def service_metrics(batcher):
+    """Batcher, cache, single-flight, circuit breaker, hedging and per-stage metrics served at GET /metrics"""
+    return {
+        "batcher": batcher.stats(),
+        "caches": {
+            name: cache.stats()
+            for name, cache in (("geocode", geocode_cache), ("route", route_cache), ("tollguru", toll_cache))
+            if cache is not None
+        },
+        "single_flight": {
+            "geocode": geocode_flight.stats(),
+            "route": route_flight.stats(),
+            "tollguru": tollguru_flight.stats(),
+        },
+        "circuit_breakers": {endpoint: breaker.stats() for endpoint, breaker in circuit_breaker.breakers.items()},
+        "hedging": {endpoint: hedger.stats() for endpoint, hedger in hedging.hedgers.items()},
+        "stages": instrumentation.summary(),
+    }
+
+class TollServiceHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API of the toll service
+
+    POST /toll   {"source", "destination", "vehicle_type"?, "alternatives"?} -> lane result
+    POST /tolls  {"lanes": [lane, ...]} -> {"results": [...]}, a failed lane is {"error": message}
+    GET /metrics -> service_metrics()
+    GET /health  -> {"status": "ok"}
+    """
+
+    batcher = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self.send_json(200, service_metrics(self.batcher))
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ("/toll", "/tolls"):
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path == "/toll":
+                lanes = [lane_from_json(body)]
+            elif isinstance(body, dict) and isinstance(body.get("lanes"), list):
+                lanes = [lane_from_json(lane) for lane in body["lanes"]]
+            else:
+                raise ValueError("Expected {\"lanes\": [...]}")
+        except (TypeError, ValueError, KeyError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        futures = []
+        try:
+            for lane in lanes:
+                futures.append(self.batcher.submit(*lane))
+        except Overloaded as e:
+            # Lanes already queued for this request still run and fill the caches
+            self.send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+            return
+
+        deadline = time.monotonic() + SERVICE_REQUEST_TIMEOUT
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(timeout=max(deadline - time.monotonic(), 0)))
+            except TimeoutError:
+                results.append({"error": f"Timed out after {SERVICE_REQUEST_TIMEOUT:.0f}s"})
+            except Exception as e:
+                results.append({"error": str(e)})
+
+        if self.path == "/tolls":
+            self.send_json(200, {"results": results})
+        elif "error" in results[0]:
+            self.send_json(504 if results[0]["error"].startswith("Timed out") else 502, results[0])
+        else:
+            self.send_json(200, results[0])
+
+def create_server(host=SERVICE_HOST, port=SERVICE_PORT, batcher=None):
+    """Creates the HTTP server and its LaneBatcher, call serve_forever() on the result"""
+    handler = type("Handler", (TollServiceHandler,), {"batcher": batcher or LaneBatcher()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.batcher = handler.batcher
+    return server
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve toll calculations over HTTP with micro-batching")
+    parser.add_argument("--host", default=SERVICE_HOST, help=f"Address to listen on (default: {SERVICE_HOST})")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help=f"Port to listen on (default: {SERVICE_PORT})")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = create_server(args.host, args.port)
+    print(f"Toll service listening on http://{args.host}:{server.server_address[1]}")
+    print(
+        f"Batch window: {SERVICE_BATCH_WINDOW_MS:.0f} ms | Max batch: {SERVICE_MAX_BATCH} | "
+        f"Max pending: {SERVICE_MAX_PENDING} | Workers: {SERVICE_WORKERS}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+        wait_for_refreshes()
+        http_client.close_sessions()
+        hedging.shutdown()
+        cpu_pool.shutdown()
+
+if __name__ == "__main__":
+    main()